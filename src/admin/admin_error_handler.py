@@ -6,13 +6,30 @@ import logging
 import json
 import traceback
 from datetime import datetime
-from typing import Dict, Any, Optional
+from typing import Dict, Any, List, Optional
 from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup
 from telegram.ext import ContextTypes
 import os
 import tempfile
 import zipfile
 
+# Per-admin plan upload state keys (old and new upload workflows)
+PLAN_UPLOAD_STATES = frozenset({
+    'uploading_plan',
+    'uploading_user_plan',
+    'plan_course_type',
+    'plan_course_code',
+    'plan_user_id',
+    'plan_upload_step',
+    'plan_title',
+    'plan_content',
+    'plan_content_type',
+    'plan_filename',
+    'plan_description',
+    'plan_local_path',
+    'plan_file_size'
+})
+
 class AdminErrorHandler:
     """Comprehensive error handling and logging for admin operations"""
     
@@ -118,6 +135,10 @@ class AdminErrorHandler:
 
     async def save_admin_log(self, log_entry: Dict[str, Any]):
         """Save admin log entry to file with enhanced error recovery"""
+        await self.save_admin_logs([log_entry])
+
+    async def save_admin_logs(self, log_entries: List[Dict[str, Any]]):
+        """Append a batch of admin log entries with a single read/rewrite of the audit file"""
         try:
             log_file = 'logs/admin_audit.json'
             
@@ -145,8 +166,8 @@ class AdminErrorHandler:
                     self.admin_logger.error(f"Error reading admin log file: {read_error}")
                     logs = []
             
-            # Add new log entry
-            logs.append(log_entry)
+            # Add new log entries
+            logs.extend(log_entries)
             
             # Keep only last 1000 entries to prevent file from growing too large
             if len(logs) > 1000:
@@ -483,6 +504,12 @@ class AdminErrorHandler:
     async def log_plan_upload_workflow(self, admin_id: int, step: str, plan_data: dict = None, 
                                      success: bool = None, error_message: str = None):
         """Enhanced logging for plan upload workflow"""
+        workflow_entry = self.plan_upload_workflow_entry(admin_id, step, plan_data, success, error_message)
+        await self.save_admin_log(workflow_entry)
+
+    def plan_upload_workflow_entry(self, admin_id: int, step: str, plan_data: dict = None,
+                                   success: bool = None, error_message: str = None) -> Dict[str, Any]:
+        """Write the plan workflow log line and return the audit entry (caller persists it)"""
         workflow_entry = {
             'timestamp': datetime.now().isoformat(),
             'admin_id': admin_id,
@@ -501,7 +528,7 @@ class AdminErrorHandler:
         else:
             self.admin_logger.info(f"PLAN WORKFLOW STEP - Admin {admin_id} | Step: {step}")
         
-        await self.save_admin_log(workflow_entry)
+        return workflow_entry
 
     async def log_navigation_action(self, admin_id: int, current_menu: str, action: str, 
                                   destination: str = None, context_data: dict = None):
@@ -822,27 +849,12 @@ class AdminErrorHandler:
         """
         states_cleared = []
         
-        if user_id in context.user_data:
-            upload_states = [
-                'uploading_plan',
-                'uploading_user_plan', 
-                'plan_course_type',
-                'plan_course_code',
-                'plan_user_id',
-                'plan_upload_step',
-                'plan_title',
-                'plan_content',
-                'plan_content_type',
-                'plan_filename',
-                'plan_description',
-                'plan_local_path',
-                'plan_file_size'
-            ]
-            
-            for state in upload_states:
-                if state in context.user_data[user_id]:
-                    context.user_data[user_id].pop(state, None)
-                    states_cleared.append(state)
+        user_states = context.user_data.get(user_id)
+        if user_states:
+            # Only the upload keys actually present, found with one set intersection
+            states_cleared = list(PLAN_UPLOAD_STATES & user_states.keys())
+            for state in states_cleared:
+                del user_states[state]
         
         if states_cleared:
             self.admin_logger.info(
@@ -852,9 +864,16 @@ class AdminErrorHandler:
         
         return states_cleared
 
+    def questionnaire_flow_debug_enabled(self) -> bool:
+        """Whether questionnaire flow debug records are kept (DEBUG log level)"""
+        return self.admin_logger.isEnabledFor(logging.DEBUG)
+
     async def log_questionnaire_flow_debug(self, user_id: int, context: str, questionnaire_data: dict, 
                                           flow_decision: str, details: dict = None):
         """Log questionnaire flow decisions for debugging edge cases"""
+        if not self.questionnaire_flow_debug_enabled():
+            return None
+        
         flow_entry = {
             'timestamp': datetime.now().isoformat(),
             'user_id': user_id,
@@ -7,6 +7,10 @@ from datetime import datetime
 class AdminManager:
     def __init__(self, admins_file='admins.json'):
         self.admins_file = admins_file
+        # Integer admin IDs, reused until the admins file changes (mtime + size)
+        self._admin_ids_stamp = None
+        self._admin_ids = ()
+        self._admin_ids_set = frozenset()
         self.ensure_admins_file()
     
     def ensure_admins_file(self):
@@ -27,6 +31,7 @@ class AdminManager:
                 }
                 
                 # Add permissions for all admins - all are super admins
+                now_iso = datetime.now().isoformat()
                 for admin_id in initial_admins:
                     initial_data['admin_permissions'][str(admin_id)] = {
                         'can_add_admins': True,  # All ADMIN_IDS are super admins
@@ -35,7 +40,7 @@ class AdminManager:
                         'can_manage_payments': True,
                         'is_super_admin': True,  # All ADMIN_IDS are super admins
                         'added_by': 'system',
-                        'added_date': datetime.now().isoformat()
+                        'added_date': now_iso
                     }
             else:
                 initial_data = {
@@ -90,15 +95,30 @@ class AdminManager:
             print(f"Error saving admins: {e}")
             return False
     
+    async def _load_admin_ids(self):
+        """Refresh the cached integer admin IDs if the admins file changed"""
+        try:
+            stat = os.stat(self.admins_file)
+            stamp = (stat.st_mtime_ns, stat.st_size)
+        except OSError:
+            stamp = None
+        
+        if stamp is None or stamp != self._admin_ids_stamp:
+            admins_data = await self.load_admins()
+            # Admin IDs are stored as both strings and integers - normalize once here
+            admin_ids = []
+            for admin_id in admins_data.get('admins', []):
+                if str(admin_id).lstrip('-').isdigit() and int(admin_id) not in admin_ids:
+                    admin_ids.append(int(admin_id))
+            self._admin_ids = tuple(admin_ids)
+            self._admin_ids_set = frozenset(admin_ids)
+            # Don't pin an empty result - it may come from a read that raced a write
+            self._admin_ids_stamp = stamp if admins_data else None
+    
     async def is_admin(self, user_id: int) -> bool:
         """Check if user is admin"""
-        admins_data = await self.load_admins()
-        admins_list = admins_data.get('admins', [])
-        
-        # Check both string and integer versions for compatibility
-        result = user_id in admins_list or str(user_id) in admins_list
-        
-        return result
+        await self._load_admin_ids()
+        return int(user_id) in self._admin_ids_set
     
     async def is_super_admin(self, user_id: int) -> bool:
         """Check if user is super admin"""
@@ -176,10 +196,8 @@ class AdminManager:
     async def get_all_admin_ids(self) -> List[int]:
         """Get list of all admin IDs"""
         try:
-            admins_data = await self.load_admins()
-            admin_list = admins_data.get('admins', [])
-            # Convert to integers and handle both string and int formats
-            return [int(admin_id) for admin_id in admin_list]
+            await self._load_admin_ids()
+            return list(self._admin_ids)
         except Exception as e:
             print(f"Error getting admin IDs: {e}")
             return []
@@ -312,6 +330,7 @@ class AdminManager:
             # Add each admin from config - ALL are super admins
             synced_count = 0
             updated_count = 0
+            now_iso = datetime.now().isoformat()
             
             for admin_id in admin_ids:
                 if admin_id not in admins_data['admins']:
@@ -338,8 +357,8 @@ class AdminManager:
                         'can_manage_payments': True,
                         'is_super_admin': True,  # All ADMIN_IDS are super admins
                         'added_by': 'config_sync',
-                        'added_date': existing_permissions.get('added_date', datetime.now().isoformat()),
-                        'updated_date': datetime.now().isoformat(),
+                        'added_date': existing_permissions.get('added_date', now_iso),
+                        'updated_date': now_iso,
                         'synced_from_config': True
                     }
                     if not current_is_super:
@@ -408,6 +427,8 @@ class AdminManager:
             added_count = 0
             removed_count = 0
             
+            now_iso = datetime.now().isoformat()
+            
             # Add missing admins from config
             for admin_id in config_admin_ids:
                 if str(admin_id) not in admins_data.get('admins', []):
@@ -426,7 +447,7 @@ class AdminManager:
                         'can_view_users': True,
                         'can_manage_payments': True,
                         'added_by': 'config_sync',
-                        'added_date': datetime.now().isoformat(),
+                        'added_date': now_iso,
                         'synced_from_config': True
                     }
                     added_count += 1
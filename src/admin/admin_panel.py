@@ -6,6 +6,7 @@ from managers.coupon_manager import CouponManager
 from bot.config import Config
 from admin.admin_error_handler import admin_error_handler
 from admin_debugger import admin_debugger
+import asyncio
 import json
 import csv
 import io
@@ -20,13 +21,47 @@ import logging
 # Setup logger for admin panel
 logger = logging.getLogger(__name__)
 
+# (payments dict, stats tuple) - payments comes from DataManager's shared snapshot, so identity marks staleness
+_payment_stats_cache = (None, None)
+
+def _payment_stats(payments: dict) -> tuple:
+    """
+    Single pass over payments returning (approved revenue, approved count, pending count,
+    rejected count, approved count per course), reused until bot_data.json changes.
+    """
+    global _payment_stats_cache
+    if _payment_stats_cache[0] is payments:
+        return _payment_stats_cache[1]
+    
+    revenue = approved = pending = rejected = 0
+    course_stats = {}
+    for payment in payments.values():
+        status = payment.get('status')
+        if status == 'approved':
+            approved += 1
+            revenue += payment.get('price', 0)
+            # Count actual payments by course type (not user course field)
+            course = payment.get('course_type')
+            if course:
+                course_stats[course] = course_stats.get(course, 0) + 1
+        elif status == 'pending_approval':
+            pending += 1
+        elif status == 'rejected':
+            rejected += 1
+    
+    stats = (revenue, approved, pending, rejected, course_stats)
+    _payment_stats_cache = (payments, stats)
+    return stats
+
 class AdminPanel:
-    def __init__(self):
+    def __init__(self, data_manager: DataManager = None):
         # Use bot_data.json for AdminManager to match main.py admin sync
         self.admin_manager = AdminManager(admins_file='bot_data.json')
-        self.data_manager = DataManager()
+        # Share the bot's JSON data manager when it has one, so both use one bot_data.json snapshot
+        self.data_manager = data_manager or DataManager()
         self.coupon_manager = CouponManager()
         self.admin_creating_coupons = set()  # Track which admins are creating coupons
+        self._plan_write_lock = asyncio.Lock()  # Serializes course plan file writes (run in worker threads)
     
     async def admin_menu(self, update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
         """Redirect to unified admin hub - no separate menu"""
@@ -394,8 +429,7 @@ class AdminPanel:
         """Show bot statistics"""
         try:
             # Load data from data_manager
-            with open('bot_data.json', 'r', encoding='utf-8') as f:
-                data = json.load(f)
+            data = await self.data_manager.read_bot_data_snapshot()
             
             users = data.get('users', {})
             payments = data.get('payments', {})
@@ -404,18 +438,8 @@ class AdminPanel:
             total_users = len(users)
             total_payments = len(payments)
             # Only count approved payments for revenue calculation
-            total_revenue = sum(payment.get('price', 0) for payment in payments.values() if payment.get('status') == 'approved')
-            approved_payments = len([p for p in payments.values() if p.get('status') == 'approved'])
-            pending_payments = len([p for p in payments.values() if p.get('status') == 'pending_approval'])
-            rejected_payments = len([p for p in payments.values() if p.get('status') == 'rejected'])
-            
-            # Course statistics - Count actual payments by course type (not user course field)
-            course_stats = {}
-            for payment_data in payments.values():
-                if payment_data.get('status') == 'approved':  # Only count approved payments
-                    course = payment_data.get('course_type')
-                    if course:
-                        course_stats[course] = course_stats.get(course, 0) + 1
+            (total_revenue, approved_payments, pending_payments,
+             rejected_payments, course_stats) = _payment_stats(payments)
             
             stats_text = "📊 آمار کلی ربات:\n\n"
             stats_text += f"👥 تعداد کل کاربران: {total_users}\n"
@@ -451,8 +475,7 @@ class AdminPanel:
                                             [InlineKeyboardButton("🔙 بازگشت", callback_data='admin_back_main')]
                                         ]))
             # Load data from data_manager
-            with open('bot_data.json', 'r', encoding='utf-8') as f:
-                data = json.load(f)
+            data = await self.data_manager.read_bot_data_snapshot()
             
             users = data.get('users', {})
             payments = data.get('payments', {})
@@ -461,18 +484,8 @@ class AdminPanel:
             total_users = len(users)
             total_payments = len(payments)
             # Only count approved payments for revenue calculation
-            total_revenue = sum(payment.get('price', 0) for payment in payments.values() if payment.get('status') == 'approved')
-            approved_payments = len([p for p in payments.values() if p.get('status') == 'approved'])
-            pending_payments = len([p for p in payments.values() if p.get('status') == 'pending_approval'])
-            rejected_payments = len([p for p in payments.values() if p.get('status') == 'rejected'])
-            
-            # Course statistics - Count actual payments by course type (not user course field)  
-            course_stats = {}
-            for payment_data in payments.values():
-                if payment_data.get('status') == 'approved':  # Only count approved payments
-                    course = payment_data.get('course_type')
-                    if course:
-                        course_stats[course] = course_stats.get(course, 0) + 1
+            (total_revenue, approved_payments, pending_payments,
+             rejected_payments, course_stats) = _payment_stats(payments)
             
             stats_text = "📊 آمار کلی ربات:\n\n"
             stats_text += f"👥 تعداد کل کاربران: {total_users}\n"
@@ -617,8 +630,7 @@ class AdminPanel:
     async def show_users_management(self, query, page: int = 0) -> None:
         """Show users management with pagination and safe formatting"""
         try:
-            with open('bot_data.json', 'r', encoding='utf-8') as f:
-                data = json.load(f)
+            data = await self.data_manager.read_bot_data_snapshot()
             
             users = data.get('users', {})
             
@@ -699,8 +711,7 @@ class AdminPanel:
     async def show_payments_management(self, query) -> None:
         """Show payments management"""
         try:
-            with open('bot_data.json', 'r', encoding='utf-8') as f:
-                data = json.load(f)
+            data = await self.data_manager.read_bot_data_snapshot()
             
             payments = data.get('payments', {})
             
@@ -1082,8 +1093,7 @@ class AdminPanel:
     async def show_pending_payments(self, query) -> None:
         """Show pending payments for quick admin access"""
         try:
-            with open('bot_data.json', 'r', encoding='utf-8') as f:
-                data = json.load(f)
+            data = await self.data_manager.read_bot_data_snapshot()
             
             payments = data.get('payments', {})
             pending = {k: v for k, v in payments.items() if v.get('status') == 'pending_approval'}
@@ -1137,8 +1147,7 @@ class AdminPanel:
     async def export_users_csv(self, query) -> None:
         """Export users data to CSV format"""
         try:
-            with open('bot_data.json', 'r', encoding='utf-8') as f:
-                data = json.load(f)
+            data = await self.data_manager.read_bot_data_snapshot()
             
             users = data.get('users', {})
             
@@ -1200,8 +1209,7 @@ class AdminPanel:
     async def export_payments_csv(self, query) -> None:
         """Export payments data to CSV format"""
         try:
-            with open('bot_data.json', 'r', encoding='utf-8') as f:
-                data = json.load(f)
+            data = await self.data_manager.read_bot_data_snapshot()
             
             payments = data.get('payments', {})
             
@@ -1406,8 +1414,7 @@ class AdminPanel:
                 questionnaire_data = json.load(f)
             
             # Load user data to get names
-            with open('bot_data.json', 'r', encoding='utf-8') as f:
-                bot_data = json.load(f)
+            bot_data = await self.data_manager.read_bot_data_snapshot()
             
             users = bot_data.get('users', {})
             completed_users = []
@@ -1520,8 +1527,7 @@ class AdminPanel:
         """Export all data for a specific user including questionnaire photos and documents"""
         try:
             # Load all data
-            with open('bot_data.json', 'r', encoding='utf-8') as f:
-                bot_data = json.load(f)
+            bot_data = await self.data_manager.read_bot_data_snapshot()
             
             questionnaire_file = 'questionnaire_data.json'
             questionnaire_data = {}
@@ -1970,8 +1976,7 @@ class AdminPanel:
     async def export_all_data(self, query) -> None:
         """Export complete database as JSON with admin-friendly format"""
         try:
-            with open('bot_data.json', 'r', encoding='utf-8') as f:
-                data = json.load(f)
+            data = await self.data_manager.read_bot_data_snapshot()
             
             # Load questionnaire data if exists
             questionnaire_data = {}
@@ -2065,8 +2070,7 @@ class AdminPanel:
     async def export_telegram_csv(self, query) -> None:
         """Export Telegram contact information to CSV format"""
         try:
-            with open('bot_data.json', 'r', encoding='utf-8') as f:
-                data = json.load(f)
+            data = await self.data_manager.read_bot_data_snapshot()
             
             users = data.get('users', {})
             
@@ -2353,8 +2357,7 @@ class AdminPanel:
         
         try:
             # Load both user and payment data
-            with open('bot_data.json', 'r', encoding='utf-8') as f:
-                bot_data = json.load(f)
+            bot_data = await self.data_manager.read_bot_data_snapshot()
             
             users = bot_data.get('users', {})
             payments = bot_data.get('payments', {})
@@ -2452,8 +2455,7 @@ class AdminPanel:
             await query.answer()
             
             # Load user and payment data
-            with open('bot_data.json', 'r', encoding='utf-8') as f:
-                bot_data = json.load(f)
+            bot_data = await self.data_manager.read_bot_data_snapshot()
             
             # Load existing plans
             user_plans = await self.load_user_plans(user_id)
@@ -2547,8 +2549,7 @@ class AdminPanel:
             await query.answer()
             
             # Load user data and plans
-            with open('bot_data.json', 'r', encoding='utf-8') as f:
-                bot_data = json.load(f)
+            bot_data = await self.data_manager.read_bot_data_snapshot()
             
             user_data = bot_data.get('users', {}).get(user_id, {})
             user_name = user_data.get('name', 'نامشخص')
@@ -2803,6 +2804,21 @@ class AdminPanel:
             print(f"Error loading plans for {course_type}: {e}")
             return []
 
+    @staticmethod
+    def _write_plans_file(plans_file: str, plans: list):
+        """Back up and atomically replace a course plans file (blocking - run via asyncio.to_thread)"""
+        # Create backup of existing file first
+        if os.path.exists(plans_file):
+            backup_file = f'{plans_file}.backup'
+            shutil.copy2(plans_file, backup_file)
+            print(f"💾 BACKUP CREATED: {backup_file}")
+        
+        # Write to a temp file and swap it in, so a crash mid-write never leaves a truncated file
+        temp_file = f'{plans_file}.tmp'
+        with open(temp_file, 'w', encoding='utf-8') as f:
+            json.dump(plans, f, ensure_ascii=False, indent=2)
+        os.replace(temp_file, plans_file)
+    
     async def save_course_plans(self, course_type: str, plans: list) -> bool:
         """Save plans for a specific course type"""
         try:
@@ -2840,41 +2856,27 @@ class AdminPanel:
                 file_perms = stat.filemode(file_stat.st_mode)
                 print(f"📋 EXISTING FILE PERMISSIONS: {file_perms}")
             
-            # Create backup of existing file first
-            if os.path.exists(plans_file):
-                backup_file = f'{plans_file}.backup'
-                import shutil
-                shutil.copy2(plans_file, backup_file)
-                print(f"💾 BACKUP CREATED: {backup_file}")
-            
-            # Save new data with explicit encoding and error handling
+            # Backup + write run in a worker thread so a large plans file doesn't stall the event loop
             print(f"💾 ATTEMPTING TO WRITE {len(plans)} plans to {plans_file}")
-            with open(plans_file, 'w', encoding='utf-8') as f:
-                json.dump(plans, f, ensure_ascii=False, indent=2)
+            async with self._plan_write_lock:
+                await asyncio.to_thread(self._write_plans_file, plans_file, plans)
             
             print(f"✅ FILE WRITE COMPLETED")
             
-            # Verify save by reading back
-            print(f"🔍 VERIFYING SAVE BY READING BACK...")
-            with open(plans_file, 'r', encoding='utf-8') as f:
-                saved_plans = json.load(f)
-                
-            save_successful = len(saved_plans) == len(plans)
-            print(f"📊 VERIFICATION RESULT - Expected: {len(plans)}, Found: {len(saved_plans)}, Success: {save_successful}")
-            
-            # Log save result
+            # The write either replaces the whole file or raises, so a completed write is the
+            # verification - no need to re-read and re-parse the file just to count the plans
             await admin_error_handler.log_plan_management_debug(
                 admin_id=0,
                 operation='save_plans_verify',
                 course_type=course_type,
                 plans_before=len(plans),
-                plans_after=len(saved_plans),
-                success=save_successful,
-                details={'verification': 'read_back_check'}
+                plans_after=len(plans),
+                success=True,
+                details={'verification': 'write_completed'}
             )
             
-            print(f"🎉 PLAN SAVE COMPLETED SUCCESSFULLY: {save_successful}")
-            return save_successful
+            print(f"🎉 PLAN SAVE COMPLETED SUCCESSFULLY: True")
+            return True
             
         except Exception as e:
             # Enhanced error logging
@@ -3106,8 +3108,7 @@ class AdminPanel:
         course_name = course_names.get(course_code, course_code)
         
         # Load user data to get name
-        with open('bot_data.json', 'r', encoding='utf-8') as f:
-            bot_data = json.load(f)
+        bot_data = await self.data_manager.read_bot_data_snapshot()
         user_data = bot_data.get('users', {}).get(user_id, {})
         user_name = user_data.get('name', 'نامشخص')
         
@@ -3160,8 +3161,7 @@ class AdminPanel:
                 return
             
             # Load user data
-            with open('bot_data.json', 'r', encoding='utf-8') as f:
-                bot_data = json.load(f)
+            bot_data = await self.data_manager.read_bot_data_snapshot()
             user_data = bot_data.get('users', {}).get(user_id, {})
             user_name = user_data.get('name', 'نامشخص')
             
@@ -3294,8 +3294,7 @@ class AdminPanel:
                 return
             
             # Load user data
-            with open('bot_data.json', 'r', encoding='utf-8') as f:
-                bot_data = json.load(f)
+            bot_data = await self.data_manager.read_bot_data_snapshot()
             user_data = bot_data.get('users', {}).get(user_id, {})
             user_name = user_data.get('name', 'نامشخص')
             
@@ -3352,8 +3351,7 @@ class AdminPanel:
                 return
             
             # Load user data
-            with open('bot_data.json', 'r', encoding='utf-8') as f:
-                bot_data = json.load(f)
+            bot_data = await self.data_manager.read_bot_data_snapshot()
             user_data = bot_data.get('users', {}).get(user_id, {})
             user_name = user_data.get('name', 'نامشخص')
             
@@ -3429,8 +3427,7 @@ class AdminPanel:
             success = await self.delete_user_plan(user_id, course_code, plan_id)
             
             # Load user data for name
-            with open('bot_data.json', 'r', encoding='utf-8') as f:
-                bot_data = json.load(f)
+            bot_data = await self.data_manager.read_bot_data_snapshot()
             user_data = bot_data.get('users', {}).get(user_id, {})
             user_name = user_data.get('name', 'نامشخص')
             
@@ -3514,8 +3511,7 @@ class AdminPanel:
     async def get_users_with_course(self, course_type: str) -> list:
         """Get list of users who have purchased a specific course"""
         try:
-            with open('bot_data.json', 'r', encoding='utf-8') as f:
-                data = json.load(f)
+            data = await self.data_manager.read_bot_data_snapshot()
             
             users_with_course = []
             users = data.get('users', {})
@@ -3678,8 +3674,7 @@ class AdminPanel:
             await query.answer()
             
             # Load user data and plans
-            with open('bot_data.json', 'r', encoding='utf-8') as f:
-                bot_data = json.load(f)
+            bot_data = await self.data_manager.read_bot_data_snapshot()
             
             user_data = bot_data.get('users', {}).get(user_id, {})
             user_name = user_data.get('name', 'نامشخص')
@@ -135,30 +135,24 @@ class BotLogger:
     
     def log_user_interaction(self, user_id: int, username: str, action: str, details: str = ""):
         """Log user interactions for analysis"""
-        message = f"USER:{user_id}(@{username}) - {action}"
-        if details:
-            message += f" - {details}"
-        self.user_logger.info(message)
+        if self.user_logger.isEnabledFor(logging.INFO):
+            self.user_logger.info("USER:%s(@%s) - %s%s", user_id, username, action,
+                                  f" - {details}" if details else "")
     
     def log_payment_action(self, user_id: int, action: str, amount: int = 0, course: str = "", admin_id: int = None):
         """Log payment-related actions"""
-        message = f"PAYMENT - User:{user_id} - {action}"
-        if amount:
-            message += f" - Amount:{amount}"
-        if course:
-            message += f" - Course:{course}"
-        if admin_id:
-            message += f" - Admin:{admin_id}"
-        self.payment_logger.info(message)
+        if self.payment_logger.isEnabledFor(logging.INFO):
+            self.payment_logger.info("PAYMENT - User:%s - %s%s%s%s", user_id, action,
+                                     f" - Amount:{amount}" if amount else "",
+                                     f" - Course:{course}" if course else "",
+                                     f" - Admin:{admin_id}" if admin_id else "")
     
     def log_admin_action(self, admin_id: int, action: str, target_user: int = None, details: str = ""):
         """Log admin actions for audit trail"""
-        message = f"ADMIN:{admin_id} - {action}"
-        if target_user:
-            message += f" - Target:{target_user}"
-        if details:
-            message += f" - {details}"
-        self.admin_logger.info(message)
+        if self.admin_logger.isEnabledFor(logging.INFO):
+            self.admin_logger.info("ADMIN:%s - %s%s%s", admin_id, action,
+                                   f" - Target:{target_user}" if target_user else "",
+                                   f" - {details}" if details else "")
     
     def create_session_log(self):
         """Create a new session marker in logs"""
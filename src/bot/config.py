@@ -1,4 +1,5 @@
 import os
+from functools import lru_cache
 from dotenv import load_dotenv
 
 # Load environment variables
@@ -8,14 +9,23 @@ class Config:
     # Bot Configuration
     BOT_TOKEN = os.getenv('BOT_TOKEN')
     
+    # Parsed ADMIN_IDS, keyed by the raw env value they were parsed from
+    _admin_ids_cache = (None, ())
+    
     # Multiple Admin Support - All admins are super admins
     @classmethod
     def get_admin_ids(cls):
         """Get list of super admin IDs from environment variables"""
+        admin_ids_env = os.getenv('ADMIN_IDS', '')
+        
+        # Only re-parse when the environment value actually changed
+        cached_env, cached_ids = cls._admin_ids_cache
+        if cached_env == admin_ids_env:
+            return list(cached_ids)
+        
         admin_ids = []
         
         # Get super admins from ADMIN_IDS
-        admin_ids_env = os.getenv('ADMIN_IDS', '')
         if admin_ids_env:
             for admin_id in admin_ids_env.split(','):
                 admin_id = admin_id.strip()
@@ -24,6 +34,7 @@ class Config:
                     if admin_id_int not in admin_ids:
                         admin_ids.append(admin_id_int)
         
+        cls._admin_ids_cache = (admin_ids_env, tuple(admin_ids))
         return admin_ids
     
     DEBUG = os.getenv('DEBUG', 'False').lower() == 'true'
@@ -43,6 +54,7 @@ class Config:
     PAYMENT_CARD_HOLDER = os.getenv('PAYMENT_CARD_HOLDER', 'محمد')
     
     @staticmethod
+    @lru_cache(maxsize=16)
     def format_card_number(card_number: str) -> str:
         """Format card number for RTL display and make it copyable in Telegram with Markdown"""
         # Remove any existing formatting to get clean digits only
@@ -60,6 +72,7 @@ class Config:
         return f"\u200E`{formatted}`"
     
     @staticmethod
+    @lru_cache(maxsize=256)
     def format_price(price: int) -> str:
         """Format price in a readable way"""
         if price >= 1000000:
@@ -246,3 +259,9 @@ class Config:
 واریزی رو انجام دادی فیش رو  همینجا ارسال میکنی میریم توی کارش🤝😊💎"""
         }
     }
+
+# Per-course (details, price, formatted price) for the course details screen, built once at import
+Config.COURSE_INFO = {
+    course_type: (details, Config.PRICES[course_type], Config.format_price(Config.PRICES[course_type]))
+    for course_type, details in Config.COURSE_DETAILS.items()
+}
@@ -1,12 +1,19 @@
 import logging
 import logging.handlers
 import asyncio
+import atexit
+import gzip
 import os
-import json
+import queue
+import shutil
 import csv
-import io
+import tempfile
+import traceback
+import uuid
+import weakref
 from datetime import datetime
 import time
+import orjson
 from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup
 from telegram.ext import Application, CommandHandler, CallbackQueryHandler, MessageHandler, filters, ContextTypes
 
@@ -18,6 +25,40 @@ from managers.questionnaire_manager import QuestionnaireManager
 from utils.image_processor import ImageProcessor
 from managers.coupon_manager import CouponManager
 from admin.admin_error_handler import admin_error_handler
+from utils.ttl_cache import TTLDict
+from utils.input_validator import input_validator
+
+class _RawQueueHandler(logging.handlers.QueueHandler):
+    """QueueHandler that enqueues records as-is, so even message formatting runs on the listener thread"""
+    def prepare(self, record):
+        return record
+
+def _start_queue_listener(handlers, queue_handler_class=logging.handlers.QueueHandler):
+    """Start a background listener for the given handlers and return the QueueHandler feeding it"""
+    log_queue = queue.SimpleQueue()
+    listener = logging.handlers.QueueListener(log_queue, *handlers, respect_handler_level=True)
+    listener.start()
+    atexit.register(listener.stop)
+    return queue_handler_class(log_queue)
+
+def _gzip_log_namer(name):
+    """Name rotated log backups with a .gz suffix"""
+    return name + ".gz"
+
+def _gzip_log_rotator(source, dest):
+    """Compress the rotated log file instead of keeping a plain-text backup"""
+    with open(source, 'rb') as f_in, gzip.open(dest, 'wb') as f_out:
+        shutil.copyfileobj(f_in, f_out)
+    os.remove(source)
+
+class _JsonlFormatter(logging.Formatter):
+    """One JSON object per line: the event dict logged as the message, plus its timestamp"""
+    def format(self, record):
+        return orjson.dumps({'ts': record.created, **record.msg}).decode()
+
+def _write_audit_event(audit_name: str, event: dict):
+    """Queue one audit event; it is serialized and appended to logs/<audit_name>.jsonl on the listener thread"""
+    logging.getLogger(f'audit.{audit_name}').info(event)
 
 # Enhanced logging configuration
 def setup_enhanced_logging():
@@ -76,7 +117,6 @@ def setup_enhanced_logging():
         )
         debug_handler.setLevel(logging.DEBUG)
         debug_handler.setFormatter(detailed_formatter)
-        root_logger.addHandler(debug_handler)
     
     # 4. Console handler (for terminal output)
     console_handler = logging.StreamHandler()
@@ -116,22 +156,33 @@ def setup_enhanced_logging():
     payment_handler.setLevel(logging.INFO)
     payment_handler.setFormatter(detailed_formatter)
     
-    # Add all handlers to root logger
-    root_logger.addHandler(main_handler)
-    root_logger.addHandler(error_handler)
-    root_logger.addHandler(console_handler)
+    # Compress rotated backups - rotation runs on the listener thread, not the event loop
+    file_handlers = [main_handler, error_handler, user_handler, admin_handler, payment_handler]
+    if Config.DEBUG:
+        file_handlers.append(debug_handler)
+    for file_handler in file_handlers:
+        file_handler.namer = _gzip_log_namer
+        file_handler.rotator = _gzip_log_rotator
+    
+    # Route every handler through a background QueueListener so that file
+    # writes and rotation never block the event loop - loggers only enqueue
+    root_handlers = [main_handler, error_handler, console_handler]
+    if Config.DEBUG:
+        root_handlers.append(debug_handler)
+    
+    root_logger.addHandler(_start_queue_listener(root_handlers))
     
     # Create specialized loggers
     user_logger = logging.getLogger('user_interactions')
-    user_logger.addHandler(user_handler)
+    user_logger.addHandler(_start_queue_listener([user_handler]))
     user_logger.setLevel(logging.INFO)
     
     admin_logger = logging.getLogger('admin_actions')
-    admin_logger.addHandler(admin_handler)
+    admin_logger.addHandler(_start_queue_listener([admin_handler]))
     admin_logger.setLevel(logging.INFO)
     
     payment_logger = logging.getLogger('payments')
-    payment_logger.addHandler(payment_handler)
+    payment_logger.addHandler(_start_queue_listener([payment_handler]))
     payment_logger.setLevel(logging.INFO)
     
     # Log startup information
@@ -142,6 +193,23 @@ def setup_enhanced_logging():
     logging.info(f"🔧 Debug mode: {'ON' if Config.DEBUG else 'OFF'}")
     logging.info("=" * 80)
     
+    # 8. JSONL audit trails (rotating like the text logs, serialized and written on the listener thread)
+    for audit_name, backup_count in (('payments', 10), ('admin_actions', 5)):
+        audit_handler = logging.handlers.RotatingFileHandler(
+            filename=os.path.join(logs_dir, f"{audit_name}.jsonl"),
+            maxBytes=5*1024*1024,  # 5MB
+            backupCount=backup_count,
+            encoding='utf-8'
+        )
+        audit_handler.setFormatter(_JsonlFormatter())
+        audit_handler.namer = _gzip_log_namer
+        audit_handler.rotator = _gzip_log_rotator
+        
+        audit_logger = logging.getLogger(f'audit.{audit_name}')
+        audit_logger.addHandler(_start_queue_listener([audit_handler], _RawQueueHandler))
+        audit_logger.setLevel(logging.INFO)
+        audit_logger.propagate = False
+    
     return {
         'main': logging.getLogger(__name__),
         'user': user_logger,
@@ -157,32 +225,332 @@ admin_logger = loggers['admin']
 payment_logger = loggers['payment']
 
 # Convenience functions for logging
+# These pass their fields as logger args so the message is only built when a handler emits it,
+# and skip all string work when the category logger is muted
 def log_user_action(user_id: int, username: str, action: str, details: str = ""):
     """Log user interactions for analytics"""
-    message = f"USER:{user_id}(@{username}) - {action}"
-    if details:
-        message += f" - {details}"
-    user_logger.info(message)
+    if user_logger.isEnabledFor(logging.INFO):
+        user_logger.info("USER:%s(@%s) - %s%s", user_id, username, action,
+                         f" - {details}" if details else "")
 
 def log_admin_action(admin_id: int, action: str, details: str = ""):
-    """Log admin actions for audit trail"""
-    message = f"ADMIN:{admin_id} - {action}"
-    if details:
-        message += f" - {details}"
-    admin_logger.info(message)
+    """Log admin actions for audit trail (logs/admin_actions.jsonl)"""
+    _write_audit_event('admin_actions', {'admin_id': admin_id, 'action': action, 'details': details})
 
 def log_payment_action(user_id: int, action: str, amount: int = 0, course: str = "", admin_id: int = None):
-    """Log payment-related actions"""
-    message = f"PAYMENT - User:{user_id} - {action}"
-    if amount:
-        message += f" - Amount:{amount}"
-    if course:
-        message += f" - Course:{course}"
-    if admin_id:
-        message += f" - Admin:{admin_id}"
-    payment_logger.info(message)
+    """Log payment-related actions for financial audit (logs/payments.jsonl)"""
+    _write_audit_event('payments', {
+        'user_id': user_id,
+        'action': action,
+        'amount': amount,
+        'course': course,
+        'admin_id': admin_id
+    })
+
+def _now_iso() -> str:
+    """Current local time as an ISO string - the one place record timestamps are produced"""
+    return datetime.now().isoformat()
+
+def _iter_csv_columns(csv_file, columns: tuple):
+    """
+    Yield the requested columns (stripped, '' when missing) of each non-blank CSV row.
+    Columns are resolved once by header position, so rows stay plain lists instead of dicts.
+    """
+    reader = csv.reader(csv_file)
+    positions = {name.strip().lower(): i for i, name in enumerate(next(reader, []))}
+    indexes = [positions.get(column) for column in columns]
+    for row in reader:
+        if row:
+            yield [row[i].strip() if i is not None and i < len(row) else '' for i in indexes]
+
+def _build_choice_keyboard(choices, include_back: bool = True, back_text: str = "🔙 بازگشت به منوی اصلی") -> list:
+    """Keyboard rows for a questionnaire question: one button per choice plus the back-to-menu row"""
+    keyboard = [[InlineKeyboardButton(choice, callback_data='q_answer_' + choice)] for choice in choices]
+    if include_back:
+        keyboard.append([InlineKeyboardButton(back_text, callback_data='back_to_user_menu')])
+    return keyboard
+
+# Persisted navigation-only flags that /start resets (payment-related fields are never touched)
+_START_NAVIGATION_STATE_KEYS = (
+    'awaiting_form',  # Form waiting state
+    'questionnaire_active'  # Questionnaire navigation flag
+)
+
+# Question types rendered with inline choice buttons
+_CHOICE_QUESTION_TYPES = frozenset({'choice', 'multichoice'})
+
+# Questionnaire entry paths after payment approval:
+# branch -> (intro line, debug log context, debug flow decision)
+_QUESTIONNAIRE_BRANCHES = {
+    'resume_step_gt_1': (
+        "📝 بازگشت به پرسشنامه از جایی که رها کردید",
+        'questionnaire_activated_payment_approved_resume',
+        'set_questionnaire_active_flag_resume'
+    ),
+    'existing_step_1': (
+        "📝 بازگشت به پرسشنامه شخصی‌تان",
+        'questionnaire_activated_payment_approved_existing',
+        'set_questionnaire_active_flag'
+    ),
+    'fresh_start': (
+        "\n📝 حالا وقت تکمیل پرسشنامه است!",
+        'questionnaire_activated_payment_approved_fresh',
+        'set_questionnaire_active_flag_fresh_start'
+    )
+}
+
+# Persian display names for course codes (see get_course_name_farsi)
+_COURSE_NAMES_FARSI = {
+    'in_person': 'دوره تمرین حضوری',
+    'online': 'دوره تمرین آنلاین',
+    'in_person_cardio': 'حضوری - تمرین هوازی سرعتی چابکی',
+    'in_person_weights': 'حضوری - تمرین وزنه',
+    'online_cardio': 'آنلاین - برنامه هوازی و کار با توپ',
+    'online_weights': 'آنلاین - برنامه وزنه',
+    'online_combo': 'آنلاین - برنامه ترکیبی (وزنه + هوازی)',
+    'nutrition_plan': 'برنامه غذایی',
+    'in_person_nutrition': 'حضوری - برنامه تغذیه',
+    'online_nutrition': 'آنلاین - برنامه تغذیه'
+}
+
+# Course menus as (button text, callback data); purchased entries get a ✅
+_COURSE_CATEGORY_BUTTONS = (
+    ("1️⃣ دوره تمرین حضوری", 'in_person'),
+    ("2️⃣ دوره تمرین آنلاین", 'online'),
+    ("3️⃣ برنامه غذایی", 'nutrition_plan')
+)
+_IN_PERSON_COURSE_BUTTONS = (
+    ("1️⃣ تمرین هوازی سرعتی چابکی کار با توپ", 'in_person_cardio'),
+    ("2️⃣ تمرین وزنه", 'in_person_weights')
+)
+_ONLINE_COURSE_BUTTONS = (
+    ("1️⃣ برنامه وزنه", 'online_weights'),
+    ("2️⃣ برنامه هوازی و کار با توپ", 'online_cardio'),
+    ("3️⃣ برنامه وزنه + برنامه هوازی (با تخفیف بیشتر)", 'online_combo')
+)
+
+# Callback data -> course list it opens (category buttons and the "back to category" buttons)
+_COURSE_SUBMENU_BUTTONS = {
+    'in_person': _IN_PERSON_COURSE_BUTTONS,
+    'online': _ONLINE_COURSE_BUTTONS,
+    'back_to_in_person': _IN_PERSON_COURSE_BUTTONS,
+    'back_to_online': _ONLINE_COURSE_BUTTONS
+}
+
+# Short course labels used in the admin plan upload flow
+_COURSE_DISPLAY_NAMES = {
+    'online_weights': '🏋️ وزنه آنلاین',
+    'online_cardio': '🏃 هوازی آنلاین',
+    'online_combo': '💪 ترکیبی آنلاین',
+    'in_person_cardio': '🏃‍♂️ هوازی حضوری',
+    'in_person_weights': '🏋️‍♀️ وزنه حضوری'
+}
+
+# Back button shown on a course's details screen
+_BACK_TO_ONLINE_ROW = [InlineKeyboardButton("🔙 بازگشت به دوره‌های آنلاین", callback_data='back_to_online')]
+_BACK_TO_IN_PERSON_ROW = [InlineKeyboardButton("🔙 بازگشت به دوره‌های حضوری", callback_data='back_to_in_person')]
+_COURSE_BACK_ROWS = {
+    'nutrition_plan': [InlineKeyboardButton("🔙 بازگشت به انتخاب دوره", callback_data='back_to_course_selection')],
+    'online_weights': _BACK_TO_ONLINE_ROW,
+    'online_cardio': _BACK_TO_ONLINE_ROW,
+    'online_combo': _BACK_TO_ONLINE_ROW,
+    'in_person_cardio': _BACK_TO_IN_PERSON_ROW,
+    'in_person_weights': _BACK_TO_IN_PERSON_ROW
+}
+
+# Receipt review keyboard sent to admins: only the per-user callback data varies
+_PAYMENT_REVIEW_MANAGE_ROW = (InlineKeyboardButton("🎛️ مدیریت پرداخت‌ها", callback_data='admin_pending_payments'),)
+
+def _payment_review_markup(user_id: int) -> InlineKeyboardMarkup:
+    """Approve / reject / profile / extra-receipt buttons for one user's payment receipt"""
+    return InlineKeyboardMarkup((
+        (
+            InlineKeyboardButton("✅ تایید", callback_data=f'approve_payment_{user_id}'),
+            InlineKeyboardButton("❌ رد", callback_data=f'reject_payment_{user_id}')
+        ),
+        (InlineKeyboardButton("👤 مشاهده پروفایل", callback_data=f'view_user_{user_id}'),),
+        (InlineKeyboardButton("🔄 اجازه فیش اضافی", callback_data=f'allow_extra_receipt_{user_id}'),),
+        _PAYMENT_REVIEW_MANAGE_ROW
+    ))
+
+# Courses that require questionnaire completion before programs are accessible
+_COURSES_REQUIRING_QUESTIONNAIRE = frozenset({'in_person_cardio', 'in_person_weights', 'online_cardio', 'online_weights'})
+
+# One bit per sellable course type, for cheap "has purchased X" tests on the payment summary
+_COURSE_BITS = {course_type: 1 << bit for bit, course_type in enumerate(Config.PRICES)}
+
+# File extensions accepted for admin plan documents (lower-case, without the dot)
+_ALLOWED_PLAN_EXTS = frozenset({'pdf', 'txt', 'doc', 'docx'})
+
+# Receipt and questionnaire photo limits: Telegram bot download cap, smallest readable side in pixels
+_MAX_PHOTO_BYTES = 20 * 1024 * 1024  # 20MB
+_MIN_PHOTO_DIMENSION = 200
+
+# Longest coupon code input worth normalizing and looking up; anything longer is rejected outright
+_MAX_COUPON_CODE_LENGTH = 64
+
+# Per-user payment flow state cleared once a receipt has been processed
+_PAYMENT_FLOW_KEYS = ('buying_additional_course', 'current_course_selection', 'awaiting_payment_receipt', 'payment_course')
+
+# Rows buffered by the CSV importers before one bulk save (one data file rewrite per batch)
+_CSV_IMPORT_BATCH_SIZE = 500
+
+# CSV import type detection: (required header columns, importer method name), checked in order
+_CSV_IMPORT_SCHEMAS = (
+    (frozenset({'user_id', 'name'}), 'import_users_csv'),
+    (frozenset({'user_id', 'course_type', 'price'}), 'import_payments_csv'),
+)
+
+# Values accepted by the CSV importers (empty status is allowed separately)
+_VALID_COURSES = frozenset(Config.PRICES)
+_VALID_USER_PAYMENT_STATUSES = frozenset({'pending_approval', 'approved', 'rejected'})
+_VALID_PAYMENT_STATUSES = _VALID_USER_PAYMENT_STATUSES | {'pending'}
+
+# Payment screen text: intro + card details up to "💰 مبلغ: ", then the amount, optional coupon block, footer
+_NUTRITION_PAYMENT_INTRO = """🥗 برنامه غذایی شخصی‌سازی شده
+
+با توجه به اهداف و شرایط جسمانی شما، یک برنامه غذایی کاملاً شخصی‌سازی شده تهیه می‌شود.
+
+برای دریافت برنامه غذایی، لطفاً روی لینک زیر کلیک کنید:
+
+👈 https://fitava.ir/coach/drbohloul/question
+
+✨ این برنامه شامل:
+• برنامه غذایی کامل بر اساس نیازهای شما
+• راهنمایی تخصصی تغذیه ورزشی
+• پیگیری و تنظیم برنامه
+❌توجه داشته باشید همه فیلدهای فرم رو پر کنید وبرای قسمت اعداد، کیورد اعداد انگلیسی رو وارد کنید 
+
+"""
+
+_PAYMENT_MESSAGE_FOOTER = """
+
+بعد از واریز، فیش یا اسکرین شات رو همینجا ارسال کنید تا بررسی شه ✅
+
+⚠️ توجه: فقط فیش واریز رو ارسال کنید"""
+
+def _payment_message_prefix(course_type: str) -> str:
+    """Payment message for a course up to (not including) the amount"""
+    if course_type == 'nutrition_plan':
+        intro = _NUTRITION_PAYMENT_INTRO
+    else:
+        # Generic payment message for other courses
+        course_title = Config.COURSE_DETAILS.get(course_type, {}).get('title', 'دوره انتخابی')
+        intro = f"📚 {course_title}\n\n"
+    return (
+        f"{intro}برای پرداخت به شماره کارت زیر واریز کنید:\n\n"
+        f"💳 شماره کارت: {Config.format_card_number(Config.PAYMENT_CARD_NUMBER)}\n"
+        f"👤 نام صاحب حساب: {Config.PAYMENT_CARD_HOLDER}\n"
+        f"💰 مبلغ: "
+    )
+
+_PAYMENT_MESSAGE_PREFIXES = {course_type: _payment_message_prefix(course_type) for course_type in Config.PRICES}
 
 class FootballCoachBot:
+    COOLDOWN_SLOT_MASK = 8191  # 8192 cooldown slots
+    
+    # Static menus - identical for every user, so built once
+    # Single-button markups shared by error, coupon and plan upload replies
+    HOME_ONLY_MARKUP = InlineKeyboardMarkup([
+        [InlineKeyboardButton("🏠 منوی اصلی", callback_data='back_to_user_menu')]
+    ])
+    BACK_TO_COURSE_SELECTION_MARKUP = InlineKeyboardMarkup([
+        [InlineKeyboardButton("🔙 بازگشت به انتخاب دوره", callback_data='back_to_course_selection')]
+    ])
+    SKIP_PLAN_DESCRIPTION_MARKUP = InlineKeyboardMarkup([
+        [InlineKeyboardButton("⏩ رد کردن توضیحات", callback_data='skip_plan_description')]
+    ])
+    
+    SIMPLE_MENU_MARKUP = InlineKeyboardMarkup([
+        [InlineKeyboardButton("🛒 خرید دوره", callback_data='new_course')],
+        [InlineKeyboardButton("📊 مشاهده وضعیت", callback_data='my_status')],
+        [InlineKeyboardButton("📞 پشتیبانی", callback_data='contact_support')],
+    ])
+    
+    _PAYMENT_PENDING_MENU_ROWS = [
+        [InlineKeyboardButton("📊 وضعیت پرداخت", callback_data='check_payment_status')],
+        [InlineKeyboardButton("📞 تماس با پشتیبانی", callback_data='contact_support')],
+        [InlineKeyboardButton("🔄 دوره جدید", callback_data='new_course')]
+    ]
+    PAYMENT_PENDING_MENU_MARKUPS = {
+        False: InlineKeyboardMarkup(_PAYMENT_PENDING_MENU_ROWS),
+        True: InlineKeyboardMarkup(_PAYMENT_PENDING_MENU_ROWS + [
+            [InlineKeyboardButton("🔙 بازگشت به منوی ادمین", callback_data='admin_back_main')]
+        ]),
+    }
+    
+    _APPROVED_MENU_HEAD_ROWS = [
+        [InlineKeyboardButton("📋 مشاهده برنامه تمرینی", callback_data='view_program')],
+        [InlineKeyboardButton("📊 وضعیت من", callback_data='my_status')],
+    ]
+    _APPROVED_MENU_QUESTIONNAIRE_ROWS = [
+        [InlineKeyboardButton("✏️ ویرایش پرسشنامه", callback_data='edit_questionnaire')],
+        [InlineKeyboardButton("🔄 بروزرسانی پرسشنامه", callback_data='restart_questionnaire')],
+    ]
+    _NEW_COURSE_ROW = [InlineKeyboardButton("🛒 دوره جدید", callback_data='new_course')]
+    _ADMIN_BACK_ROW = [InlineKeyboardButton("🔙 بازگشت به منوی ادمین", callback_data='admin_back_main')]
+    # Approved-user menus keyed by (admin_mode, requires_questionnaire)
+    APPROVED_MENU_MARKUPS = {
+        (False, False): InlineKeyboardMarkup(_APPROVED_MENU_HEAD_ROWS + [_NEW_COURSE_ROW]),
+        (False, True): InlineKeyboardMarkup(_APPROVED_MENU_HEAD_ROWS + _APPROVED_MENU_QUESTIONNAIRE_ROWS + [_NEW_COURSE_ROW]),
+        (True, False): InlineKeyboardMarkup(_APPROVED_MENU_HEAD_ROWS + [_NEW_COURSE_ROW, _ADMIN_BACK_ROW]),
+        (True, True): InlineKeyboardMarkup(_APPROVED_MENU_HEAD_ROWS + _APPROVED_MENU_QUESTIONNAIRE_ROWS + [_NEW_COURSE_ROW, _ADMIN_BACK_ROW]),
+    }
+    
+    # Shown to users who purchased the nutrition plan
+    NUTRITION_INFO_TEXT = """
+
+🥗 برنامه غذایی شخصی‌سازی شده
+
+با توجه به اهداف و شرایط جسمانی شما، یک برنامه غذایی کاملاً شخصی‌سازی شده تهیه می‌شود.
+
+برای دریافت برنامه غذایی، لطفاً روی لینک زیر کلیک کنید:
+
+👈 https://fitava.ir/coach/drbohloul/question
+
+✨ این برنامه شامل:
+• برنامه غذایی کامل بر اساس نیازهای شما
+• راهنمایی تخصصی تغذیه ورزشی
+• پیگیری و تنظیم برنامه
+❌توجه داشته باشید همه فیلدهای فرم رو پر کنید وبرای قسمت اعداد، کیورد اعداد انگلیسی رو وارد کنید"""
+    
+    # Welcome texts for users who can access their programs
+    WELCOME_APPROVED_MULTI = "سلام {user_name}! 👋\n\n✅ شما دارای {course_count} دوره فعال هستید!\n🎯 برنامه‌های تمرینی شخصی‌سازی شده شما آماده است!{nutrition}\n\n💪 برای دسترسی به برنامه تمرینی، از منو استفاده کنید:"
+    WELCOME_APPROVED_SINGLE = "سلام {user_name}! 👋\n\n✅ برنامه تمرینی شما برای دوره **{course_name}** آماده است!\n🎯 برنامه شخصی‌سازی شده شما آماده است!{nutrition}\n\n💪 برای دسترسی به برنامه تمرینی، از منو استفاده کنید:"
+    
+    # Course details screen (filled from Config.COURSE_DETAILS entries)
+    COURSE_DETAILS_TEMPLATE = "{title}👇👇👇👇👇\n\n{description}"
+    
+    # Coupon accepted - price breakdown
+    COUPON_SUCCESS_TEMPLATE = (
+        "✅ {message}\n\n"
+        "💰 قیمت اصلی: {orig}\n"
+        "🏷️ تخفیف ({pct}%): -{disc}\n"
+        "💳 قیمت نهایی: {final}\n\n"
+        "🎉 شما {disc} صرفه‌جویی کردید!"
+    )
+    
+    # Coupon block appended to the payment message
+    PAYMENT_COUPON_TEMPLATE = (
+        "\n\n"
+        "🏷️ کد تخفیف: {code}\n"
+        "💰 قیمت اصلی: {orig}\n"
+        "🎯 تخفیف: -{disc}\n"
+        "✅ قیمت نهایی: {final}"
+    )
+    
+    # Admin notification caption for a newly submitted payment receipt
+    PAYMENT_RECEIPT_ADMIN_TEMPLATE = (
+        "🔔 درخواست تایید پرداخت جدید\n\n"
+        "👤 کاربر: {name}\n"
+        "📱 نام کاربری: @{username}\n"
+        "🆔 User ID: {user_id}\n"
+        "📚 دوره: {course}\n"
+        "💰 مبلغ: {price:,} تومان\n"
+        "📊 تلاش ارسال فیش: {attempt}/3\n\n"
+        "⬇️ فیش واریز ارسالی:"
+    )
+    
     def __init__(self):
         # Initialize data manager based on USE_DATABASE setting
         if Config.USE_DATABASE:
@@ -192,39 +560,86 @@ class FootballCoachBot:
             self.data_manager = DataManager()
             logger.info("📁 Using JSON File Data Manager")
             
-        self.admin_panel = AdminPanel()
+        # In JSON mode the admin panel shares this DataManager (and its bot_data.json snapshot)
+        self.admin_panel = AdminPanel(self.data_manager if isinstance(self.data_manager, DataManager) else None)
         self.questionnaire_manager = QuestionnaireManager()
         self.image_processor = ImageProcessor()
         self.coupon_manager = CouponManager()
+        # Not TTL-bounded: it holds the discounted price of an already-consumed coupon until the
+        # receipt arrives. Entries leave on receipt, /start or menu navigation
         self.payment_pending = {}
-        self.user_coupon_codes = {}  # Store coupon codes entered by users
-        self.user_last_action = {}  # Cooldown protection - track last action time per user
+        # Per-user in-memory state is TTL-bounded so a long-running bot doesn't leak memory
+        self.user_coupon_codes = TTLDict(maxsize=50000, ttl=24 * 3600)  # Store coupon codes entered by users
+        # Cooldown protection - fixed-size slot table keyed by user_id bits, constant memory
+        self._cooldown_slots = [0.0] * (self.COOLDOWN_SLOT_MASK + 1)  # last action time (monotonic)
+        self._cooldown_owner = [0] * (self.COOLDOWN_SLOT_MASK + 1)  # user_id currently owning the slot
+        self.processing_payments = TTLDict(maxsize=10000, ttl=600)  # Payment locks - expire if never released
+        self._course_menu_markups = {}  # (buttons, owned flags, with_back) -> InlineKeyboardMarkup
+        self._last_edit_content = TTLDict(maxsize=50000, ttl=3600)  # (chat_id, message_id) -> ((text, markup, parse_mode), edit_date) of our last edit
+        # Re-read questionnaire progress after activation to verify it (opt-in diagnostics)
+        self._debug_verify_questionnaire = os.getenv('DEBUG_Q_VERIFY', '0') == '1'
+        # Plan upload audit entries, persisted in batches by _drain_admin_log_queue (started in initialize)
+        self._admin_log_queue = asyncio.Queue()
+        self._admin_log_task = None
+        self._background_tasks = set()  # Strong refs to fire-and-forget tasks until they finish
+        # user_id -> asyncio.Lock serializing that user's receipt handling; entries vanish once no handler holds them
+        self._receipt_locks = weakref.WeakValueDictionary()
+    
+    def _run_in_background(self, coro, label: str) -> None:
+        """Schedule a coroutine without awaiting it; failures are logged under the given label"""
+        task = asyncio.create_task(coro)
+        self._background_tasks.add(task)
+        
+        def _done(t):
+            self._background_tasks.discard(t)
+            if not t.cancelled() and t.exception() is not None:
+                logger.error(f"❌ Background task '{label}' failed: {t.exception()}")
+        
+        task.add_done_callback(_done)
     
     async def check_cooldown(self, user_id: int) -> bool:
         """Check if user is in cooldown period (0.5s). Returns True if should skip action."""
-        current_time = time.time()
-        last_action = self.user_last_action.get(user_id, 0)
+        current_time = time.monotonic()
+        slot = user_id & self.COOLDOWN_SLOT_MASK
         
-        if current_time - last_action < 0.5:  # 0.5 second cooldown
+        # A slot taken over by another user simply means no recent action for this one
+        if self._cooldown_owner[slot] == user_id and current_time - self._cooldown_slots[slot] < 0.5:  # 0.5 second cooldown
             logger.debug(f"🕐 COOLDOWN - User {user_id} action skipped (too fast)")
             return True
-            
-        self.user_last_action[user_id] = current_time
+        
+        self._cooldown_owner[slot] = user_id
+        self._cooldown_slots[slot] = current_time
         return False
     
     async def safe_edit_message(self, query, text, reply_markup=None, parse_mode=None):
         """Safely edit message to prevent 'Message is not modified' errors"""
         try:
+            message = query.message
+            content = (text, reply_markup, parse_mode)
+            
+            # Skip locally if our last edit of this message sent identical content and nothing edited it since.
+            # Only edited, accessible messages carry edit_date (InaccessibleMessage has none)
+            message_edit_date = getattr(message, 'edit_date', None)
+            if message_edit_date is not None:
+                last_edit = self._last_edit_content.get((message.chat_id, message.message_id))
+                if last_edit is not None and last_edit == (content, message_edit_date):
+                    logger.debug("🔄 Message content unchanged since last edit, skipping Telegram API call")
+                    return
+            
             # Check if current message text is different
             if hasattr(query.message, 'text') and query.message.text == text:
                 logger.debug("🔄 Message content identical, skipping edit to prevent 'Message is not modified' error")
                 return
                 
-            await query.edit_message_text(
+            edited = await query.edit_message_text(
                 text, 
                 reply_markup=reply_markup, 
                 parse_mode=parse_mode
             )
+            
+            edit_date = getattr(edited, 'edit_date', None)
+            if edit_date is not None:
+                self._last_edit_content[(edited.chat_id, edited.message_id)] = (content, edit_date)
         except Exception as e:
             if "message is not modified" in str(e).lower():
                 logger.debug(f"⚠️ Message not modified: {e}")
@@ -241,6 +656,10 @@ class FootballCoachBot:
 
     async def initialize(self):
         """Initialize bot on startup - comprehensive admin sync"""
+        # Background writer for plan upload audit entries
+        if self._admin_log_task is None:
+            self._admin_log_task = asyncio.create_task(self._drain_admin_log_queue())
+        
         try:
             logger.info("🔧 Initializing admin sync from environment variables...")
             
@@ -250,7 +669,6 @@ class FootballCoachBot:
                 await self.data_manager.initialize()
             
             # Setup admin directory structure
-            from admin.admin_error_handler import admin_error_handler
             await admin_error_handler.setup_admin_directories()
             
             # Migrate legacy admin files to organized structure
@@ -269,13 +687,8 @@ class FootballCoachBot:
     async def notify_all_admins_payment_update(self, bot, payment_user_id: int, action: str, acting_admin_name: str, course_title: str = "", price: int = 0, user_name: str = ""):
         """Notify all admins when a payment status changes"""
         try:
-            # Get all admin IDs
-            admin_ids = []
-            if Config.USE_DATABASE:
-                admin_ids = await self.admin_panel.admin_manager.get_all_admin_ids()
-            else:
-                admins_data = await self.data_manager.load_data('admins')
-                admin_ids = [int(admin_id) for admin_id in admins_data.keys()] if admins_data else []
+            # Get all admin IDs - the admin manager keeps them as a cached integer list in both storage modes
+            admin_ids = await self.admin_panel.admin_manager.get_all_admin_ids()
             
             # Create message based on action
             if action == 'approve':
@@ -293,15 +706,15 @@ class FootballCoachBot:
             else:
                 return
             
-            # Send notification to all admins
-            for admin_id in admin_ids:
-                try:
-                    await bot.send_message(
-                        chat_id=admin_id,
-                        text=f"🔔 به‌روزرسانی وضعیت پرداخت:\n\n{message}"
-                    )
-                except Exception as e:
-                    logger.warning(f"Failed to notify admin {admin_id}: {e}")
+            # Send notification to all admins concurrently
+            text = f"🔔 به‌روزرسانی وضعیت پرداخت:\n\n{message}"
+            results = await asyncio.gather(
+                *(bot.send_message(chat_id=admin_id, text=text) for admin_id in admin_ids),
+                return_exceptions=True
+            )
+            for admin_id, result in zip(admin_ids, results):
+                if isinstance(result, Exception):
+                    logger.warning(f"Failed to notify admin {admin_id}: {result}")
                     
         except Exception as e:
             logger.error(f"Failed to notify admins about payment update: {e}")
@@ -340,59 +753,59 @@ class FootballCoachBot:
         admins_data['super_admin'] = config_super_admin
         
         # Track changes
-        added_count = 0
         updated_count = 0
-        removed_count = 0
         
         # Current admins in the data
         current_admin_ids = set(admins_data['admins'])
         env_admin_ids = set(admin_ids)
+        admins_to_add = env_admin_ids - current_admin_ids
+        admins_to_remove = current_admin_ids - env_admin_ids
+        now_iso = _now_iso()
+        permissions = admins_data['admin_permissions']
+        
+        # Add new admins from environment (kept in env order)
+        new_admin_ids = [admin_id for admin_id in admin_ids if admin_id in admins_to_add]
+        admins_data['admins'].extend(new_admin_ids)
+        permissions.update({
+            str(admin_id): {
+                'can_add_admins': admin_id == config_super_admin,
+                'can_remove_admins': admin_id == config_super_admin,
+                'can_view_users': True,
+                'can_manage_payments': True,
+                'is_super_admin': admin_id == config_super_admin,
+                'added_by': 'env_sync',
+                'added_date': now_iso,
+                'synced_from_config': True
+            }
+            for admin_id in new_admin_ids
+        })
+        for admin_id in new_admin_ids:
+            logger.info(f"  ✅ Added admin to JSON: {admin_id}")
+        added_count = len(new_admin_ids)
         
-        # Add new admins from environment
-        for admin_id in admin_ids:
+        # Update existing admins' permissions if their role changed
+        for admin_id in env_admin_ids & current_admin_ids:
             is_super = (admin_id == config_super_admin)
+            admin_perms = permissions.get(str(admin_id))
             
-            if admin_id not in current_admin_ids:
-                # Add to admins array
-                admins_data['admins'].append(admin_id)
-                # Add permissions
-                admins_data['admin_permissions'][str(admin_id)] = {
+            if admin_perms is not None and admin_perms.get('is_super_admin', False) != is_super:
+                admin_perms.update({
+                    'is_super_admin': is_super,
                     'can_add_admins': is_super,
                     'can_remove_admins': is_super,
-                    'can_view_users': True,
-                    'can_manage_payments': True,
-                    'is_super_admin': is_super,
-                    'added_by': 'env_sync',
-                    'added_date': datetime.now().isoformat(),
-                    'synced_from_config': True
-                }
-                logger.info(f"  ✅ Added admin to JSON: {admin_id}")
-                added_count += 1
-            else:
-                # Update existing admin's permissions if changed
-                admin_perms = admins_data['admin_permissions'].get(str(admin_id), {})
-                current_is_super = admin_perms.get('is_super_admin', False)
-                
-                if current_is_super != is_super:
-                    admins_data['admin_permissions'][str(admin_id)]['is_super_admin'] = is_super
-                    admins_data['admin_permissions'][str(admin_id)]['can_add_admins'] = is_super
-                    admins_data['admin_permissions'][str(admin_id)]['can_remove_admins'] = is_super
-                    admins_data['admin_permissions'][str(admin_id)]['updated_date'] = datetime.now().isoformat()
-                    role_change = "promoted to super admin" if is_super else "demoted from super admin"
-                    logger.info(f"  🎖️ Admin {admin_id} {role_change}")
-                    updated_count += 1
+                    'updated_date': now_iso
+                })
+                role_change = "promoted to super admin" if is_super else "demoted from super admin"
+                logger.info(f"  🎖️ Admin {admin_id} {role_change}")
+                updated_count += 1
         
         # Remove admins who are no longer in environment (AGGRESSIVE SYNC - removes ALL non-env admins)
-        admins_to_remove = current_admin_ids - env_admin_ids
-        for admin_id_to_remove in admins_to_remove:
-            # Remove from admins array
-            if admin_id_to_remove in admins_data['admins']:
-                admins_data['admins'].remove(admin_id_to_remove)
-            # Remove permissions
-            if str(admin_id_to_remove) in admins_data['admin_permissions']:
-                del admins_data['admin_permissions'][str(admin_id_to_remove)]
-            logger.info(f"  ❌ Removed admin from JSON: {admin_id_to_remove} (aggressive sync)")
-            removed_count += 1
+        if admins_to_remove:
+            admins_data['admins'] = [a for a in admins_data['admins'] if a not in admins_to_remove]
+            for admin_id_to_remove in admins_to_remove:
+                permissions.pop(str(admin_id_to_remove), None)
+                logger.info(f"  ❌ Removed admin from JSON: {admin_id_to_remove} (aggressive sync)")
+        removed_count = len(admins_to_remove)
         
         # Save updated admins data
         await self.data_manager.save_data('admins', admins_data)
@@ -425,26 +838,33 @@ class FootballCoachBot:
         if not admin_ids:
             return 0
         
+        def send_to(admin_id):
+            if photo:
+                return context.bot.send_photo(
+                    chat_id=admin_id,
+                    photo=photo,
+                    caption=message,
+                    reply_markup=reply_markup
+                )
+            return context.bot.send_message(
+                chat_id=admin_id,
+                text=message,
+                reply_markup=reply_markup,
+                parse_mode='HTML'
+            )
+        
+        # Fan out to all admins concurrently - one round-trip instead of one per admin
+        results = await asyncio.gather(
+            *(send_to(admin_id) for admin_id in admin_ids),
+            return_exceptions=True
+        )
+        
         sent_count = 0
-        for admin_id in admin_ids:
-            try:
-                if photo:
-                    await context.bot.send_photo(
-                        chat_id=admin_id,
-                        photo=photo,
-                        caption=message,
-                        reply_markup=reply_markup
-                    )
-                else:
-                    await context.bot.send_message(
-                        chat_id=admin_id,
-                        text=message,
-                        reply_markup=reply_markup,
-                        parse_mode='HTML'
-                    )
+        for admin_id, result in zip(admin_ids, results):
+            if isinstance(result, Exception):
+                logger.warning(f"Failed to send notification to admin {admin_id}: {result}")
+            else:
                 sent_count += 1
-            except Exception as e:
-                logger.warning(f"Failed to send notification to admin {admin_id}: {e}")
         
         logger.info(f"Notification sent to {sent_count}/{len(admin_ids)} admins")
         return sent_count
@@ -469,9 +889,14 @@ class FootballCoachBot:
             logger.debug(f"🧹 Clearing stale payment_pending data for user {user_id}")
             del self.payment_pending[user_id]
         
-        # COMPREHENSIVE STATE CLEARING - clear ALL possible input states
-        states_cleared = await admin_error_handler.clear_all_input_states(
-            context, user_id, "/start command - FORCE MAIN HUB"
+        # COMPREHENSIVE STATE CLEARING - clear ALL possible input states.
+        # Runs concurrently with the independent user-data read and admin check
+        states_cleared, user_data_before_clear, is_admin_result = await asyncio.gather(
+            admin_error_handler.clear_all_input_states(
+                context, user_id, "/start command - FORCE MAIN HUB"
+            ),
+            self.data_manager.get_user_data(user_id),
+            self.admin_panel.admin_manager.is_admin(user_id)
         )
         
         # CRITICAL FIX: Clear questionnaire_active flag so random text won't be processed as questionnaire
@@ -481,27 +906,24 @@ class FootballCoachBot:
         
         # PRESERVE PAYMENT DATA - Never clear valid payment submissions
         # Users should be able to navigate freely without losing payment progress
-        user_data_before_clear = await self.data_manager.get_user_data(user_id)
         
         # Only clear non-critical navigation states, PRESERVE all payment-related data
-        navigation_states_to_clear = [
-            'awaiting_form',  # Clear form waiting state only
-            'questionnaire_active'  # Clear questionnaire navigation flag only
-        ]
-
-        preserved_payment_data = {}
-        for state in navigation_states_to_clear:
-            if state in user_data_before_clear:
-                preserved_payment_data[state] = None  # Clear only navigation states
+        preserved_payment_data = {
+            state: None  # Clear only navigation states
+            for state in _START_NAVIGATION_STATE_KEYS
+            if state in user_data_before_clear
+        }
 
         # CRITICAL: NEVER clear payment records from payments table
         # Users must be able to navigate without losing payment submissions
         logger.info(f"✅ PRESERVING ALL PAYMENT DATA - User {user_id} | Navigation cleared only")
 
-        # Save only navigation state changes, preserve payment data
+        # Only navigation state changes are written, payment data is preserved.
+        # The write itself is batched with the interaction update below (single save per /start)
         if preserved_payment_data:
             logger.info(f"🧹 CLEARING NAVIGATION STATES ONLY - User {user_id} | Cleared: {list(preserved_payment_data.keys())}")
-            await self.data_manager.save_user_data(user_id, preserved_payment_data)        # DON'T RESET QUESTIONNAIRE PROGRESS ON /start
+        
+        # DON'T RESET QUESTIONNAIRE PROGRESS ON /start
         # Instead, preserve questionnaire state and let user continue or restart if they want
         # questionnaire_reset = await admin_error_handler.reset_questionnaire_state(
         #     user_id, self.questionnaire_manager, "/start command - FORCE RESET"
@@ -510,9 +932,10 @@ class FootballCoachBot:
         logger.info(f"👤 PRESERVING QUESTIONNAIRE STATE - User {user_id} | /start will show current questionnaire status")
         
         # Clear admin-specific states if user is admin
-        is_admin_result = await self.admin_panel.admin_manager.is_admin(user_id)
-        
         if is_admin_result:
+            if preserved_payment_data:
+                await self.data_manager.save_user_data(user_id, preserved_payment_data)
+            
             admin_states_cleared = await admin_error_handler.clear_admin_input_states(
                 self.admin_panel, user_id, "/start command - ADMIN HUB REDIRECT"
             )
@@ -529,19 +952,19 @@ class FootballCoachBot:
         
         # For regular users, always show the same simple unified menu
         # This ensures /start always has consistent behavior regardless of user state
-        user_data = await self.data_manager.get_user_data(user_id)
         
-        # Update user interaction data
-        await self.data_manager.save_user_data(user_id, {
+        # Update user interaction data together with the navigation state clearing - one write
+        user_updates = {
+            **preserved_payment_data,
             'name': user_name,
             'username': update.effective_user.username,
             'started_bot': True,
-            'last_interaction': asyncio.get_event_loop().time()
-        })
+            'last_interaction': time.time()
+        }
+        await self.data_manager.save_user_data(user_id, user_updates)
         
-        # Refresh user_data after save and ensure user_id is set
-        user_data = await self.data_manager.get_user_data(user_id)
-        user_data['user_id'] = user_id
+        # Apply the same merge locally instead of re-reading what was just written
+        user_data = {**user_data_before_clear, **user_updates, 'user_id': user_id}
         
         # SIMPLE, UNIFIED MENU - always the same layout (questionnaire preserved)
         logger.info(f"👤 USER /start - User {user_id} redirected to simple unified menu | Context states: {states_cleared} | Preserved payment data - no corruption")
@@ -551,14 +974,8 @@ class FootballCoachBot:
         """Show simple, unified menu that's always the same - no status complexity"""
         user_id = update.effective_user.id
         
-        # SIMPLE MENU - Always the same 4 buttons regardless of status
-        keyboard = [
-            [InlineKeyboardButton("🛒 خرید دوره", callback_data='new_course')],
-            [InlineKeyboardButton("📊 مشاهده وضعیت", callback_data='my_status')],
-            [InlineKeyboardButton("📞 پشتیبانی", callback_data='contact_support')],
-        ]
-        
-        reply_markup = InlineKeyboardMarkup(keyboard)
+        # SIMPLE MENU - Always the same buttons regardless of status (built once at class scope)
+        reply_markup = self.SIMPLE_MENU_MARKUP
         
         # Simple welcome message - no status complexity
         welcome_text = f"""سلام {user_name}! 👋
@@ -588,9 +1005,11 @@ class FootballCoachBot:
                 await self.show_admin_hub_for_start(update, context, user_id)
                 return
         
-        # Determine user status
+        # Determine user status - the payment summary is loaded once and shared with the branches below
+        payment_summary = None
         try:
-            status = await self.get_user_status(user_data)
+            payment_summary = await self._load_user_payment_summary(user_id)
+            status = await self.get_user_status(user_data, payment_summary)
         except Exception as e:
             logger.error(f"Error determining user status for user {user_id}: {e}")
             # Default to returning user if status determination fails
@@ -598,45 +1017,36 @@ class FootballCoachBot:
         
         if status == 'new_user':
             # First-time user - show welcome and course selection
-            reply_markup = await self.create_course_selection_keyboard(user_id)
+            reply_markup = await self.create_course_selection_keyboard(user_id, payment_summary)
             welcome_text = Config.WELCOME_MESSAGE
             
         elif status == 'payment_pending':
             # User has submitted payment, waiting for approval
             course_code = user_data.get('course_selected', 'نامشخص')
             course_name = self.get_course_name_farsi(course_code)
-            keyboard = [
-                [InlineKeyboardButton("📊 وضعیت پرداخت", callback_data='check_payment_status')],
-                [InlineKeyboardButton("📞 تماس با پشتیبانی", callback_data='contact_support')],
-                [InlineKeyboardButton("🔄 دوره جدید", callback_data='new_course')]
-            ]
-            if admin_mode:
-                keyboard.append([InlineKeyboardButton("🔙 بازگشت به منوی ادمین", callback_data='admin_back_main')])
-            reply_markup = InlineKeyboardMarkup(keyboard)
+            reply_markup = self.PAYMENT_PENDING_MENU_MARKUPS[bool(admin_mode)]
             welcome_text = f"سلام {user_name}! 👋\n\n⏳ پرداخت شما برای دوره **{course_name}** در انتظار تایید است.\n\nمی‌توانید وضعیت پرداخت خود را بررسی کنید:"
             
         elif status == 'payment_approved':
             # User payment approved - use comprehensive questionnaire requirement analysis
-            quest_req_status = await self.get_user_questionnaire_requirement_status(user_id)
+            quest_req_status = await self.get_user_questionnaire_requirement_status(user_id, payment_summary)
             purchased_courses = quest_req_status['purchased_courses']
             course_count = len(purchased_courses)
             
-            # DEBUG LOGGING for questionnaire flow
+            # DEBUG LOGGING for questionnaire flow - details are collected along the way
+            # and written as a single record at the end of this branch
             questionnaire_status = quest_req_status['questionnaire_status']
-            from admin.admin_error_handler import admin_error_handler
-            await admin_error_handler.log_questionnaire_flow_debug(
-                user_id=user_id,
-                context='payment_approved_status_menu',
-                questionnaire_data=questionnaire_status or {},
-                flow_decision='analyzing_requirements',
-                details={
+            debug_details = None
+            if admin_error_handler.questionnaire_flow_debug_enabled():
+                debug_context, flow_decision = 'payment_approved_status_menu', 'analyzing_requirements'
+                debug_details = {
+                    'phases': ['analyzing_requirements'],
                     'purchased_courses': list(purchased_courses),
                     'requires_questionnaire': quest_req_status['requires_questionnaire'],
                     'can_access_programs': quest_req_status['can_access_programs'],
                     'questionnaire_completed': quest_req_status['questionnaire_completed'],
                     'questionnaire_in_progress': quest_req_status['questionnaire_in_progress']
                 }
-            )
             
             # Get primary course for display (most recent or default)
             course_code = user_data.get('course', 'نامشخص')
@@ -644,60 +1054,31 @@ class FootballCoachBot:
             
             if quest_req_status['can_access_programs']:
                 # User can access programs (either no questionnaire needed or questionnaire completed)
-                keyboard = [
-                    [InlineKeyboardButton("📋 مشاهده برنامه تمرینی", callback_data='view_program')],
-                    [InlineKeyboardButton("📊 وضعیت من", callback_data='my_status')],
-                ]
-                
-                # Only show questionnaire options if questionnaire is required for their courses
-                if quest_req_status['requires_questionnaire']:
-                    keyboard.extend([
-                        [InlineKeyboardButton("✏️ ویرایش پرسشنامه", callback_data='edit_questionnaire')],
-                        [InlineKeyboardButton("🔄 بروزرسانی پرسشنامه", callback_data='restart_questionnaire')],
-                    ])
-                
-                keyboard.append([InlineKeyboardButton("🛒 دوره جدید", callback_data='new_course')])
-                
-                if admin_mode:
-                    keyboard.append([InlineKeyboardButton("🔙 بازگشت به منوی ادمین", callback_data='admin_back_main')])
+                # Questionnaire options only show if questionnaire is required for their courses
+                reply_markup = self.APPROVED_MENU_MARKUPS[(bool(admin_mode), bool(quest_req_status['requires_questionnaire']))]
                 
                 # Enhanced welcome message showing completion status and purchased courses
-                nutrition_info = ""
-                
                 # Only show nutrition info if user purchased nutrition plan
-                if 'nutrition_plan' in purchased_courses:
-                    nutrition_info = """
-
-🥗 برنامه غذایی شخصی‌سازی شده
-
-با توجه به اهداف و شرایط جسمانی شما، یک برنامه غذایی کاملاً شخصی‌سازی شده تهیه می‌شود.
-
-برای دریافت برنامه غذایی، لطفاً روی لینک زیر کلیک کنید:
-
-👈 https://fitava.ir/coach/drbohloul/question
-
-✨ این برنامه شامل:
-• برنامه غذایی کامل بر اساس نیازهای شما
-• راهنمایی تخصصی تغذیه ورزشی
-• پیگیری و تنظیم برنامه
-❌توجه داشته باشید همه فیلدهای فرم رو پر کنید وبرای قسمت اعداد، کیورد اعداد انگلیسی رو وارد کنید"""
-
-                if course_count > 1:
-                    welcome_text = f"سلام {user_name}! 👋\n\n✅ شما دارای {course_count} دوره فعال هستید!\n🎯 برنامه‌های تمرینی شخصی‌سازی شده شما آماده است!{nutrition_info}\n\n💪 برای دسترسی به برنامه تمرینی، از منو استفاده کنید:"
-                else:
-                    welcome_text = f"سلام {user_name}! 👋\n\n✅ برنامه تمرینی شما برای دوره **{course_name}** آماده است!\n🎯 برنامه شخصی‌سازی شده شما آماده است!{nutrition_info}\n\n💪 برای دسترسی به برنامه تمرینی، از منو استفاده کنید:"
+                nutrition_info = self.NUTRITION_INFO_TEXT if quest_req_status['purchased_mask'] & _COURSE_BITS['nutrition_plan'] else ""
+
+                welcome_template = self.WELCOME_APPROVED_MULTI if course_count > 1 else self.WELCOME_APPROVED_SINGLE
+                welcome_text = welcome_template.format_map({
+                    'user_name': user_name,
+                    'course_count': course_count,
+                    'course_name': course_name,
+                    'nutrition': nutrition_info
+                })
             else:
                 # User needs to complete questionnaire - check if questionnaire already exists
                 questionnaire_status = quest_req_status['questionnaire_status']
                 current_step = questionnaire_status.get('current_step', 0)
                 total_steps = questionnaire_status.get('total_steps', 21)
                 
-                # CRITICAL DEBUG: Log questionnaire_status raw data for edge case debugging
-                logger.info(f"🔍 QUESTIONNAIRE STATUS DEBUG - User {user_id}")
-                logger.info(f"  Raw questionnaire_status: {questionnaire_status}")
-                logger.info(f"  current_step extracted: {current_step} (type: {type(current_step)})")
-                logger.info(f"  answers count: {len(questionnaire_status.get('answers', {}))}")
-                logger.info(f"  questionnaire keys: {list(questionnaire_status.keys()) if questionnaire_status else 'None'}")
+                # CRITICAL DEBUG: Log questionnaire_status data for edge case debugging
+                if logger.isEnabledFor(logging.DEBUG):
+                    logger.debug("🔍 QUESTIONNAIRE STATUS DEBUG - User %s | current_step: %r | answers: %s | keys: %s",
+                                 user_id, current_step, len(questionnaire_status.get('answers', {})),
+                                 list(questionnaire_status.keys()) if questionnaire_status else None)
                 
                 # ENHANCED DETECTION: Check for existing questionnaire progress
                 has_existing_questionnaire = (
@@ -706,235 +1087,65 @@ class FootballCoachBot:
                 )
                 
                 # DEBUG LOGGING for questionnaire detection
-                await admin_error_handler.log_questionnaire_flow_debug(
-                    user_id=user_id,
-                    context='payment_approved_questionnaire_detection',
-                    questionnaire_data=questionnaire_status or {},
-                    flow_decision=f'has_existing: {has_existing_questionnaire}, step: {current_step}',
-                    details={
+                if debug_details is not None:
+                    debug_context = 'payment_approved_questionnaire_detection'
+                    flow_decision = f'has_existing: {has_existing_questionnaire}, step: {current_step}'
+                    debug_details['phases'].append('questionnaire_detection')
+                    debug_details.update({
                         'current_step': current_step,
                         'total_steps': total_steps,
                         'has_existing_questionnaire': has_existing_questionnaire,
-                        'answer_count': len(questionnaire_status.get('answers', {})),
-                        'questionnaire_status_raw': questionnaire_status,
-                        'decision_path_debug': f'step_check: current_step({current_step}) > 1 = {current_step > 1}, step_equals_1: {current_step == 1}',
-                        'expected_branch': (
-                            'resume_step_gt_1' if (has_existing_questionnaire and current_step > 1) 
-                            else 'existing_step_1' if (has_existing_questionnaire and current_step == 1)
-                            else 'fresh_start'
-                        )
-                    }
-                )
+                        'answer_count': len(questionnaire_status.get('answers', {}))
+                    })
                 
                 if has_existing_questionnaire and current_step > 1:
                     # Resume existing questionnaire from saved progress
-                    current_question = await self.questionnaire_manager.get_current_question(user_id)
-                    if current_question:
-                        # COMPREHENSIVE DEBUG: Track branch execution
-                        logger.info(f"🎯 BRANCH: resume_step_gt_1 - User {user_id} | Step: {current_step} | Question: {current_question.get('step', 'unknown')}")
-                        
-                        # CRITICAL FIX: Set questionnaire_active flag so text input will be processed
-                        if user_id not in context.user_data:
-                            context.user_data[user_id] = {}
-                        context.user_data[user_id]['questionnaire_active'] = True
-                        logger.info(f"✅ SET questionnaire_active flag - User {user_id} resuming at step {current_step}")
-                        
-                        # ROBUST FIX: Also set a timestamp to track when flag was set
-                        context.user_data[user_id]['questionnaire_activated_at'] = datetime.now().isoformat()
-                        
-                        # ADDITIONAL FIX: Verify questionnaire data is immediately available
-                        verification_progress = await self.questionnaire_manager.load_user_progress(user_id)
-                        verification_question = await self.questionnaire_manager.get_current_question(user_id)
-                        logger.info(f"🔧 QUESTIONNAIRE VERIFICATION - User {user_id}: progress={verification_progress is not None}, question={verification_question is not None}")
-                        
-                        # If verification fails, force questionnaire readiness
-                        if not verification_progress or not verification_question:
-                            logger.warning(f"⚠️ QUESTIONNAIRE DATA NOT READY - User {user_id} - attempting to fix")
-                            # Force refresh questionnaire data
-                            await self.questionnaire_manager.start_questionnaire(user_id)
-                            verification_progress = await self.questionnaire_manager.load_user_progress(user_id)
-                            logger.info(f"🔧 AFTER FIX - User {user_id}: progress available = {verification_progress is not None}")
-                        
-                        # DEBUG: Log questionnaire resume activation
-                        await admin_error_handler.log_questionnaire_flow_debug(
-                            user_id=user_id,
-                            context="questionnaire_activated_payment_approved_resume",
-                            questionnaire_data=questionnaire_status,
-                            flow_decision="set_questionnaire_active_flag_resume",
-                            details={
-                                'step': current_step,
-                                'has_question': bool(current_question),
-                                'question_type': current_question.get('type', 'unknown') if current_question else None,
-                                'context_flag_set': True,
-                                'resume_from_step': current_step,
-                                'branch_taken': 'resume_step_gt_1',
-                                'question_step_from_manager': current_question.get('step', 'unknown'),
-                                'question_progress_text_from_manager': current_question.get('progress_text', 'none'),
-                                'verification_progress_available': verification_progress is not None,
-                                'verification_question_available': verification_question is not None
-                            }
-                        )
-                        
-                        # Show current question directly - USE PROGRESS TEXT FROM QUESTION MANAGER
-                        # POTENTIAL FIX: Use progress text from questionnaire manager instead of recalculating
-                        if current_question.get('progress_text'):
-                            progress_text = current_question['progress_text']
-                        else:
-                            progress_text = f"سوال {current_step} از {total_steps}"
-                        message = f"{progress_text}\n\n{current_question['text']}"
-                        
-                        keyboard = []
-                        if current_question.get('type') == 'choice':
-                            choices = current_question.get('choices', [])
-                            for choice in choices:
-                                keyboard.append([InlineKeyboardButton(choice, callback_data=f'q_answer_{choice}')])
-                        keyboard.append([InlineKeyboardButton("🔙 بازگشت به منوی اصلی", callback_data='back_to_user_menu')])
-                        
-                        reply_markup = InlineKeyboardMarkup(keyboard)
-                        welcome_text = f"سلام {user_name}! 👋\n\n✅ پرداخت شما تایید شده است.\n📝 بازگشت به پرسشنامه از جایی که رها کردید\n\n{message}"
-                    else:
-                        # Fallback to continue button if question not found
-                        keyboard = [
-                            [InlineKeyboardButton("📝 ادامه پرسشنامه", callback_data='continue_questionnaire')]
-                        ]
-                        if admin_mode:
-                            keyboard.append([InlineKeyboardButton("🔙 بازگشت به منوی ادمین", callback_data='admin_back_main')])
-                        welcome_text = f"سلام {user_name}! 👋\n\n✅ پرداخت شما تایید شده است.\n📝 پرسشنامه: مرحله {current_step} از {total_steps}\n\nلطفاً پرسشنامه شخصی را تکمیل کنید تا برنامه شخصی‌سازی شده شما آماده شود:"
-                        reply_markup = InlineKeyboardMarkup(keyboard)
+                    branch = 'resume_step_gt_1'
+                    question = await self.questionnaire_manager.get_current_question(user_id)
                 elif has_existing_questionnaire and current_step == 1:
                     # User has a questionnaire at step 1 - show first question
-                    first_question = self.questionnaire_manager.get_question(1, questionnaire_status.get('answers', {}))
-                    if first_question:
-                        # COMPREHENSIVE DEBUG: Track branch execution  
-                        logger.info(f"🎯 BRANCH: existing_step_1 - User {user_id} | Step: {current_step} | Question for step 1")
-                        
-                        # CRITICAL FIX: Set questionnaire_active flag so text input will be processed
-                        if user_id not in context.user_data:
-                            context.user_data[user_id] = {}
-                        context.user_data[user_id]['questionnaire_active'] = True
-                        logger.info(f"✅ SET questionnaire_active flag - User {user_id} in payment_approved flow (existing questionnaire at step 1)")
-                        
-                        # ROBUST FIX: Also set a timestamp to track when flag was set
-                        context.user_data[user_id]['questionnaire_activated_at'] = datetime.now().isoformat()
-                        
-                        # ADDITIONAL FIX: Verify questionnaire data is immediately available for step 1
-                        verification_progress = await self.questionnaire_manager.load_user_progress(user_id)
-                        verification_question = await self.questionnaire_manager.get_current_question(user_id)
-                        logger.info(f"🔧 QUESTIONNAIRE VERIFICATION STEP 1 - User {user_id}: progress={verification_progress is not None}, question={verification_question is not None}")
-                        
-                        # DEBUG: Log comprehensive questionnaire activation state
-                        await admin_error_handler.log_questionnaire_flow_debug(
-                            user_id=user_id,
-                            context="questionnaire_activated_payment_approved_existing",
-                            questionnaire_data=questionnaire_status,
-                            flow_decision="set_questionnaire_active_flag",
-                            details={
-                                'step': 1,
-                                'has_question': bool(first_question),
-                                'question_type': first_question.get('type', 'unknown') if first_question else None,
-                                'context_flag_set': True,
-                                'branch_taken': 'existing_step_1',
-                                'verification_progress_available': verification_progress is not None,
-                                'verification_question_available': verification_question is not None
-                            }
-                        )
-                        
-                        progress_text = "سوال 1 از 21"
-                        # POTENTIAL FIX: If the question returned doesn't match step 1, use its actual progress
-                        if first_question.get('progress_text'):
-                            logger.warning(f"⚠️ PROGRESS TEXT MISMATCH - Expected step 1, got: {first_question.get('progress_text')}")
-                            progress_text = first_question['progress_text']
-                        
-                        message = f"{progress_text}\n\n{first_question['text']}"
-                        
-                        keyboard = []
-                        if first_question.get('type') == 'choice':
-                            choices = first_question.get('choices', [])
-                            for choice in choices:
-                                keyboard.append([InlineKeyboardButton(choice, callback_data=f'q_answer_{choice}')])
-                        keyboard.append([InlineKeyboardButton("🔙 بازگشت به منوی اصلی", callback_data='back_to_user_menu')])
-                        
-                        reply_markup = InlineKeyboardMarkup(keyboard)
-                        welcome_text = f"سلام {user_name}! 👋\n\n✅ پرداخت شما تایید شده است.\n📝 بازگشت به پرسشنامه شخصی‌تان\n\n{message}"
-                    else:
-                        # Fallback if first question not found
-                        keyboard = [
-                            [InlineKeyboardButton("📝 شروع پرسشنامه", callback_data='continue_questionnaire')]
-                        ]
-                        if admin_mode:
-                            keyboard.append([InlineKeyboardButton("🔙 بازگشت به منوی ادمین", callback_data='admin_back_main')])
-                        welcome_text = f"سلام {user_name}! 👋\n\n✅ پرداخت شما تایید شده است.\n📝 لطفاً پرسشنامه شخصی را شروع کنید:"
-                        reply_markup = InlineKeyboardMarkup(keyboard)
+                    branch = 'existing_step_1'
+                    question = self.questionnaire_manager.get_question(1, questionnaire_status.get('answers', {}))
                 else:
                     # No existing questionnaire - start fresh
-                    first_question = self.questionnaire_manager.get_question(1, {})
-                    if first_question:
-                        # COMPREHENSIVE DEBUG: Track branch execution
-                        logger.info(f"🎯 BRANCH: fresh_start - User {user_id} | Starting fresh questionnaire")
-                        
+                    branch = 'fresh_start'
+                    question = self.questionnaire_manager.get_question(1, {})
+                
+                if question:
+                    if branch == 'fresh_start':
                         # Initialize questionnaire for user
                         await self.questionnaire_manager.start_questionnaire(user_id)
-                        
-                        # CRITICAL FIX: Set questionnaire_active flag so text input will be processed
-                        if user_id not in context.user_data:
-                            context.user_data[user_id] = {}
-                        context.user_data[user_id]['questionnaire_active'] = True
-                        logger.info(f"✅ SET questionnaire_active flag - User {user_id} in fresh questionnaire flow")
-                        
-                        # ROBUST FIX: Also set a timestamp to track when flag was set
-                        context.user_data[user_id]['questionnaire_activated_at'] = datetime.now().isoformat()
-                        
-                        # ADDITIONAL FIX: Verify questionnaire data is immediately available after start
-                        verification_progress = await self.questionnaire_manager.load_user_progress(user_id)
-                        verification_question = await self.questionnaire_manager.get_current_question(user_id)
-                        logger.info(f"🔧 QUESTIONNAIRE VERIFICATION FRESH - User {user_id}: progress={verification_progress is not None}, question={verification_question is not None}")
-                        
-                        # DEBUG: Log comprehensive questionnaire activation state
-                        await admin_error_handler.log_questionnaire_flow_debug(
-                            user_id=user_id,
-                            context="questionnaire_activated_payment_approved_fresh",
-                            questionnaire_data={'current_step': 1, 'started': True},
-                            flow_decision="set_questionnaire_active_flag_fresh_start",
-                            details={
-                                'step': 1,
-                                'has_question': bool(first_question),
-                                'question_type': first_question.get('type', 'unknown') if first_question else None,
-                                'context_flag_set': True,
-                                'questionnaire_manager_started': True,
-                                'branch_taken': 'fresh_start',
-                                'verification_progress_available': verification_progress is not None,
-                                'verification_question_available': verification_question is not None
-                            }
-                        )
-                        
-                        progress_text = "سوال 1 از 21"
-                        # POTENTIAL FIX: If the question returned doesn't match step 1, use its actual progress  
-                        if first_question.get('progress_text'):
-                            logger.warning(f"⚠️ PROGRESS TEXT MISMATCH - Expected step 1, got: {first_question.get('progress_text')}")
-                            progress_text = first_question['progress_text']
-                            
-                        message = f"{progress_text}\n\n{first_question['text']}"
-                        
-                        keyboard = []
-                        if first_question.get('type') == 'choice':
-                            choices = first_question.get('choices', [])
-                            for choice in choices:
-                                keyboard.append([InlineKeyboardButton(choice, callback_data=f'q_answer_{choice}')])
-                        keyboard.append([InlineKeyboardButton("🔙 بازگشت به منوی اصلی", callback_data='back_to_user_menu')])
-                        
-                        reply_markup = InlineKeyboardMarkup(keyboard)
-                        welcome_text = f"سلام {user_name}! 👋\n\n✅ پرداخت شما تایید شده است.\n\n📝 حالا وقت تکمیل پرسشنامه است!\n\n{message}"
+                    welcome_text, reply_markup = await self._activate_questionnaire_and_render(
+                        user_id, context, user_name, question, branch,
+                        step=current_step if branch == 'resume_step_gt_1' else 1,
+                        total_steps=total_steps,
+                        debug_details=debug_details
+                    )
+                    if debug_details is not None:
+                        _, debug_context, flow_decision = _QUESTIONNAIRE_BRANCHES[branch]
+                else:
+                    # Fallback to a continue/start button if the question was not found
+                    if branch == 'resume_step_gt_1':
+                        keyboard = [[InlineKeyboardButton("📝 ادامه پرسشنامه", callback_data='continue_questionnaire')]]
+                        welcome_text = f"سلام {user_name}! 👋\n\n✅ پرداخت شما تایید شده است.\n📝 پرسشنامه: مرحله {current_step} از {total_steps}\n\nلطفاً پرسشنامه شخصی را تکمیل کنید تا برنامه شخصی‌سازی شده شما آماده شود:"
+                    elif branch == 'existing_step_1':
+                        keyboard = [[InlineKeyboardButton("📝 شروع پرسشنامه", callback_data='continue_questionnaire')]]
+                        welcome_text = f"سلام {user_name}! 👋\n\n✅ پرداخت شما تایید شده است.\n📝 لطفاً پرسشنامه شخصی را شروع کنید:"
                     else:
-                        # Fallback if first question not found
-                        keyboard = [
-                            [InlineKeyboardButton("📝 شروع پرسشنامه", callback_data='start_questionnaire')]
-                        ]
-                        if admin_mode:
-                            keyboard.append([InlineKeyboardButton("🔙 بازگشت به منوی ادمین", callback_data='admin_back_main')])
+                        keyboard = [[InlineKeyboardButton("📝 شروع پرسشنامه", callback_data='start_questionnaire')]]
                         welcome_text = f"سلام {user_name}! 👋\n\n✅ پرداخت شما تایید شده است.\n📝 برای دریافت برنامه تمرینی، لطفاً پرسشنامه را تکمیل کنید:"
-                        reply_markup = InlineKeyboardMarkup(keyboard)
+                    if admin_mode:
+                        keyboard.append([InlineKeyboardButton("🔙 بازگشت به منوی ادمین", callback_data='admin_back_main')])
+                    reply_markup = InlineKeyboardMarkup(keyboard)
             
-            reply_markup = InlineKeyboardMarkup(keyboard)
+            if debug_details is not None:
+                await admin_error_handler.log_questionnaire_flow_debug(
+                    user_id=user_id,
+                    context=debug_context,
+                    questionnaire_data=questionnaire_status or {},
+                    flow_decision=flow_decision,
+                    details=debug_details
+                )
             
         elif status == 'payment_rejected':
             # Payment was rejected
@@ -984,7 +1195,7 @@ class FootballCoachBot:
             
         else:
             # Returning user without active course - show course selection
-            course_keyboard = await self.create_course_selection_keyboard(user_id)
+            course_keyboard = await self.create_course_selection_keyboard(user_id, payment_summary)
             # Add status button to the existing keyboard
             additional_buttons = [
                 [InlineKeyboardButton("📊 وضعیت من", callback_data='my_status')]
@@ -1001,6 +1212,69 @@ class FootballCoachBot:
         else:
             await update.callback_query.edit_message_text(welcome_text, reply_markup=reply_markup)
     
+    async def _activate_questionnaire_and_render(self, user_id: int, context: ContextTypes.DEFAULT_TYPE, user_name: str,
+                                                 question: dict, branch: str, step: int, total_steps: int,
+                                                 debug_details: dict = None) -> tuple:
+        """
+        Mark the questionnaire active for the user and build the question screen.
+        Shared by the resume / step 1 / fresh start paths of the payment_approved menu.
+        Activation fields are added to debug_details (when given) for the caller's flow record.
+        Returns (welcome_text, reply_markup).
+        """
+        intro_text = _QUESTIONNAIRE_BRANCHES[branch][0]
+        
+        # COMPREHENSIVE DEBUG: Track branch execution
+        logger.info("🎯 BRANCH: %s - User %s | Step: %s | Question: %s", branch, user_id, step, question.get('step', 'unknown'))
+        
+        # CRITICAL FIX: Set questionnaire_active flag so text input will be processed
+        udata = context.user_data.setdefault(user_id, {})
+        udata['questionnaire_active'] = True
+        logger.info(f"✅ SET questionnaire_active flag - User {user_id} ({branch}) at step {step}")
+        
+        # ROBUST FIX: Also set a timestamp to track when flag was set
+        udata['questionnaire_activated_at'] = time.time()
+        
+        # ADDITIONAL FIX: Verify questionnaire data is immediately available (DEBUG_Q_VERIFY=1 only)
+        verification_progress = verification_question = None
+        if self._debug_verify_questionnaire:
+            verification_progress, verification_question = await asyncio.gather(
+                self.questionnaire_manager.load_user_progress(user_id),
+                self.questionnaire_manager.get_current_question(user_id)
+            )
+            logger.info(f"🔧 QUESTIONNAIRE VERIFICATION - User {user_id}: progress={verification_progress is not None}, question={verification_question is not None}")
+            
+            # If verification fails, force questionnaire readiness
+            if not verification_progress or not verification_question:
+                logger.warning(f"⚠️ QUESTIONNAIRE DATA NOT READY - User {user_id} - attempting to fix")
+                # Force refresh questionnaire data
+                await self.questionnaire_manager.start_questionnaire(user_id)
+                verification_progress = await self.questionnaire_manager.load_user_progress(user_id)
+                logger.info(f"🔧 AFTER FIX - User {user_id}: progress available = {verification_progress is not None}")
+        
+        # DEBUG: Record questionnaire activation
+        if debug_details is not None:
+            debug_details['phases'].append('activation')
+            debug_details.update({
+                'step': step,
+                'question_type': question.get('type', 'unknown'),
+                'context_flag_set': True,
+                'branch_taken': branch,
+                'question_step_from_manager': question.get('step', 'unknown'),
+                'question_progress_text_from_manager': question.get('progress_text', 'none'),
+                'verification_progress_available': verification_progress is not None if self._debug_verify_questionnaire else None,
+                'verification_question_available': verification_question is not None if self._debug_verify_questionnaire else None
+            })
+        
+        # Use progress text from questionnaire manager instead of recalculating
+        progress_text = question.get('progress_text') or f"سوال {step} از {total_steps}"
+        message = f"{progress_text}\n\n{question['text']}"
+        
+        choices = question.get('choices', []) if question.get('type') == 'choice' else ()
+        reply_markup = InlineKeyboardMarkup(_build_choice_keyboard(choices))
+        
+        welcome_text = f"سلام {user_name}! 👋\n\n✅ پرداخت شما تایید شده است.\n{intro_text}\n\n{message}"
+        return welcome_text, reply_markup
+    
     async def show_admin_hub_for_start(self, update: Update, context: ContextTypes.DEFAULT_TYPE, user_id: int) -> None:
         """Show the unified admin hub when admin uses /start command"""
         is_super = await self.admin_panel.admin_manager.is_super_admin(user_id)
@@ -1028,8 +1302,11 @@ class FootballCoachBot:
         
         await update.message.reply_text(welcome_text, reply_markup=reply_markup)
     
-    async def get_user_status(self, user_data: dict) -> str:
-        """Determine user's current status based on their data"""
+    async def get_user_status(self, user_data: dict, payment_summary: dict = None) -> str:
+        """
+        Determine user's current status based on their data. Pass a payment_summary from
+        _load_user_payment_summary when the caller needs it too, so payments are read once
+        """
         user_id = user_data.get('user_id')
         
         # Debug logging
@@ -1041,15 +1318,10 @@ class FootballCoachBot:
             logger.debug(f"✅ Status: new_user")
             return 'new_user'
         
-        # Check payment status from the payments table
-        payments_data = await self.data_manager.load_data('payments')
-        user_payment = None
-        
-        # Find the most recent payment for this user
-        for payment_id, payment_data in payments_data.items():
-            if payment_data.get('user_id') == user_id:
-                if user_payment is None or payment_data.get('timestamp', '') > user_payment.get('timestamp', ''):
-                    user_payment = payment_data
+        # Check payment status from the payments table (single pass over the user's payments)
+        if payment_summary is None:
+            payment_summary = await self._load_user_payment_summary(user_id)
+        user_payment = payment_summary['latest_payment']
         
         logger.debug(f"💰 user_payment from DB: {user_payment}")
         
@@ -1082,33 +1354,51 @@ class FootballCoachBot:
             logger.debug(f"✅ Status: returning_user")
             return 'returning_user'
 
-    async def get_user_purchased_courses(self, user_id: int) -> set:
-        """Get set of course types that user has approved payments for"""
-        payments_data = await self.data_manager.load_data('payments')
-        purchased_courses = set()
+    async def _load_user_payment_summary(self, user_id: int) -> dict:
+        """
+        Scan a user's payments once and return the most recent payment and the
+        approved course types (as a set and as a _COURSE_BITS mask)
+        """
+        payments = (await self.data_manager.get_user_payments(user_id)).values()
         
-        for payment_id, payment_data in payments_data.items():
-            if (payment_data.get('user_id') == user_id and 
-                payment_data.get('status') == 'approved'):
-                course_type = payment_data.get('course_type')
-                if course_type:
-                    purchased_courses.add(course_type)
+        # Course types with approved payments
+        purchased_courses = frozenset(
+            p['course_type'] for p in payments
+            if p.get('status') == 'approved' and p.get('course_type')
+        )
+        purchased_mask = 0
+        for course_type in purchased_courses:
+            purchased_mask |= _COURSE_BITS.get(course_type, 0)
         
-        return purchased_courses
+        return {
+            # Most recent payment for this user
+            'latest_payment': max(payments, key=lambda p: p.get('timestamp', ''), default=None),
+            'purchased_courses': purchased_courses,
+            'purchased_mask': purchased_mask
+        }
+
+    async def get_user_purchased_courses(self, user_id: int, payment_summary: dict = None) -> frozenset:
+        """Get set of course types that user has approved payments for"""
+        if payment_summary is None:
+            payment_summary = await self._load_user_payment_summary(user_id)
+        return payment_summary['purchased_courses']
 
-    async def get_user_questionnaire_requirement_status(self, user_id: int) -> dict:
+    async def get_user_questionnaire_requirement_status(self, user_id: int, payment_summary: dict = None) -> dict:
         """
         Determine questionnaire requirement status for a user
         Returns comprehensive status for multi-course scenarios
         """
-        purchased_courses = await self.get_user_purchased_courses(user_id)
-        questionnaire_status = await self.questionnaire_manager.get_user_questionnaire_status(user_id)
-        
-        # Courses that require questionnaire completion
-        courses_requiring_questionnaire = {'in_person_cardio', 'in_person_weights', 'online_cardio', 'online_weights'}
+        if payment_summary is None:
+            payment_summary, questionnaire_status = await asyncio.gather(
+                self._load_user_payment_summary(user_id),
+                self.questionnaire_manager.get_user_questionnaire_status(user_id)
+            )
+        else:
+            questionnaire_status = await self.questionnaire_manager.get_user_questionnaire_status(user_id)
+        purchased_courses = payment_summary['purchased_courses']
         
         # Check if user has any courses that require questionnaire
-        requires_questionnaire = bool(purchased_courses & courses_requiring_questionnaire)
+        requires_questionnaire = bool(purchased_courses & _COURSES_REQUIRING_QUESTIONNAIRE)
         
         questionnaire_completed = questionnaire_status.get('completed', False)
         questionnaire_in_progress = (questionnaire_status.get('current_step', 0) > 0 and 
@@ -1116,6 +1406,7 @@ class FootballCoachBot:
         
         return {
             'purchased_courses': purchased_courses,
+            'purchased_mask': payment_summary['purchased_mask'],
             'requires_questionnaire': requires_questionnaire,
             'questionnaire_completed': questionnaire_completed,
             'questionnaire_in_progress': questionnaire_in_progress,
@@ -1126,149 +1417,110 @@ class FootballCoachBot:
 
     async def has_purchased_course(self, user_id: int, course_type: str) -> bool:
         """Check if user has purchased a specific course"""
-        purchased_courses = await self.get_user_purchased_courses(user_id)
-        return course_type in purchased_courses
-
-    async def create_course_selection_keyboard(self, user_id: int = None) -> InlineKeyboardMarkup:
-        """Create course selection keyboard with tick marks for purchased courses"""
-        # If no user_id provided, show basic menu without tick marks
-        if user_id is None:
+        return course_type in await self.get_user_purchased_courses(user_id)
+
+    def _course_menu_markup(self, buttons: tuple, purchased_courses, with_back: bool = True) -> InlineKeyboardMarkup:
+        """Course menu with tick marks on purchased entries, built once per ownership combination"""
+        owned = tuple(callback_data in purchased_courses for _, callback_data in buttons)
+        key = (buttons, owned, with_back)
+        markup = self._course_menu_markups.get(key)
+        if markup is None:
             keyboard = [
-                [InlineKeyboardButton("1️⃣ دوره تمرین حضوری", callback_data='in_person')],
-                [InlineKeyboardButton("2️⃣ دوره تمرین آنلاین", callback_data='online')],
-                [InlineKeyboardButton("3️⃣ برنامه غذایی", callback_data='nutrition_plan')]
+                [InlineKeyboardButton(f"{text} ✅" if is_owned else text, callback_data=callback_data)]
+                for (text, callback_data), is_owned in zip(buttons, owned)
             ]
-        else:
-            # Get purchased courses to add tick marks only for specific purchased courses
+            if with_back:
+                keyboard.append([InlineKeyboardButton("🔙 بازگشت به انتخاب دوره", callback_data='back_to_course_selection')])
+            markup = self._course_menu_markups[key] = InlineKeyboardMarkup(keyboard)
+        return markup
+
+    async def _show_course_submenu(self, query, user_id: int, course_buttons: tuple, purchased_courses=None) -> None:
+        """Show an online / in-person course list with tick marks for purchased courses"""
+        if purchased_courses is None:
             purchased_courses = await self.get_user_purchased_courses(user_id)
-            
-            in_person_text = "1️⃣ دوره تمرین حضوری"
-            online_text = "2️⃣ دوره تمرین آنلاین"
-            nutrition_text = "3️⃣ برنامه غذایی"
-            
-            # Add checkmarks for purchased courses
-            if 'nutrition_plan' in purchased_courses:
-                nutrition_text += " ✅"
-            
-            keyboard = [
-                [InlineKeyboardButton(in_person_text, callback_data='in_person')],
-                [InlineKeyboardButton(online_text, callback_data='online')],
-                [InlineKeyboardButton(nutrition_text, callback_data='nutrition_plan')]
-            ]
-        
-        return InlineKeyboardMarkup(keyboard)
+        reply_markup = self._course_menu_markup(course_buttons, purchased_courses)
+        await query.edit_message_text("انتخاب کنید:", reply_markup=reply_markup)
+
+    async def create_course_selection_keyboard(self, user_id: int = None, payment_summary: dict = None) -> InlineKeyboardMarkup:
+        """Create course selection keyboard with tick marks for purchased courses"""
+        # If no user_id provided, show basic menu without tick marks
+        purchased_courses = await self.get_user_purchased_courses(user_id, payment_summary) if user_id is not None else ()
+        return self._course_menu_markup(_COURSE_CATEGORY_BUTTONS, purchased_courses, with_back=False)
 
     async def handle_main_menu(self, update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
         """Handle main menu selections"""
         query = update.callback_query
-        await query.answer()
         user_id = update.effective_user.id
         user_name = update.effective_user.first_name or "کاربر"
         
-        # Clear all input states when navigating to main menu categories
-        states_cleared = await admin_error_handler.clear_all_input_states(
-            context, user_id, "handle_main_menu"
-        )
-        
         log_user_action(user_id, user_name, f"selected menu option: {query.data}")
         
-        if query.data == 'in_person':
-            # Check which courses user has purchased
-            purchased_courses = await self.get_user_purchased_courses(user_id)
-            
-            # Create buttons with tick marks for purchased courses
-            cardio_text = "1️⃣ تمرین هوازی سرعتی چابکی کار با توپ"
-            weights_text = "2️⃣ تمرین وزنه"
-            
-            if 'in_person_cardio' in purchased_courses:
-                cardio_text += " ✅"
-            if 'in_person_weights' in purchased_courses:
-                weights_text += " ✅"
-            
-            keyboard = [
-                [InlineKeyboardButton(cardio_text, callback_data='in_person_cardio')],
-                [InlineKeyboardButton(weights_text, callback_data='in_person_weights')],
-                [InlineKeyboardButton("🔙 بازگشت به انتخاب دوره", callback_data='back_to_course_selection')]
-            ]
-            reply_markup = InlineKeyboardMarkup(keyboard)
-            await query.edit_message_text("انتخاب کنید:", reply_markup=reply_markup)
-            
-        elif query.data == 'online':
-            # Check which courses user has purchased
-            purchased_courses = await self.get_user_purchased_courses(user_id)
-            
-            # Create buttons with tick marks for purchased courses
-            weights_text = "1️⃣ برنامه وزنه"
-            cardio_text = "2️⃣ برنامه هوازی و کار با توپ"
-            combo_text = "3️⃣ برنامه وزنه + برنامه هوازی (با تخفیف بیشتر)"
-            
-            if 'online_weights' in purchased_courses:
-                weights_text += " ✅"
-            if 'online_cardio' in purchased_courses:
-                cardio_text += " ✅"
-            if 'online_combo' in purchased_courses:
-                combo_text += " ✅"
+        course_buttons = _COURSE_SUBMENU_BUTTONS.get(query.data)
+        if course_buttons:
+            # Answer the callback, clear all input states and load the purchased courses for
+            # the tick marks together - none of them depends on the others
+            _, states_cleared, purchased_courses = await asyncio.gather(
+                query.answer(),
+                admin_error_handler.clear_all_input_states(context, user_id, "handle_main_menu"),
+                self.get_user_purchased_courses(user_id)
+            )
+            await self._show_course_submenu(query, user_id, course_buttons, purchased_courses)
             
-            keyboard = [
-                [InlineKeyboardButton(weights_text, callback_data='online_weights')],
-                [InlineKeyboardButton(cardio_text, callback_data='online_cardio')],
-                [InlineKeyboardButton(combo_text, callback_data='online_combo')],
-                [InlineKeyboardButton("🔙 بازگشت به انتخاب دوره", callback_data='back_to_course_selection')]
-            ]
-            reply_markup = InlineKeyboardMarkup(keyboard)
-            await query.edit_message_text("انتخاب کنید:", reply_markup=reply_markup)
+        else:
+            await asyncio.gather(
+                query.answer(),
+                admin_error_handler.clear_all_input_states(context, user_id, "handle_main_menu")
+            )
             
-        elif query.data == 'nutrition_plan':
-            # Handle nutrition plan selection directly
-            await self.handle_course_details(update, context)
+            if query.data == 'nutrition_plan':
+                # Handle nutrition plan selection directly
+                await self.handle_course_details(update, context)
 
     async def handle_course_details(self, update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
         """Handle detailed course information"""
         query = update.callback_query
         user_id = update.effective_user.id
         
-        # Clear all input states when navigating to course details (this includes navigation back from coupon panel)
-        states_cleared = await admin_error_handler.clear_all_input_states(
-            context, user_id, "handle_course_details"
+        course_info = Config.COURSE_INFO.get(query.data)
+        if course_info is None:
+            # Clear all input states when navigating to course details (this includes navigation back from coupon panel)
+            await admin_error_handler.clear_all_input_states(context, user_id, "handle_course_details")
+            return
+        
+        # Clear input states and check if user already owns this course - independent, so run together
+        states_cleared, purchased_courses = await asyncio.gather(
+            admin_error_handler.clear_all_input_states(context, user_id, "handle_course_details"),
+            self.get_user_purchased_courses(user_id)
         )
         
-        if query.data in Config.COURSE_DETAILS:
-            # Check if user already owns this course
-            if await self.has_purchased_course(user_id, query.data):
-                await query.answer(
-                    "✅ شما قبلاً این دوره را خریداری کرده‌اید!\n"
-                    "برای دسترسی به برنامه تمرینی خود از منو استفاده کنید.",
-                    show_alert=True
-                )
-                return
-            
-            await query.answer()
-            
-            course = Config.COURSE_DETAILS[query.data]
-            price = Config.PRICES[query.data]
-            
-            # Format price properly using the utility function
-            price_text = Config.format_price(price)
-            
-            message_text = f"{course['title']}👇👇👇👇👇\n\n{course['description']}"
-            
-            keyboard = [
-                [InlineKeyboardButton(f"💳 پرداخت و ثبت نام ({price_text})", callback_data=f'payment_{query.data}')],
-                [InlineKeyboardButton("🏷️ کد تخفیف دارم", callback_data=f'coupon_{query.data}')]
-            ]
-            
-            # Add appropriate back button based on course type
-            if query.data == 'nutrition_plan':
-                keyboard.append([InlineKeyboardButton("🔙 بازگشت به انتخاب دوره", callback_data='back_to_course_selection')])
-            elif query.data.startswith('online'):
-                keyboard.append([InlineKeyboardButton("🔙 بازگشت به دوره‌های آنلاین", callback_data='back_to_online')])
-            elif query.data.startswith('in_person'):
-                keyboard.append([InlineKeyboardButton("🔙 بازگشت به دوره‌های حضوری", callback_data='back_to_in_person')])
-                
-            keyboard.append([InlineKeyboardButton("🏠 منوی اصلی", callback_data='back_to_user_menu')])
-            
-            reply_markup = InlineKeyboardMarkup(keyboard)
-            await query.edit_message_text(message_text, reply_markup=reply_markup)
+        if query.data in purchased_courses:
+            await query.answer(
+                "✅ شما قبلاً این دوره را خریداری کرده‌اید!\n"
+                "برای دسترسی به برنامه تمرینی خود از منو استفاده کنید.",
+                show_alert=True
+            )
+            return
+        
+        await query.answer()
+        
+        course, _, price_text = course_info
+        
+        message_text = self.COURSE_DETAILS_TEMPLATE.format_map(course)
+        
+        keyboard = [
+            [InlineKeyboardButton(f"💳 پرداخت و ثبت نام ({price_text})", callback_data=f'payment_{query.data}')],
+            [InlineKeyboardButton("🏷️ کد تخفیف دارم", callback_data=f'coupon_{query.data}')]
+        ]
+        
+        # Add appropriate back button based on course type
+        back_row = _COURSE_BACK_ROWS.get(query.data)
+        if back_row:
+            keyboard.append(back_row)
+        
+        keyboard.append([InlineKeyboardButton("🏠 منوی اصلی", callback_data='back_to_user_menu')])
+        
+        reply_markup = InlineKeyboardMarkup(keyboard)
+        await query.edit_message_text(message_text, reply_markup=reply_markup)
 
     async def handle_coupon_request(self, update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
         """Handle coupon code request"""
@@ -1291,16 +1543,15 @@ class FootballCoachBot:
         )
         
         # Store that we're waiting for coupon code
-        if user_id not in context.user_data:
-            context.user_data[user_id] = {}
-        context.user_data[user_id]['waiting_for_coupon'] = True
-        context.user_data[user_id]['coupon_course'] = course_type
+        ud = context.user_data.setdefault(user_id, {})
+        ud['waiting_for_coupon'] = True
+        ud['coupon_course'] = course_type
 
     async def handle_coupon_code(self, update: Update, context: ContextTypes.DEFAULT_TYPE, coupon_code: str) -> None:
         """Handle coupon code validation and processing"""
         user_id = update.effective_user.id
-        user_context = context.user_data.get(user_id, {})
-        course_type = user_context.get('coupon_course')
+        ud = context.user_data.setdefault(user_id, {})
+        course_type = ud.get('coupon_course')
         
         # Safety check: Ensure we have valid coupon context
         if not course_type:
@@ -1311,30 +1562,28 @@ class FootballCoachBot:
             await update.message.reply_text(
                 "❌ خطایی در حالت کد تخفیف رخ داده است.\n\n"
                 "🏠 به منوی اصلی بازگردید و مجددا تلاش کنید.",
-                reply_markup=InlineKeyboardMarkup([
-                    [InlineKeyboardButton("🏠 منوی اصلی", callback_data='back_to_user_menu')]
-                ])
+                reply_markup=self.HOME_ONLY_MARKUP
             )
             return
         
         # Clear coupon waiting state for this specific user
-        if user_id not in context.user_data:
-            context.user_data[user_id] = {}
-        context.user_data[user_id]['waiting_for_coupon'] = False
-        if 'coupon_course' in context.user_data[user_id]:
-            del context.user_data[user_id]['coupon_course']
+        ud['waiting_for_coupon'] = False
+        ud.pop('coupon_course', None)
         
         if not course_type:
             await update.message.reply_text(
                 "❌ خطایی رخ داده است. لطفاً مجدداً دوره را انتخاب کنید.",
-                reply_markup=InlineKeyboardMarkup([
-                    [InlineKeyboardButton("🏠 منوی اصلی", callback_data='back_to_user_menu')]
-                ])
+                reply_markup=self.HOME_ONLY_MARKUP
             )
             return
         
-        # Validate coupon
-        is_valid, message, discount_percent = self.coupon_manager.validate_coupon(coupon_code.strip().upper())
+        # Validate coupon - oversized input can't be a real code, so skip normalizing/looking it up
+        if len(coupon_code) > _MAX_COUPON_CODE_LENGTH:
+            code = None
+            is_valid, message, discount_percent = False, "کد تخفیف معتبر نیست", 0
+        else:
+            code = coupon_code.strip().upper()
+            is_valid, message, discount_percent = self.coupon_manager.validate_coupon(code)
         
         if not is_valid:
             # Show error and offer to continue without coupon
@@ -1357,11 +1606,11 @@ class FootballCoachBot:
         
         # Calculate discounted price
         original_price = Config.PRICES.get(course_type, 0)
-        final_price, discount_amount = self.coupon_manager.calculate_discounted_price(original_price, coupon_code.strip().upper())
+        final_price, discount_amount = self.coupon_manager.calculate_discounted_price(original_price, code)
         
         # Store coupon for this user
         self.user_coupon_codes[user_id] = {
-            'code': coupon_code.strip().upper(),
+            'code': code,
             'discount_percent': discount_percent,
             'discount_amount': discount_amount,
             'course_type': course_type
@@ -1378,11 +1627,13 @@ class FootballCoachBot:
         ]
         
         await update.message.reply_text(
-            f"✅ {message}\n\n"
-            f"💰 قیمت اصلی: {original_price_text}\n"
-            f"🏷️ تخفیف ({discount_percent}%): -{discount_amount_text}\n"
-            f"💳 قیمت نهایی: {final_price_text}\n\n"
-            f"🎉 شما {discount_amount_text} صرفه‌جویی کردید!",
+            self.COUPON_SUCCESS_TEMPLATE.format_map({
+                'message': message,
+                'orig': original_price_text,
+                'pct': discount_percent,
+                'disc': discount_amount_text,
+                'final': final_price_text
+            }),
             reply_markup=InlineKeyboardMarkup(keyboard)
         )
 
@@ -1390,14 +1641,68 @@ class FootballCoachBot:
     # ADMIN PLAN UPLOAD HANDLERS
     # =====================================
     
+    def _log_plan_upload_workflow(self, admin_id: int, step: str, plan_data: dict = None, success: bool = None):
+        """Log a plan upload step now and queue its audit entry for the background writer"""
+        self._admin_log_queue.put_nowait(
+            admin_error_handler.plan_upload_workflow_entry(admin_id, step, plan_data, success)
+        )
+    
+    async def _drain_admin_log_queue(self, max_batch: int = 50, flush_interval: float = 0.5):
+        """
+        Persist queued admin audit entries in batches (one audit file rewrite per batch).
+        A None entry (queued by shutdown) flushes the current batch and stops the writer.
+        """
+        stopping = False
+        while not stopping:
+            entry = await self._admin_log_queue.get()
+            if entry is None:
+                break
+            batch = [entry]
+            deadline = time.monotonic() + flush_interval
+            while len(batch) < max_batch:
+                timeout = deadline - time.monotonic()
+                if timeout <= 0:
+                    break
+                try:
+                    entry = await asyncio.wait_for(self._admin_log_queue.get(), timeout)
+                except asyncio.TimeoutError:
+                    break
+                if entry is None:
+                    stopping = True
+                    break
+                batch.append(entry)
+            # One failed save must not kill the writer - later audits would pile up unwritten
+            try:
+                await admin_error_handler.save_admin_logs(batch)
+            except Exception as e:
+                logger.error(f"❌ Failed to save {len(batch)} admin audit entries: {e}")
+    
+    async def shutdown(self):
+        """Flush queued admin audit entries and stop the background writer (application post_shutdown)"""
+        if self._admin_log_task is None:
+            return
+        self._admin_log_queue.put_nowait(None)
+        try:
+            await asyncio.wait_for(self._admin_log_task, timeout=10.0)
+        except asyncio.TimeoutError:
+            logger.warning("⚠️ Admin audit writer did not finish within 10s - cancelled")
+        except Exception as e:
+            logger.error(f"❌ Admin audit writer failed during shutdown: {e}")
+        self._admin_log_task = None
+    
+    @staticmethod
+    def _parse_json_file(path: str) -> dict:
+        """Read and parse a JSON file (blocking - run via asyncio.to_thread)"""
+        with open(path, 'rb') as f:
+            content = f.read()
+        return orjson.loads(content) if content else {}
+    
     async def handle_plan_upload_text(self, update: Update, context: ContextTypes.DEFAULT_TYPE, text: str) -> None:
         """Handle text input during plan upload process"""
         user_id = update.effective_user.id
         admin_context = context.user_data.get(user_id, {})
         
         # UNIFIED INPUT TYPE VALIDATION for admin operations
-        from utils.input_validator import input_validator
-        
         upload_step = admin_context.get('plan_upload_step')
         
         # Validate that text input is appropriate for this step
@@ -1421,25 +1726,16 @@ class FootballCoachBot:
         
         if upload_step == 'title':
             # Store the title and ask for file
-            context.user_data[user_id]['plan_title'] = text
-            context.user_data[user_id]['plan_upload_step'] = 'file'
-            
-            course_names = {
-                'online_weights': '🏋️ وزنه آنلاین',
-                'online_cardio': '🏃 هوازی آنلاین',
-                'online_combo': '💪 ترکیبی آنلاین',
-                'in_person_cardio': '🏃‍♂️ هوازی حضوری',
-                'in_person_weights': '🏋️‍♀️ وزنه حضوری'
-            }
+            admin_context['plan_title'] = text
+            admin_context['plan_upload_step'] = 'file'
             
-            course_name = course_names.get(course_type, course_type)
+            course_name = _COURSE_DISPLAY_NAMES.get(course_type, course_type)
             
             # Add target user info if uploading for specific user
             user_info = ""
             if target_user_id:
                 try:
-                    with open('bot_data.json', 'r', encoding='utf-8') as f:
-                        bot_data = json.load(f)
+                    bot_data = await self.admin_panel.data_manager.read_bot_data_snapshot()
                     user_data = bot_data.get('users', {}).get(target_user_id, {})
                     user_name = user_data.get('name', 'نامشخص')
                     user_info = f"\n👤 برای کاربر: {user_name}"
@@ -1458,10 +1754,10 @@ class FootballCoachBot:
             
         elif upload_step == 'description':
             # Store the description and complete upload
-            context.user_data[user_id]['plan_description'] = text
+            admin_context['plan_description'] = text
             
             # Log description received
-            await admin_error_handler.log_plan_upload_workflow(
+            self._log_plan_upload_workflow(
                 admin_id=user_id, 
                 step='description_received',
                 plan_data={'description': text[:50] + '...' if len(text) > 50 else text}
@@ -1471,19 +1767,18 @@ class FootballCoachBot:
             
         elif upload_step == 'file' and text:
             # Handle direct text input as plan content
-            context.user_data[user_id]['plan_content'] = text
-            context.user_data[user_id]['plan_content_type'] = 'text'
-            context.user_data[user_id]['plan_upload_step'] = 'description'
+            admin_context['plan_content'] = text
+            admin_context['plan_content_type'] = 'text'
+            admin_context['plan_upload_step'] = 'description'
             
             # Log text content received
-            await admin_error_handler.log_plan_upload_workflow(
+            self._log_plan_upload_workflow(
                 admin_id=user_id, 
                 step='text_content_received',
                 plan_data={'content_type': 'text', 'content_length': len(text)}
             )
             
-            keyboard = [[InlineKeyboardButton("⏩ رد کردن توضیحات", callback_data='skip_plan_description')]]
-            reply_markup = InlineKeyboardMarkup(keyboard)
+            reply_markup = self.SKIP_PLAN_DESCRIPTION_MARKUP
             
             await update.message.reply_text(
                 "✅ محتوای برنامه دریافت شد!\n\n"
@@ -1508,10 +1803,12 @@ class FootballCoachBot:
             filename = document.file_name or "plan_file"
             
             # Validate file type (similar to questionnaire system)
-            if filename.lower().endswith(('.pdf', '.txt', '.doc', '.docx')):
+            _, dot, ext = filename.rpartition('.')
+            ext = ext.lower()
+            if dot and ext in _ALLOWED_PLAN_EXTS:
                 # Download and save file locally
                 from managers.plan_file_manager import plan_file_manager
-                course_type = context.user_data[user_id].get('plan_course_type', 'general')
+                course_type = admin_context.get('plan_course_type', 'general')
                 
                 file_info = await plan_file_manager.download_and_save_plan(
                     bot=context.bot,
@@ -1536,12 +1833,12 @@ class FootballCoachBot:
                     )
                     
                     # Store both file_id and local path
-                    context.user_data[user_id]['plan_content'] = document.file_id
-                    context.user_data[user_id]['plan_local_path'] = file_info['local_path']
-                    context.user_data[user_id]['plan_content_type'] = 'document'
-                    context.user_data[user_id]['plan_filename'] = filename
-                    context.user_data[user_id]['plan_file_size'] = file_info['file_size']
-                    context.user_data[user_id]['plan_upload_step'] = 'description'
+                    admin_context['plan_content'] = document.file_id
+                    admin_context['plan_local_path'] = file_info['local_path']
+                    admin_context['plan_content_type'] = 'document'
+                    admin_context['plan_filename'] = filename
+                    admin_context['plan_file_size'] = file_info['file_size']
+                    admin_context['plan_upload_step'] = 'description'
                 else:
                     await update.message.reply_text(
                         "❌ خطا در دانلود و ذخیره فایل!\n\n"
@@ -1550,10 +1847,9 @@ class FootballCoachBot:
                     return
                 
                 # Get file type for user feedback
-                file_extension = filename.split('.')[-1].upper()
+                file_extension = ext.upper()
                 
-                keyboard = [[InlineKeyboardButton("⏩ رد کردن توضیحات", callback_data='skip_plan_description')]]
-                reply_markup = InlineKeyboardMarkup(keyboard)
+                reply_markup = self.SKIP_PLAN_DESCRIPTION_MARKUP
                 
                 await update.message.reply_text(
                     f"✅ فایل {file_extension} دریافت شد: {filename}\n\n"
@@ -1606,7 +1902,7 @@ class FootballCoachBot:
             
             # Download and save photo locally
             from managers.plan_file_manager import plan_file_manager
-            course_type = context.user_data[user_id].get('plan_course_type', 'general')
+            course_type = admin_context.get('plan_course_type', 'general')
             
             # Generate a filename for the photo
             filename = f"plan_photo_{int(datetime.now().timestamp())}.jpg"
@@ -1624,12 +1920,12 @@ class FootballCoachBot:
             
             if file_info:
                 # Store both file_id and local path
-                context.user_data[user_id]['plan_content'] = photo.file_id
-                context.user_data[user_id]['plan_local_path'] = file_info['local_path']
-                context.user_data[user_id]['plan_content_type'] = 'photo'
-                context.user_data[user_id]['plan_filename'] = filename
-                context.user_data[user_id]['plan_file_size'] = file_info['file_size']
-                context.user_data[user_id]['plan_upload_step'] = 'description'
+                admin_context['plan_content'] = photo.file_id
+                admin_context['plan_local_path'] = file_info['local_path']
+                admin_context['plan_content_type'] = 'photo'
+                admin_context['plan_filename'] = filename
+                admin_context['plan_file_size'] = file_info['file_size']
+                admin_context['plan_upload_step'] = 'description'
             else:
                 await update.message.reply_text(
                     "❌ خطا در دانلود و ذخیره عکس!\n\n"
@@ -1637,8 +1933,7 @@ class FootballCoachBot:
                 )
                 return True
             
-            keyboard = [[InlineKeyboardButton("⏩ رد کردن توضیحات", callback_data='skip_plan_description')]]
-            reply_markup = InlineKeyboardMarkup(keyboard)
+            reply_markup = self.SKIP_PLAN_DESCRIPTION_MARKUP
             
             await update.message.reply_text(
                 f"✅ تصویر برنامه دریافت شد!\n\n"
@@ -1667,26 +1962,12 @@ class FootballCoachBot:
         # Create plan data with improved plan_id generation
         existing_plans = await self.admin_panel.load_course_plans(course_type)
         
-        # Generate unique plan_id with duplicate checking
-        import uuid
-        plan_id = None
-        max_attempts = 10
-        attempt = 0
-        
-        while plan_id is None and attempt < max_attempts:
-            # Generate candidate ID
-            candidate_id = str(uuid.uuid4())[:8]
-            
-            # Check if this ID already exists
-            id_exists = any(plan.get('id') == candidate_id for plan in existing_plans)
-            
-            if not id_exists:
-                plan_id = candidate_id
-            else:
-                attempt += 1
+        # Generate unique plan_id with duplicate checking (32-bit random space, so one try is enough)
+        existing_ids = {plan.get('id') for plan in existing_plans}
+        plan_id = str(uuid.uuid4())[:8]
         
-        # Fallback if all attempts failed
-        if plan_id is None:
+        # Fallback on the (vanishingly rare) collision
+        if plan_id in existing_ids:
             plan_id = f"{course_type}_{int(time.time())}"
         
         plan_data = {
@@ -1696,27 +1977,27 @@ class FootballCoachBot:
             'content_type': content_type,
             'filename': filename,
             'description': description,
-            'created_at': datetime.now().isoformat(),
+            'created_at': _now_iso(),
             'created_by': user_id
         }
         
         # Add local file path if available
-        local_path = context.user_data[user_id].get('plan_local_path')
+        local_path = admin_context.get('plan_local_path')
         if local_path:
             plan_data['local_path'] = local_path
-            plan_data['file_size'] = context.user_data[user_id].get('plan_file_size', 0)
+            plan_data['file_size'] = admin_context.get('plan_file_size', 0)
         
         # If uploading for specific user, add user-specific info
         if target_user_id:
             plan_data['target_user_id'] = target_user_id
             plan_data['is_user_specific'] = True
         
-        # Load existing plans and add new one
-        plans_before = await self.admin_panel.load_course_plans(course_type)
+        # Add new plan to the plans loaded above
+        plans_before = existing_plans
         plans_before_count = len(plans_before)
         
         # Log save attempt
-        await admin_error_handler.log_plan_upload_workflow(
+        self._log_plan_upload_workflow(
             admin_id=user_id,
             step='save_attempt',
             plan_data={'title': title, 'course_type': course_type, 'target_user_id': target_user_id}
@@ -1729,13 +2010,16 @@ class FootballCoachBot:
         success = await self.admin_panel.save_course_plans(course_type, plans_before)
         logger.info(f"💾 SAVE RETURNED - success={success}")
         
-        # Verify save by loading again
-        plans_after = await self.admin_panel.load_course_plans(course_type)
-        plans_after_count = len(plans_after)
+        # Verify save by loading again - only needed when the save reported a failure
+        if success:
+            plans_after_count = len(plans_before)
+        else:
+            plans_after = await self.admin_panel.load_course_plans(course_type)
+            plans_after_count = len(plans_after)
         logger.info(f"🔍 VERIFICATION - plans_before={plans_before_count}, plans_after={plans_after_count}")
         
         # Log save result
-        await admin_error_handler.log_plan_upload_workflow(
+        self._log_plan_upload_workflow(
             admin_id=user_id,
             step='save_result',
             plan_data={
@@ -1749,15 +2033,7 @@ class FootballCoachBot:
         )
         
         if success:
-            course_names = {
-                'online_weights': '🏋️ وزنه آنلاین',
-                'online_cardio': '🏃 هوازی آنلاین',
-                'online_combo': '💪 ترکیبی آنلاین',
-                'in_person_cardio': '🏃‍♂️ هوازی حضوری',
-                'in_person_weights': '🏋️‍♀️ وزنه حضوری'
-            }
-            
-            course_name = course_names.get(course_type, course_type)
+            course_name = _COURSE_DISPLAY_NAMES.get(course_type, course_type)
             
             # Different back button based on workflow with better navigation options
             if target_user_id:
@@ -1792,18 +2068,7 @@ class FootballCoachBot:
             )
         
         # Clear upload state (both old and new workflow fields)
-        if user_id in context.user_data:
-            context.user_data[user_id].pop('uploading_plan', None)
-            context.user_data[user_id].pop('uploading_user_plan', None)
-            context.user_data[user_id].pop('plan_course_type', None)
-            context.user_data[user_id].pop('plan_course_code', None)
-            context.user_data[user_id].pop('plan_user_id', None)
-            context.user_data[user_id].pop('plan_upload_step', None)
-            context.user_data[user_id].pop('plan_title', None)
-            context.user_data[user_id].pop('plan_content', None)
-            context.user_data[user_id].pop('plan_content_type', None)
-            context.user_data[user_id].pop('plan_filename', None)
-            context.user_data[user_id].pop('plan_description', None)
+        await admin_error_handler.clear_admin_plan_upload_states(context, user_id, "upload_completed")
 
     async def handle_payment(self, update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
         """Handle payment process - go directly to payment"""
@@ -1823,29 +2088,28 @@ class FootballCoachBot:
             course_type = query.data.replace('payment_', '')
         
         # 🚫 DUPLICATE PURCHASE PREVENTION (only for same course)
+        # One lookup answers both "already approved" and "still pending" for this course
+        purchase_status = await self._get_purchase_status(user_id, course_type)
+        
         # Check if user already has an approved payment for this course
-        if await self.check_duplicate_purchase(user_id, course_type):
+        if purchase_status == 'approved':
             await query.edit_message_text(
                 "⚠️ شما قبلاً این دوره را خریداری کرده‌اید!\n\n"
                 "✅ پرداخت شما تایید شده و دسترسی فعال است.\n\n"
                 "📋 اگر پرسشنامه را تکمیل نکرده‌اید، لطفاً تکمیل کنید.\n"
                 "📞 برای سوالات بیشتر با پشتیبانی @DrBohloul تماس بگیرید.",
-                reply_markup=InlineKeyboardMarkup([
-                    [InlineKeyboardButton("🔙 بازگشت به انتخاب دوره", callback_data='back_to_course_selection')]
-                ])
+                reply_markup=self.BACK_TO_COURSE_SELECTION_MARKUP
             )
             return
         
         # Check if user has a pending payment for this specific course
-        if await self.check_pending_purchase(user_id, course_type):
+        if purchase_status == 'pending_approval':
             await query.edit_message_text(
                 "⏳ شما قبلاً برای این دوره پرداخت کرده‌اید!\n\n"
                 "🔍 پرداخت شما در حال بررسی توسط ادمین است.\n"
                 "📱 از نتیجه بررسی مطلع خواهید شد.\n\n"
                 "💡 اگر نیاز به پرداخت مجدد دارید، ابتدا با پشتیبانی @DrBohloul تماس بگیرید.",
-                reply_markup=InlineKeyboardMarkup([
-                    [InlineKeyboardButton("🔙 بازگشت به انتخاب دوره", callback_data='back_to_course_selection')]
-                ])
+                reply_markup=self.BACK_TO_COURSE_SELECTION_MARKUP
             )
             return
         
@@ -1855,48 +2119,28 @@ class FootballCoachBot:
         # For additional course purchases, store in context
         user_context = context.user_data.get(user_id, {})
         if user_context.get('buying_additional_course'):
-            context.user_data[user_id]['current_course_selection'] = course_type
+            user_context['current_course_selection'] = course_type
         
         # Go directly to payment details (questionnaire comes after approval)
         await self.show_payment_details(update, context, course_type)
 
-    async def check_duplicate_purchase(self, user_id: int, course_type: str) -> bool:
-        """Check if user already has an approved payment for this course"""
-        try:
-            with open('bot_data.json', 'r', encoding='utf-8') as f:
-                data = json.load(f)
-            
-            payments = data.get('payments', {})
-            
-            for payment_data in payments.values():
-                if (payment_data.get('user_id') == user_id and 
-                    payment_data.get('course_type') == course_type and 
-                    payment_data.get('status') == 'approved'):
-                    return True
-            
-            return False
-        except Exception as e:
-            logger.error(f"Error checking duplicate purchase: {e}")
-            return False
-
-    async def check_pending_purchase(self, user_id: int, course_type: str) -> bool:
-        """Check if user has a pending payment for this course"""
+    async def _get_purchase_status(self, user_id: int, course_type: str):
+        """
+        Return 'approved' if the user already bought this course, 'pending_approval' if a
+        payment for it awaits review, otherwise None (approved wins over pending)
+        """
         try:
-            with open('bot_data.json', 'r', encoding='utf-8') as f:
-                data = json.load(f)
-            
-            payments = data.get('payments', {})
-            
-            for payment_data in payments.values():
-                if (payment_data.get('user_id') == user_id and 
-                    payment_data.get('course_type') == course_type and 
-                    payment_data.get('status') == 'pending_approval'):
-                    return True
-            
-            return False
+            # (user_id, course_type) -> statuses index in the data manager, no scan of the payments
+            statuses = await self.data_manager.get_payment_statuses(user_id, course_type)
         except Exception as e:
-            logger.error(f"Error checking pending purchase: {e}")
-            return False
+            logger.error(f"Error checking purchase status: {e}")
+            return None
+        
+        if 'approved' in statuses:
+            return 'approved'
+        if 'pending_approval' in statuses:
+            return 'pending_approval'
+        return None
 
     async def handle_csv_import(self, update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
         """Handle CSV file imports for admins"""
@@ -1922,68 +2166,89 @@ class FootballCoachBot:
             await update.message.reply_text("❌ حجم فایل نباید بیشتر از ۵ مگابایت باشد!")
             return
         
+        csv_path = None
         try:
-            # Download file
+            # Download straight to a temp file; the importers then read it row by row
+            # instead of holding the whole upload (and its decoded copy) in memory
             file = await context.bot.get_file(document.file_id)
-            file_content = await file.download_as_bytearray()
-            
-            # Decode CSV content
-            csv_content = file_content.decode('utf-8')
-            
-            # Determine import type based on headers
-            lines = csv_content.strip().split('\n')
-            if len(lines) < 2:
-                await update.message.reply_text("❌ فایل CSV خالی است یا فرمت صحیح ندارد!")
-                return
-            
-            headers = lines[0].lower().split(',')
-            
-            # Check if it's users or payments import
-            if 'user_id' in headers and 'name' in headers:
-                await self.import_users_csv(update, csv_content)
-            elif 'user_id' in headers and 'course_type' in headers and 'price' in headers:
-                await self.import_payments_csv(update, csv_content)
-            else:
-                await update.message.reply_text(
-                    "❌ فرمت CSV شناخته نشده!\n\n"
-                    "🔍 فرمت‌های پشتیبانی شده:\n"
-                    "• کاربران: user_id,name,username,course_selected,payment_status\n"
-                    "• پرداخت‌ها: user_id,course_type,price,status"
+            with tempfile.NamedTemporaryFile(suffix='.csv', delete=False) as tmp:
+                csv_path = tmp.name
+            await file.download_to_drive(csv_path)
+            
+            with open(csv_path, 'r', encoding='utf-8', newline='') as csv_file:
+                # Determine import type based on headers
+                header_line = csv_file.readline()
+                if not header_line.strip() or not csv_file.readline().strip():
+                    await update.message.reply_text("❌ فایل CSV خالی است یا فرمت صحیح ندارد!")
+                    return
+                
+                headers = frozenset(h.strip() for h in header_line.lower().split(','))
+                csv_file.seek(0)
+                
+                # Check if it's users or payments import - first schema whose columns are all present
+                importer_name = next(
+                    (name for required, name in _CSV_IMPORT_SCHEMAS if required <= headers), None
                 )
+                if importer_name:
+                    await getattr(self, importer_name)(update, csv_file)
+                else:
+                    await update.message.reply_text(
+                        "❌ فرمت CSV شناخته نشده!\n\n"
+                        "🔍 فرمت‌های پشتیبانی شده:\n"
+                        "• کاربران: user_id,name,username,course_selected,payment_status\n"
+                        "• پرداخت‌ها: user_id,course_type,price,status"
+                    )
         
         except Exception as e:
             logger.error(f"Error processing CSV import: {e}")
             await update.message.reply_text(f"❌ خطا در پردازش فایل: {str(e)}")
+        finally:
+            if csv_path and os.path.exists(csv_path):
+                os.remove(csv_path)
+
+    async def _save_import_batch(self, save_bulk, batch: list, errors: list) -> int:
+        """Persist one batch of imported rows; returns how many rows were saved"""
+        try:
+            if await save_bulk(batch) is False:
+                errors.append(f"ذخیره {len(batch)} سطر ناموفق بود")
+                return 0
+            return len(batch)
+        except Exception as e:
+            errors.append(f"ذخیره {len(batch)} سطر ناموفق بود: {str(e)}")
+            return 0
 
-    async def import_users_csv(self, update: Update, csv_content: str) -> None:
-        """Import users from CSV content"""
+    async def import_users_csv(self, update: Update, csv_file) -> None:
+        """Import users from an open CSV text file, one row at a time"""
         try:
-            csv_reader = csv.DictReader(io.StringIO(csv_content))
+            csv_rows = _iter_csv_columns(csv_file, ('user_id', 'name', 'username', 'course_selected', 'payment_status'))
             
             imported_count = 0
             errors = []
-            
-            for row_num, row in enumerate(csv_reader, 2):  # Start from row 2 (after header)
+            to_save = []
+            # Every row of one import shares the same import stamp
+            imported_at = _now_iso()
+            imported_by = update.effective_user.id
+            
+            for row_num, row in enumerate(csv_rows, 2):  # Start from row 2 (after header)
+                if len(to_save) >= _CSV_IMPORT_BATCH_SIZE:
+                    imported_count += await self._save_import_batch(self.data_manager.save_users_bulk, to_save, errors)
+                    to_save = []
+                
                 try:
-                    user_id = int(row.get('user_id', '').strip())
-                    name = row.get('name', '').strip()
-                    username = row.get('username', '').strip()
-                    course_selected = row.get('course_selected', '').strip()
-                    payment_status = row.get('payment_status', '').strip()
+                    user_id_text, name, username, course_selected, payment_status = row
+                    user_id = int(user_id_text)
                     
                     if not user_id or not name:
                         errors.append(f"سطر {row_num}: user_id و name ضروری هستند")
                         continue
                     
                     # Validate course type
-                    valid_courses = ['in_person_weights', 'in_person_cardio', 'online_weights', 'online_cardio', 'online_combo', 'nutrition_plan']
-                    if course_selected and course_selected not in valid_courses:
+                    if course_selected and course_selected not in _VALID_COURSES:
                         errors.append(f"سطر {row_num}: نوع دوره نامعتبر: {course_selected}")
                         continue
                     
                     # Validate payment status
-                    valid_statuses = ['pending_approval', 'approved', 'rejected', '']
-                    if payment_status and payment_status not in valid_statuses:
+                    if payment_status and payment_status not in _VALID_USER_PAYMENT_STATUSES:
                         errors.append(f"سطر {row_num}: وضعیت پرداخت نامعتبر: {payment_status}")
                         continue
                     
@@ -1993,18 +2258,20 @@ class FootballCoachBot:
                         'username': username,
                         'course_selected': course_selected,
                         'payment_status': payment_status,
-                        'imported_at': datetime.now().isoformat(),
-                        'imported_by': update.effective_user.id
+                        'imported_at': imported_at,
+                        'imported_by': imported_by
                     }
                     
-                    await self.data_manager.save_user_data(user_id, user_data)
-                    imported_count += 1
+                    to_save.append((user_id, user_data))
                     
                 except ValueError:
                     errors.append(f"سطر {row_num}: user_id باید عدد باشد")
                 except Exception as e:
                     errors.append(f"سطر {row_num}: {str(e)}")
             
+            if to_save:
+                imported_count += await self._save_import_batch(self.data_manager.save_users_bulk, to_save, errors)
+            
             # Send result
             result_text = f"✅ واردات کاربران تکمیل شد!\n\n"
             result_text += f"📊 تعداد وارد شده: {imported_count} کاربر\n"
@@ -2022,34 +2289,39 @@ class FootballCoachBot:
         except Exception as e:
             await update.message.reply_text(f"❌ خطا در واردات کاربران: {str(e)}")
 
-    async def import_payments_csv(self, update: Update, csv_content: str) -> None:
-        """Import payments from CSV content"""
+    async def import_payments_csv(self, update: Update, csv_file) -> None:
+        """Import payments from an open CSV text file, one row at a time"""
         try:
-            csv_reader = csv.DictReader(io.StringIO(csv_content))
+            csv_rows = _iter_csv_columns(csv_file, ('user_id', 'course_type', 'price', 'status'))
             
             imported_count = 0
             errors = []
-            
-            for row_num, row in enumerate(csv_reader, 2):  # Start from row 2 (after header)
+            to_save = []
+            # Every row of one import shares the same import stamp
+            imported_at = _now_iso()
+            imported_by = update.effective_user.id
+            
+            for row_num, row in enumerate(csv_rows, 2):  # Start from row 2 (after header)
+                if len(to_save) >= _CSV_IMPORT_BATCH_SIZE:
+                    imported_count += await self._save_import_batch(self.data_manager.save_payments_bulk, to_save, errors)
+                    to_save = []
+                
                 try:
-                    user_id = int(row.get('user_id', '').strip())
-                    course_type = row.get('course_type', '').strip()
-                    price = int(row.get('price', '').strip())
-                    status = row.get('status', '').strip()
+                    user_id_text, course_type, price_text, status = row
+                    user_id = int(user_id_text)
+                    price = int(price_text)
                     
                     if not user_id or not course_type or not price:
                         errors.append(f"سطر {row_num}: user_id، course_type و price ضروری هستند")
                         continue
                     
                     # Validate course type
-                    valid_courses = ['in_person_weights', 'in_person_cardio', 'online_weights', 'online_cardio', 'online_combo', 'nutrition_plan']
-                    if course_type not in valid_courses:
+                    if course_type not in _VALID_COURSES:
                         errors.append(f"سطر {row_num}: نوع دوره نامعتبر: {course_type}")
                         continue
                     
                     # Validate status
-                    valid_statuses = ['pending_approval', 'approved', 'rejected', 'pending']
-                    if status and status not in valid_statuses:
+                    if status and status not in _VALID_PAYMENT_STATUSES:
                         errors.append(f"سطر {row_num}: وضعیت نامعتبر: {status}")
                         continue
                     
@@ -2058,18 +2330,20 @@ class FootballCoachBot:
                         'course_type': course_type,
                         'price': price,
                         'status': status if status else 'pending_approval',
-                        'imported_at': datetime.now().isoformat(),
-                        'imported_by': update.effective_user.id
+                        'imported_at': imported_at,
+                        'imported_by': imported_by
                     }
                     
-                    await self.data_manager.save_payment_data(user_id, payment_data)
-                    imported_count += 1
+                    to_save.append((user_id, payment_data))
                     
                 except ValueError:
                     errors.append(f"سطر {row_num}: user_id و price باید عدد باشند")
                 except Exception as e:
                     errors.append(f"سطر {row_num}: {str(e)}")
             
+            if to_save:
+                imported_count += await self._save_import_batch(self.data_manager.save_payments_bulk, to_save, errors)
+            
             # Send result
             result_text = f"✅ واردات پرداخت‌ها تکمیل شد!\n\n"
             result_text += f"📊 تعداد وارد شده: {imported_count} پرداخت\n"
@@ -2157,14 +2431,8 @@ class FootballCoachBot:
 {question['text']}"""
             
             # Add choices as buttons if it's a choice question
-            keyboard = []
-            if question.get('type') == 'choice':
-                choices = question.get('choices', [])
-                for choice in choices:
-                    keyboard.append([InlineKeyboardButton(choice, callback_data=f'q_answer_{choice}')])
-                keyboard.append([InlineKeyboardButton("🔙 بازگشت به منوی اصلی", callback_data='back_to_user_menu')])
-            else:
-                keyboard = [[InlineKeyboardButton("🔙 بازگشت به منوی اصلی", callback_data='back_to_user_menu')]]
+            choices = question.get('choices', []) if question.get('type') == 'choice' else ()
+            keyboard = _build_choice_keyboard(choices)
             
             reply_markup = InlineKeyboardMarkup(keyboard)
             await query.edit_message_text(intro_message, reply_markup=reply_markup)
@@ -2209,63 +2477,28 @@ class FootballCoachBot:
         }
         
         # EXPLICIT PAYMENT FLOW STATE - Set awaiting receipt flag
-        if user_id not in context.user_data:
-            context.user_data[user_id] = {}
-        context.user_data[user_id]['awaiting_payment_receipt'] = True
-        context.user_data[user_id]['payment_course'] = course_type
+        user_context = context.user_data.setdefault(user_id, {})
+        user_context['awaiting_payment_receipt'] = True
+        user_context['payment_course'] = course_type
         
         logger.info(f"💳 User {user_id} entering payment flow for course: {course_type}")
         
         # Format prices properly
         final_price_text = Config.format_price(final_price)
         
-        # Special message for nutrition plan
-        if course_type == 'nutrition_plan':
-            payment_message = f"""🥗 برنامه غذایی شخصی‌سازی شده
-
-با توجه به اهداف و شرایط جسمانی شما، یک برنامه غذایی کاملاً شخصی‌سازی شده تهیه می‌شود.
-
-برای دریافت برنامه غذایی، لطفاً روی لینک زیر کلیک کنید:
-
-👈 https://fitava.ir/coach/drbohloul/question
-
-✨ این برنامه شامل:
-• برنامه غذایی کامل بر اساس نیازهای شما
-• راهنمایی تخصصی تغذیه ورزشی
-• پیگیری و تنظیم برنامه
-❌توجه داشته باشید همه فیلدهای فرم رو پر کنید وبرای قسمت اعداد، کیورد اعداد انگلیسی رو وارد کنید 
-
-برای پرداخت به شماره کارت زیر واریز کنید:
-
-💳 شماره کارت: {Config.format_card_number(Config.PAYMENT_CARD_NUMBER)}
-👤 نام صاحب حساب: {Config.PAYMENT_CARD_HOLDER}
-💰 مبلغ: {final_price_text}"""
-        else:
-            # Generic payment message for other courses
-            course_title = Config.COURSE_DETAILS.get(course_type, {}).get('title', 'دوره انتخابی')
-            payment_message = f"""📚 {course_title}
-
-برای پرداخت به شماره کارت زیر واریز کنید:
-
-💳 شماره کارت: {Config.format_card_number(Config.PAYMENT_CARD_NUMBER)}
-👤 نام صاحب حساب: {Config.PAYMENT_CARD_HOLDER}
-💰 مبلغ: {final_price_text}"""
+        # Everything up to the amount is fixed per course (see _PAYMENT_MESSAGE_PREFIXES)
+        payment_message = _PAYMENT_MESSAGE_PREFIXES.get(course_type) or _payment_message_prefix(course_type)
+        payment_message += final_price_text
         
         if coupon_info:
-            original_price_text = Config.format_price(original_price)
-            discount_amount_text = Config.format_price(coupon_info['discount_amount'])
-            payment_message += f"""
-
-🏷️ کد تخفیف: {coupon_info['code']}
-💰 قیمت اصلی: {original_price_text}
-🎯 تخفیف: -{discount_amount_text}
-✅ قیمت نهایی: {final_price_text}"""
+            payment_message += self.PAYMENT_COUPON_TEMPLATE.format_map({
+                'code': coupon_info['code'],
+                'orig': Config.format_price(original_price),
+                'disc': Config.format_price(coupon_info['discount_amount']),
+                'final': final_price_text
+            })
         
-        payment_message += """
-
-بعد از واریز، فیش یا اسکرین شات رو همینجا ارسال کنید تا بررسی شه ✅
-
-⚠️ توجه: فقط فیش واریز رو ارسال کنید"""
+        payment_message += _PAYMENT_MESSAGE_FOOTER
         
         # Add contextual back button based on course type
         if course_type == 'nutrition_plan':
@@ -2338,8 +2571,7 @@ class FootballCoachBot:
                 logger.debug(f"🎯 QUESTIONNAIRE MODE - User {user_id} detected via payment+progress")
                 
                 # AUTO-SET questionnaire_active flag for consistency
-                if user_id not in context.user_data:
-                    context.user_data[user_id] = {}
+                context.user_data.setdefault(user_id, {})
                 context.user_data[user_id]['questionnaire_active'] = True
                 logger.debug(f"🔧 AUTO-SET questionnaire_active flag for user {user_id}")
         
@@ -2360,7 +2592,6 @@ class FootballCoachBot:
                 else:
                     # User sent photo but different input type is expected (text, number, etc.)
                     logger.debug(f"❌ PHOTO ROUTER - User {user_id} sent photo for {question_type} question - showing error")
-                    from utils.input_validator import input_validator
                     
                     is_valid = await input_validator.validate_and_reject_wrong_input_type(
                         update, question_type, f"پرسشنامه - سوال {current_question.get('step', '?')}", is_admin=False
@@ -2370,7 +2601,6 @@ class FootballCoachBot:
         # PRIORITY 3: Check if user is waiting for coupon code (not photo)
         if user_context.get('waiting_for_coupon'):
             logger.debug(f"💰 PHOTO ROUTER - User {user_id} sent photo while waiting for coupon - showing error")
-            from utils.input_validator import input_validator
             
             await input_validator.validate_and_reject_wrong_input_type(
                 update, 'coupon_code', "ورود کد تخفیف", is_admin=False
@@ -2405,47 +2635,55 @@ class FootballCoachBot:
         # At this point, the photo router has already validated this is a payment receipt context
         # So we can proceed directly with payment processing
         
-        # Get user data and context
-        user_data = await self.data_manager.get_user_data(user_id)
-        user_context = context.user_data.get(user_id, {})
-        course_selected = user_context.get('current_course_selection') or user_data.get('course_selected')
+        # One receipt at a time per user: a double-sent photo waits here and then sees the
+        # pending status written by the first one instead of both passing the check
+        lock = self._receipt_locks.get(user_id)
+        if lock is None:
+            lock = self._receipt_locks[user_id] = asyncio.Lock()
         
-        if not course_selected:
-            await update.message.reply_text(
-                "❌ ابتدا یک دوره انتخاب کنید!\n\n"
-                "برای شروع /start را بزنید."
-            )
-            return
+        async with lock:
+            # Get user data and context
+            user_data = await self.data_manager.get_user_data(user_id)
+            user_context = context.user_data.get(user_id, {})
+            course_selected = user_context.get('current_course_selection') or user_data.get('course_selected')
+            
+            if not course_selected:
+                await update.message.reply_text(
+                    "❌ ابتدا یک دوره انتخاب کنید!\n\n"
+                    "برای شروع /start را بزنید."
+                )
+                return
 
-        # Handle different payment states
-        payment_status = user_data.get('payment_status')
-        
-        if payment_status == 'pending_approval':
-            logger.warning(f"⚠️ User {user_id} sent duplicate receipt - already pending")
-            await update.message.reply_text(
-                "✅ فیش واریز شما قبلاً دریافت شده است!\n\n"
-                "⏳ در حال بررسی توسط ادمین...\n"
-                "📱 از وضعیت پرداخت مطلع خواهید شد.\n\n"
-                "🔄 برای بازگشت به منو: /start"
-            )
-            return
+            # Handle different payment states
+            payment_status = user_data.get('payment_status')
+            
+            if payment_status == 'pending_approval':
+                logger.warning(f"⚠️ User {user_id} sent duplicate receipt - already pending")
+                await update.message.reply_text(
+                    "✅ فیش واریز شما قبلاً دریافت شده است!\n\n"
+                    "⏳ در حال بررسی توسط ادمین...\n"
+                    "📱 از وضعیت پرداخت مطلع خواهید شد.\n\n"
+                    "🔄 برای بازگشت به منو: /start"
+                )
+                return
 
-        # Process new payment receipt
-        await self.process_new_course_payment(update, context)
+            # Process new payment receipt (reusing the user record read above)
+            await self.process_new_course_payment(update, context, user_data)
 
-    async def process_new_course_payment(self, update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    async def process_new_course_payment(self, update: Update, context: ContextTypes.DEFAULT_TYPE,
+                                         user_data: dict = None) -> None:
         """Process payment receipt for new course purchase"""
         user_id = update.effective_user.id
-        user_name = update.effective_user.first_name or "کاربر"
         
         # Get selected course for this payment
-        user_context = context.user_data.get(user_id, {})
-        course_selected = user_context.get('current_course_selection')
-        
-        if not course_selected:
-            # Fall back to user's main course selection
+        user_context = context.user_data.setdefault(user_id, {})
+        # One read of the user record serves the course fallback, the limit check and the updates below
+        if user_data is None:
             user_data = await self.data_manager.get_user_data(user_id)
-            course_selected = user_data.get('course_selected')
+        if not user_data:
+            user_data = {}
+        # Fall back to user's main course selection
+        course_selected = user_context.get('current_course_selection') or user_data.get('course_selected')
         
         if not course_selected:
             await update.message.reply_text(
@@ -2455,7 +2693,7 @@ class FootballCoachBot:
             return
         
         # CHECK RECEIPT SUBMISSION LIMITS
-        receipt_status = await self.check_receipt_submission_limits(user_id, course_selected)
+        receipt_status = await self.check_receipt_submission_limits(user_id, course_selected, user_data)
         if not receipt_status or not receipt_status.get('allowed', False):
             error_message = receipt_status.get('message', "❌ خطا در بررسی محدودیت ارسال فیش") if receipt_status else "❌ خطا در بررسی محدودیت ارسال فیش"
             await update.message.reply_text(error_message)
@@ -2465,12 +2703,21 @@ class FootballCoachBot:
         photo = update.message.photo[-1]  # Get highest resolution
         
         # Check file size (Telegram API limit)
-        if photo.file_size and photo.file_size > 20 * 1024 * 1024:  # 20MB
+        if photo.file_size and photo.file_size > _MAX_PHOTO_BYTES:
             await update.message.reply_text(
                 "❌ حجم فایل بیش از حد مجاز است!\n"
                 "لطفاً تصویری با حجم کمتر از 20 مگابایت ارسال کنید."
             )
             return
+        
+        # Check minimum dimensions
+        if photo.width < _MIN_PHOTO_DIMENSION or photo.height < _MIN_PHOTO_DIMENSION:
+            await update.message.reply_text(
+                "❌ تصویر خیلی کوچک است!\n\n"
+                "حداقل ابعاد مورد نیاز: ۲۰۰×۲۰۰ پیکسل\n"
+                "لطفاً تصویر با کیفیت بهتر ارسال کنید."
+            )
+            return
 
         try:
             # Get course details and pricing info from pending payment
@@ -2494,20 +2741,11 @@ class FootballCoachBot:
                 original_price = price
                 coupon_info = None
             
-            # Check minimum dimensions
-            if photo.width < 200 or photo.height < 200:
-                await update.message.reply_text(
-                    "❌ تصویر خیلی کوچک است!\n\n"
-                    "حداقل ابعاد مورد نیاز: ۲۰۰×۲۰۰ پیکسل\n"
-                    "لطفاً تصویر با کیفیت بهتر ارسال کنید."
-                )
-                return
-            
             # Create payment record
             payment_id = f"{user_id}_{datetime.now().strftime('%Y%m%d_%H%M%S')}"
             
             # Log payment receipt submission
-            log_payment_action(user_id, user_name, f"submitted payment receipt for course: {course_selected}")
+            log_payment_action(user_id, "submitted payment receipt", amount=price, course=course_selected)
             
             # Save payment record with coupon info if applicable
             payment_data = {
@@ -2515,7 +2753,7 @@ class FootballCoachBot:
                 'price': price,
                 'original_price': original_price,
                 'status': 'pending_approval',
-                'timestamp': datetime.now().isoformat(),
+                'timestamp': _now_iso(),
                 'user_id': user_id,
                 'payment_id': payment_id,
                 'receipt_file_id': photo.file_id
@@ -2529,39 +2767,35 @@ class FootballCoachBot:
                     'discount_amount': coupon_info['discount_amount']
                 })
             
-            await self.data_manager.save_payment_data(user_id, payment_data)
-            
-            # Clear pending payment info since receipt is now submitted
-            if user_id in self.payment_pending:
-                del self.payment_pending[user_id]
-            
             # UPDATE RECEIPT SUBMISSION COUNT
-            await self.increment_receipt_submission_count(user_id, course_selected)
+            receipt_attempts = user_data.get('receipt_attempts', {})
+            if not isinstance(receipt_attempts, dict):
+                receipt_attempts = {}
+            receipt_attempts = {**receipt_attempts, course_selected: receipt_attempts.get(course_selected, 0) + 1}
             
             # Update user data (but don't change their main course selection)
             user_updates = {
                 'receipt_submitted': True,
                 'receipt_file_id': photo.file_id,
-                'payment_status': 'pending_approval'
+                'payment_status': 'pending_approval',
+                'receipt_attempts': receipt_attempts
             }
             
             # If this is their first course purchase, set as main course
-            user_data = await self.data_manager.get_user_data(user_id)
-            if not user_data:
-                logger.error(f"Failed to get user data for user {user_id}")
-                user_data = {}
-            
             if not user_data.get('course_selected'):
                 user_updates['course_selected'] = course_selected
             
-            await self.data_manager.save_user_data(user_id, user_updates)
+            # Payment record, receipt count and user updates in a single write
+            await self.data_manager.save_payment_atomic(user_id, payment_data, user_updates)
+            logger.info(f"✅ User {user_id} receipt attempt #{receipt_attempts[course_selected]} for course {course_selected}")
+            
+            # Clear pending payment info since receipt is now submitted
+            if user_id in self.payment_pending:
+                del self.payment_pending[user_id]
             
             # Clear additional course purchase context AND payment receipt state
-            if user_id in context.user_data:
-                context.user_data[user_id].pop('buying_additional_course', None)
-                context.user_data[user_id].pop('current_course_selection', None)
-                context.user_data[user_id].pop('awaiting_payment_receipt', None)  # CLEAR PAYMENT STATE
-                context.user_data[user_id].pop('payment_course', None)
+            for key in _PAYMENT_FLOW_KEYS:
+                user_context.pop(key, None)
                 
             logger.info(f"✅ Payment receipt processed for user {user_id} - PAYMENT FLOW STATE CLEARED")
             
@@ -2581,8 +2815,14 @@ class FootballCoachBot:
                 f"⏱️ زمان تقریبی بررسی: تا ۲۴ ساعت{submission_info}"
             )
             
-            # Notify admins with TIMEOUT PROTECTION
-            await self.notify_admins_about_payment(update, context, photo, course_title, price, user_id)
+            # Notify admins with TIMEOUT PROTECTION, in the background so this update finishes
+            # without waiting on admin round-trips. Pass the post-update user record so the
+            # notification does not read it again
+            self._run_in_background(
+                self.notify_admins_about_payment(update, context, photo, course_title, price, user_id,
+                                                 user_data={**user_data, **user_updates}),
+                f"notify_admins_about_payment({user_id})"
+            )
                 
         except Exception as e:
             logger.error(f"Error processing payment receipt: {e}")
@@ -2591,10 +2831,11 @@ class FootballCoachBot:
                 update, context, e, "process_new_course_payment", user_id
             )
 
-    async def check_receipt_submission_limits(self, user_id: int, course_code: str) -> dict:
+    async def check_receipt_submission_limits(self, user_id: int, course_code: str, user_data: dict = None) -> dict:
         """Check if user can submit more receipt attempts for a course"""
         try:
-            user_data = await self.data_manager.get_user_data(user_id)
+            if user_data is None:
+                user_data = await self.data_manager.get_user_data(user_id)
             receipt_attempts = user_data.get('receipt_attempts', {})
             course_attempts = receipt_attempts.get(course_code, 0)
             
@@ -2642,53 +2883,8 @@ class FootballCoachBot:
                 'max_attempts': 3
             }
 
-    async def increment_receipt_submission_count(self, user_id: int, course_code: str):
-        """Increment the receipt submission count for a user/course with race condition protection"""
-        
-        # RACE CONDITION PROTECTION - Use a simple in-memory lock per user
-        receipt_lock_key = f"receipt_count_{user_id}"
-        
-        if not hasattr(self, 'receipt_count_locks'):
-            self.receipt_count_locks = set()
-        
-        # Check if this user's count is already being incremented
-        if receipt_lock_key in self.receipt_count_locks:
-            logger.warning(f"🔒 Receipt count increment blocked for user {user_id} - already in progress")
-            return
-        
-        # Lock this user's receipt count increment
-        self.receipt_count_locks.add(receipt_lock_key)
-        
-        try:
-            # Atomic read-modify-write operation
-            user_data = await self.data_manager.get_user_data(user_id)
-            if not user_data:
-                logger.error(f"Failed to get user data for user {user_id} in increment_receipt_submission_count")
-                user_data = {}
-            
-            receipt_attempts = user_data.get('receipt_attempts', {})
-            if not isinstance(receipt_attempts, dict):
-                receipt_attempts = {}
-            
-            # Get current count and increment atomically
-            current_count = receipt_attempts.get(course_code, 0)
-            new_count = current_count + 1
-            receipt_attempts[course_code] = new_count
-            
-            # Save atomically
-            await self.data_manager.save_user_data(user_id, {'receipt_attempts': receipt_attempts})
-            
-            logger.info(f"✅ ATOMIC INCREMENT: User {user_id} receipt attempt #{new_count} for course {course_code}")
-            
-        except Exception as e:
-            logger.error(f"❌ ATOMIC INCREMENT FAILED: User {user_id}, course {course_code}: {e}")
-        finally:
-            # Always release lock
-            if receipt_lock_key in self.receipt_count_locks:
-                self.receipt_count_locks.remove(receipt_lock_key)
-
     async def notify_admins_about_payment(self, update: Update, context: ContextTypes.DEFAULT_TYPE, 
-                                        photo, course_title: str, price: int, user_id: int):
+                                        photo, course_title: str, price: int, user_id: int, user_data: dict = None):
         """Notify admins about payment with timeout protection"""
         admin_ids = Config.get_admin_ids()
         if not admin_ids:
@@ -2696,75 +2892,72 @@ class FootballCoachBot:
             return
         
         # Get receipt attempt info
-        user_data = await self.data_manager.get_user_data(user_id)
+        if user_data is None:
+            user_data = await self.data_manager.get_user_data(user_id)
         receipt_attempts = user_data.get('receipt_attempts', {})
         course_code = user_data.get('course_selected', 'unknown')
         attempt_count = receipt_attempts.get(course_code, 1)
         
-        admin_message = (f"🔔 درخواست تایید پرداخت جدید\n\n"
-                       f"👤 کاربر: {update.effective_user.first_name}\n"
-                       f"📱 نام کاربری: @{update.effective_user.username or 'ندارد'}\n"
-                       f"🆔 User ID: {user_id}\n"
-                       f"📚 دوره: {course_title}\n"
-                       f"💰 مبلغ: {price:,} تومان\n"
-                       f"📊 تلاش ارسال فیش: {attempt_count}/3\n\n"
-                       f"⬇️ فیش واریز ارسالی:")
+        # One caption string shared by every admin send
+        admin_message = self.PAYMENT_RECEIPT_ADMIN_TEMPLATE.format_map({
+            'name': update.effective_user.first_name,
+            'username': update.effective_user.username or 'ندارد',
+            'user_id': user_id,
+            'course': course_title,
+            'price': price,
+            'attempt': attempt_count
+        })
         
         # Create enhanced approval buttons
-        keyboard = [
-            [
-                InlineKeyboardButton("✅ تایید", callback_data=f'approve_payment_{user_id}'),
-                InlineKeyboardButton("❌ رد", callback_data=f'reject_payment_{user_id}')
-            ],
-            [InlineKeyboardButton("👤 مشاهده پروفایل", callback_data=f'view_user_{user_id}')],
-            [InlineKeyboardButton("🔄 اجازه فیش اضافی", callback_data=f'allow_extra_receipt_{user_id}')],
-            [InlineKeyboardButton("🎛️ مدیریت پرداخت‌ها", callback_data='admin_pending_payments')]
-        ]
-        reply_markup = InlineKeyboardMarkup(keyboard)
+        reply_markup = _payment_review_markup(user_id)
+        
+        # Send to all admins concurrently, each with its own timeout, so one slow admin
+        # no longer delays the rest
+        results = await asyncio.gather(
+            *(asyncio.wait_for(
+                context.bot.send_photo(
+                    chat_id=admin_id,
+                    photo=photo.file_id,
+                    caption=admin_message,
+                    reply_markup=reply_markup
+                ),
+                timeout=10.0  # 10 second timeout per admin
+            ) for admin_id in admin_ids),
+            return_exceptions=True
+        )
         
-        # Send to admins with timeout protection
         sent_count = 0
         failed_admins = []
-        
-        for admin_id in admin_ids:
-            try:
-                # Use asyncio.wait_for to add timeout protection
-                await asyncio.wait_for(
-                    context.bot.send_photo(
-                        chat_id=admin_id,
-                        photo=photo.file_id,
-                        caption=admin_message,
-                        reply_markup=reply_markup
-                    ),
-                    timeout=10.0  # 10 second timeout per admin
-                )
-                sent_count += 1
-                
-            except asyncio.TimeoutError:
+        for admin_id, result in zip(admin_ids, results):
+            if isinstance(result, asyncio.TimeoutError):
                 logger.warning(f"Timeout sending payment notification to admin {admin_id}")
                 failed_admins.append(admin_id)
-                
-            except Exception as e:
-                logger.warning(f"Failed to send payment notification to admin {admin_id}: {e}")
+            elif isinstance(result, Exception):
+                logger.warning(f"Failed to send payment notification to admin {admin_id}: {result}")
                 failed_admins.append(admin_id)
+            else:
+                sent_count += 1
         
         logger.info(f"Payment notification sent to {sent_count}/{len(admin_ids)} admins")
         
         if failed_admins:
             logger.warning(f"Failed to notify admins: {failed_admins}")
             # Try to send a fallback text message to failed admins
-            for admin_id in failed_admins:
-                try:
-                    await asyncio.wait_for(
-                        context.bot.send_message(
-                            chat_id=admin_id,
-                            text=f"⚠️ فیش پرداخت جدید دریافت شد ولی ارسال عکس ناموفق بود.\n\n{admin_message}",
-                            reply_markup=reply_markup
-                        ),
-                        timeout=5.0
-                    )
-                except Exception as e:
-                    logger.error(f"Failed to send fallback notification to admin {admin_id}: {e}")
+            fallback_text = f"⚠️ فیش پرداخت جدید دریافت شد ولی ارسال عکس ناموفق بود.\n\n{admin_message}"
+            results = await asyncio.gather(
+                *(asyncio.wait_for(
+                    context.bot.send_message(
+                        chat_id=admin_id,
+                        text=fallback_text,
+                        reply_markup=reply_markup
+                    ),
+                    timeout=5.0
+                ) for admin_id in failed_admins),
+                return_exceptions=True
+            )
+            for admin_id, result in zip(failed_admins, results):
+                if isinstance(result, Exception):
+                    logger.error(f"Failed to send fallback notification to admin {admin_id}: {result}")
 
     async def handle_questionnaire_photo(self, update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
         """Handle photo submission for questionnaire questions"""
@@ -2775,7 +2968,7 @@ class FootballCoachBot:
             photo = update.message.photo[-1]  # Get highest resolution
             
             # Basic validation
-            if photo.file_size and photo.file_size > 20 * 1024 * 1024:  # 20MB
+            if photo.file_size and photo.file_size > _MAX_PHOTO_BYTES:
                 await update.message.reply_text(
                     "❌ تصویر خیلی بزرگ است!\n\n"
                     "حداکثر سایز مجاز: ۲۰ مگابایت\n"
@@ -2784,7 +2977,7 @@ class FootballCoachBot:
                 return
             
             # Check minimum dimensions
-            if photo.width < 200 or photo.height < 200:
+            if photo.width < _MIN_PHOTO_DIMENSION or photo.height < _MIN_PHOTO_DIMENSION:
                 await update.message.reply_text(
                     "❌ تصویر خیلی کوچک است!\n\n"
                     "حداقل ابعاد مورد نیاز: ۲۰۰×۲۰۰ پیکسل\n"
@@ -2866,8 +3059,6 @@ class FootballCoachBot:
             question_type = current_question.get("type")
             
             # UNIFIED INPUT TYPE VALIDATION for questionnaire documents
-            from utils.input_validator import input_validator
-            
             if question_type == "photo":
                 # User sent document but photo is expected
                 is_valid = await input_validator.validate_and_reject_wrong_input_type(
@@ -2934,7 +3125,7 @@ class FootballCoachBot:
                         
         # Handle other document types
         # Check if user is in questionnaire mode for text_or_document questions
-        current_question = await self.questionnaire_manager.get_current_question(user_id)
+        # (current_question from above - nothing in between can change it)
         if current_question and current_question.get("type") == "text_or_document":
             await update.message.reply_text(
                 "❌ فقط فایل‌های PDF قابل قبول هستند!\n\n"
@@ -2953,7 +3144,7 @@ class FootballCoachBot:
         # ENHANCED QUESTIONNAIRE DETECTION - Same as photo handler
         user_data = await self.data_manager.get_user_data(user_id)
         payment_status = user_data.get('payment_status')
-        user_context = context.user_data.get(user_id, {})
+        user_context = context.user_data.setdefault(user_id, {})
         
         logger.debug(f"🔍 UNSUPPORTED FILE DEBUG - User {user_id} | Payment: {payment_status} | Active: {user_context.get('questionnaire_active', False)}")
         
@@ -2976,9 +3167,7 @@ class FootballCoachBot:
                 logger.debug(f"🎯 QUESTIONNAIRE MODE - User {user_id} detected via payment+progress")
                 
                 # AUTO-SET questionnaire_active flag for consistency
-                if user_id not in context.user_data:
-                    context.user_data[user_id] = {}
-                context.user_data[user_id]['questionnaire_active'] = True
+                user_context['questionnaire_active'] = True
                 logger.debug(f"🔧 AUTO-SET questionnaire_active flag for user {user_id}")
         
         if in_questionnaire_mode:
@@ -2990,8 +3179,6 @@ class FootballCoachBot:
                 logger.debug(f"❌ UNSUPPORTED FILE - User {user_id} sent unsupported file for {question_type} question - showing error")
                 
                 # UNIFIED INPUT TYPE VALIDATION for unsupported files
-                from utils.input_validator import input_validator
-                
                 is_valid = await input_validator.validate_and_reject_wrong_input_type(
                     update, question_type, f"پرسشنامه - سوال {current_question.get('step', '?')}", is_admin=False
                 )
@@ -3050,7 +3237,7 @@ class FootballCoachBot:
         # RACE CONDITION PROTECTION - Check if payment is already being processed
         payment_lock_key = f"payment_process_{target_user_id}"
         
-        if hasattr(self, 'processing_payments') and payment_lock_key in self.processing_payments:
+        if payment_lock_key in self.processing_payments:
             admin_logger.warning(f"🔒 RACE CONDITION PREVENTED - Admin {user_id} tried to process payment for user {target_user_id} but it's already being processed by another admin")
             await query.edit_message_text(
                 f"⚠️ پرداخت کاربر {target_user_id} در حال بررسی توسط ادمین دیگری است.\n\n"
@@ -3058,12 +3245,8 @@ class FootballCoachBot:
             )
             return
 
-        # Initialize processing_payments if not exists
-        if not hasattr(self, 'processing_payments'):
-            self.processing_payments = set()
-
         # Lock this payment for processing
-        self.processing_payments.add(payment_lock_key)
+        self.processing_payments[payment_lock_key] = user_id
         admin_logger.info(f"🔒 PAYMENT LOCKED - Admin {user_id} processing payment for user {target_user_id}")
         
         try:
@@ -3076,17 +3259,14 @@ class FootballCoachBot:
 
             if action == 'approve':
                 # Find and approve the most recent payment for this user
-                payments_data = await self.data_manager.load_data('payments')
-                user_payment = None
-                payment_id = None
+                user_payments = await self.data_manager.get_user_payments(target_user_id)
                 
                 # Find the most recent pending payment for this user
-                for pid, payment_data in payments_data.items():
-                    if (payment_data.get('user_id') == target_user_id and 
-                        payment_data.get('status') == 'pending_approval'):
-                        if user_payment is None or payment_data.get('timestamp', '') > user_payment.get('timestamp', ''):
-                            user_payment = payment_data
-                            payment_id = pid
+                payment_id, user_payment = max(
+                    ((pid, p) for pid, p in user_payments.items() if p.get('status') == 'pending_approval'),
+                    key=lambda item: item[1].get('timestamp', ''),
+                    default=(None, None)
+                )
             
                 if not user_payment:
                     await query.edit_message_text("❌ هیچ پرداخت معلقی برای این کاربر یافت نشد.")
@@ -3110,7 +3290,8 @@ class FootballCoachBot:
                 # Update payment status in payments table
                 user_payment['status'] = 'approved'
                 user_payment['approved_by'] = update.effective_user.id
-                user_payment['approved_at'] = datetime.now().isoformat()
+                user_payment['approved_at'] = _now_iso()
+                payments_data = await self.data_manager.load_data('payments')
                 payments_data[payment_id] = user_payment
                 await self.data_manager.save_data('payments', payments_data)
                 
@@ -3155,12 +3336,8 @@ class FootballCoachBot:
                         progress_text = "سوال 1 از 21"
                         message = f"✅ پرداخت شما تایید شد!\n\n📝 حالا برای شخصی‌سازی برنامه تمرینتان، چند سوال کوتاه از شما می‌پرسیم:\n\n{progress_text}\n\n{first_question['text']}"
                         
-                        keyboard = []
-                        if first_question.get('type') == 'choice':
-                            choices = first_question.get('choices', [])
-                            for choice in choices:
-                                keyboard.append([InlineKeyboardButton(choice, callback_data=f'q_answer_{choice}')])
-                        keyboard.append([InlineKeyboardButton("🔙 بازگشت به منوی اصلی", callback_data='back_to_user_menu')])
+                        choices = first_question.get('choices', []) if first_question.get('type') == 'choice' else ()
+                        keyboard = _build_choice_keyboard(choices)
                         reply_markup = InlineKeyboardMarkup(keyboard)
                         
                         logger.info(f"📤 Sending questionnaire message to user {target_user_id}")
@@ -3253,17 +3430,14 @@ class FootballCoachBot:
                 
             elif action == 'reject':
                 # Find and reject the most recent payment for this user
-                payments_data = await self.data_manager.load_data('payments')
-                user_payment = None
-                payment_id = None
+                user_payments = await self.data_manager.get_user_payments(target_user_id)
                 
                 # Find the most recent pending payment for this user
-                for pid, payment_data in payments_data.items():
-                    if (payment_data.get('user_id') == target_user_id and 
-                        payment_data.get('status') == 'pending_approval'):
-                        if user_payment is None or payment_data.get('timestamp', '') > user_payment.get('timestamp', ''):
-                            user_payment = payment_data
-                            payment_id = pid
+                payment_id, user_payment = max(
+                    ((pid, p) for pid, p in user_payments.items() if p.get('status') == 'pending_approval'),
+                    key=lambda item: item[1].get('timestamp', ''),
+                    default=(None, None)
+                )
                 
                 if not user_payment:
                     await query.edit_message_text("❌ هیچ پرداخت معلقی برای این کاربر یافت نشد.")
@@ -3281,7 +3455,8 @@ class FootballCoachBot:
                 # Update payment status in payments table
                 user_payment['status'] = 'rejected'
                 user_payment['rejected_by'] = update.effective_user.id
-                user_payment['rejected_at'] = datetime.now().isoformat()
+                user_payment['rejected_at'] = _now_iso()
+                payments_data = await self.data_manager.load_data('payments')
                 payments_data[payment_id] = user_payment
                 await self.data_manager.save_data('payments', payments_data)
                 
@@ -3350,8 +3525,7 @@ class FootballCoachBot:
             
         finally:
             # RACE CONDITION PROTECTION - Release payment lock
-            if hasattr(self, 'processing_payments') and payment_lock_key in self.processing_payments:
-                self.processing_payments.remove(payment_lock_key)
+            if self.processing_payments.pop(payment_lock_key, None) is not None:
                 admin_logger.info(f"🔓 PAYMENT UNLOCKED - Admin {user_id} finished processing payment for user {target_user_id}")
 
     async def handle_allow_extra_receipt(self, query, context: ContextTypes.DEFAULT_TYPE, 
@@ -3458,8 +3632,8 @@ class FootballCoachBot:
                 await query.edit_message_text("❌ دوره کاربر مشخص نیست.")
                 return
             
-            # Get current overrides
-            admin_overrides = user_data.get('admin_receipt_overrides', {})
+            # Get current overrides (copied - the cached user record must not change before the save)
+            admin_overrides = dict(user_data.get('admin_receipt_overrides', {}))
             
             # Apply the new override
             if extra_attempts == 'unlimited':
@@ -3643,8 +3817,7 @@ class FootballCoachBot:
         """Handle quick approval of multiple payments with confirmation"""
         try:
             # Get pending payments
-            with open('bot_data.json', 'r', encoding='utf-8') as f:
-                data = json.load(f)
+            data = await self.admin_panel.data_manager.read_bot_data_snapshot()
             
             payments = data.get('payments', {})
             pending = {k: v for k, v in payments.items() if v.get('status') == 'pending_approval'}
@@ -3706,14 +3879,8 @@ class FootballCoachBot:
 
 {question['text']}"""
             
-            keyboard = []
-            if question.get('type') == 'choice':
-                choices = question.get('choices', [])
-                for choice in choices:
-                    keyboard.append([InlineKeyboardButton(choice, callback_data=f'q_answer_{choice}')])
-                keyboard.append([InlineKeyboardButton("🔙 بازگشت به منوی اصلی", callback_data='back_to_user_menu')])
-            else:
-                keyboard = [[InlineKeyboardButton("🔙 بازگشت به منوی اصلی", callback_data='back_to_user_menu')]]
+            choices = question.get('choices', []) if question.get('type') == 'choice' else ()
+            keyboard = _build_choice_keyboard(choices)
             
             reply_markup = InlineKeyboardMarkup(keyboard)
             await query.edit_message_text(message, reply_markup=reply_markup)
@@ -3743,20 +3910,21 @@ class FootballCoachBot:
             logger.info(f"🔇 IGNORING random text from user {user_id} - not in text input mode")
             
             # DEBUG: Log questionnaire flow decision for ignored text with enhanced context
-            await admin_error_handler.log_questionnaire_flow_debug(
-                user_id=user_id,
-                context="text_input_ignored",
-                questionnaire_data=context.user_data.get(user_id, {}),
-                flow_decision="ignore_text_not_waiting",
-                details={
-                    'text_input_preview': text_input[:50],
-                    'user_context_keys': list(context.user_data.get(user_id, {}).keys()),
-                    'questionnaire_active_flag': context.user_data.get(user_id, {}).get('questionnaire_active', False),
-                    'questionnaire_activated_at': context.user_data.get(user_id, {}).get('questionnaire_activated_at', 'never'),
-                    'auto_fix_attempted': False,  # This will be true when we add auto-fix
-                    'validation_reason': 'flag_missing_or_false'
-                }
-            )
+            if admin_error_handler.questionnaire_flow_debug_enabled():
+                await admin_error_handler.log_questionnaire_flow_debug(
+                    user_id=user_id,
+                    context="text_input_ignored",
+                    questionnaire_data=context.user_data.get(user_id, {}),
+                    flow_decision="ignore_text_not_waiting",
+                    details={
+                        'text_input_preview': text_input[:50],
+                        'user_context_keys': list(context.user_data.get(user_id, {}).keys()),
+                        'questionnaire_active_flag': context.user_data.get(user_id, {}).get('questionnaire_active', False),
+                        'questionnaire_activated_at': context.user_data.get(user_id, {}).get('questionnaire_activated_at', 'never'),
+                        'auto_fix_attempted': False,  # This will be true when we add auto-fix
+                        'validation_reason': 'flag_missing_or_false'
+                    }
+                )
             return
         
         # STEP 2: User IS in valid text input mode - route to appropriate handler
@@ -3862,8 +4030,6 @@ class FootballCoachBot:
         # Payment receipt input - expecting photo, not text
         if user_context.get('awaiting_payment_receipt'):
             # UNIFIED INPUT TYPE VALIDATION for payment receipt
-            from utils.input_validator import input_validator
-            
             await input_validator.validate_and_reject_wrong_input_type(
                 update, 'photo', "ارسال رسید پرداخت", is_admin=False
             )
@@ -3872,8 +4038,6 @@ class FootballCoachBot:
         # Coupon input
         if user_context.get('waiting_for_coupon'):
             # UNIFIED INPUT TYPE VALIDATION for coupon input
-            from utils.input_validator import input_validator
-            
             is_valid = await input_validator.validate_and_reject_wrong_input_type(
                 update, 'coupon_code', "ورود کد تخفیف", is_admin=False
             )
@@ -3915,7 +4079,6 @@ class FootballCoachBot:
             return
         
         # UNIFIED INPUT TYPE VALIDATION - Check if text is appropriate for this question type
-        from utils.input_validator import input_validator
         question_type = current_question.get('type', 'text')
         
         # Pre-validate input type before content validation
@@ -3953,14 +4116,8 @@ class FootballCoachBot:
 
 {question['text']}"""
             
-            keyboard = []
-            if question.get('type') == 'choice':
-                choices = question.get('choices', [])
-                for choice in choices:
-                    keyboard.append([InlineKeyboardButton(choice, callback_data=f'q_answer_{choice}')])
-                keyboard.append([InlineKeyboardButton("🔙 بازگشت به منوی اصلی", callback_data='back_to_user_menu')])
-            else:
-                keyboard = [[InlineKeyboardButton("🔙 بازگشت به منوی اصلی", callback_data='back_to_user_menu')]]
+            choices = question.get('choices', []) if question.get('type') == 'choice' else ()
+            keyboard = _build_choice_keyboard(choices)
             
             reply_markup = InlineKeyboardMarkup(keyboard)
             await update.message.reply_text(message, reply_markup=reply_markup)
@@ -4061,10 +4218,11 @@ class FootballCoachBot:
         
         # CRITICAL: Use get_user_status to check payments table, not user data
         user_data = await self.data_manager.get_user_data(user_id)
-        user_status = await self.get_user_status(user_data)
+        payment_summary = await self._load_user_payment_summary(user_id)
+        user_status = await self.get_user_status(user_data, payment_summary)
         
         # Check if user has approved payment for training courses
-        purchased_courses = await self.get_user_purchased_courses(user_id)
+        purchased_courses = payment_summary['purchased_courses']
         training_courses = purchased_courses - {'nutrition_plan'}  # Exclude nutrition plan
         
         if user_status != 'payment_approved' or not training_courses:
@@ -4080,8 +4238,7 @@ class FootballCoachBot:
         
         if result["status"] == "success":
             # CRITICAL FIX: Set questionnaire_active flag for text input routing
-            if user_id not in context.user_data:
-                context.user_data[user_id] = {}
+            context.user_data.setdefault(user_id, {})
             context.user_data[user_id]['questionnaire_active'] = True
             
             question = result["question"]
@@ -4089,14 +4246,8 @@ class FootballCoachBot:
 
 {question['text']}"""
             
-            keyboard = []
-            if question.get('type') == 'choice':
-                choices = question.get('choices', [])
-                for choice in choices:
-                    keyboard.append([InlineKeyboardButton(choice, callback_data=f'q_answer_{choice}')])
-                keyboard.append([InlineKeyboardButton("🔙 بازگشت به منوی اصلی", callback_data='back_to_user_menu')])
-            else:
-                keyboard = [[InlineKeyboardButton("🔙 بازگشت به منوی اصلی", callback_data='back_to_user_menu')]]
+            choices = question.get('choices', []) if question.get('type') == 'choice' else ()
+            keyboard = _build_choice_keyboard(choices)
             
             reply_markup = InlineKeyboardMarkup(keyboard)
             await query.edit_message_text(message, reply_markup=reply_markup)
@@ -4109,8 +4260,8 @@ class FootballCoachBot:
         await query.answer()
         
         user_id = update.effective_user.id
-        user_data = await self.data_manager.get_user_data(user_id)
-        user_data['user_id'] = user_id  # Ensure user_id is set
+        # Ensure user_id is set - on a copy, the stored record is shared
+        user_data = {**await self.data_manager.get_user_data(user_id), 'user_id': user_id}
         user_name = user_data.get('name', update.effective_user.first_name or 'کاربر')
         
         # Use the same unified menu system as /start command
@@ -4160,8 +4311,8 @@ class FootballCoachBot:
                 f"BACK TO MENU CLEANUP - User {user_id} | Total states cleared: {len(states_cleared)} | Questionnaire preserved"
             )
             
-            user_data = await self.data_manager.get_user_data(user_id)
-            user_data['user_id'] = user_id  # Ensure user_id is set
+            # Ensure user_id is set - on a copy, the stored record is shared
+            user_data = {**await self.data_manager.get_user_data(user_id), 'user_id': user_id}
             user_name = user_data.get('name', update.effective_user.first_name or 'کاربر')
             
             # ALWAYS show simple unified menu - same as /start command
@@ -4175,7 +4326,6 @@ class FootballCoachBot:
             admin_error_handler.admin_logger.error(
                 f"ERROR in back_to_user_menu for user {user_id}: {e}"
             )
-            import traceback
             admin_error_handler.admin_logger.error(f"Traceback: {traceback.format_exc()}")
             
             # Try to send a helpful error message with more context
@@ -4253,49 +4403,10 @@ class FootballCoachBot:
         )
         
         # Extract category from callback data
-        if query.data == 'back_to_online':
-            # Show online courses directly
-            purchased_courses = await self.get_user_purchased_courses(user_id)
-            
-            weights_text = "1️⃣ برنامه وزنه"
-            cardio_text = "2️⃣ برنامه هوازی و کار با توپ"
-            combo_text = "3️⃣ برنامه وزنه + برنامه هوازی (با تخفیف بیشتر)"
-            
-            if 'online_weights' in purchased_courses:
-                weights_text += " ✅"
-            if 'online_cardio' in purchased_courses:
-                cardio_text += " ✅"
-            if 'online_combo' in purchased_courses:
-                combo_text += " ✅"
-            
-            keyboard = [
-                [InlineKeyboardButton(weights_text, callback_data='online_weights')],
-                [InlineKeyboardButton(cardio_text, callback_data='online_cardio')],
-                [InlineKeyboardButton(combo_text, callback_data='online_combo')],
-                [InlineKeyboardButton("🔙 بازگشت به انتخاب دوره", callback_data='back_to_course_selection')]
-            ]
-            reply_markup = InlineKeyboardMarkup(keyboard)
-            await query.edit_message_text("انتخاب کنید:", reply_markup=reply_markup)
-            
-        elif query.data == 'back_to_in_person':
-            # Show in-person courses directly
-            purchased_courses = await self.get_user_purchased_courses(user_id)
-            
-            cardio_text = "1️⃣ تمرین هوازی سرعتی چابکی کار با توپ"
-            weights_text = "2️⃣ تمرین وزنه"
-            
-            if 'in_person_cardio' in purchased_courses:
-                cardio_text += " ✅"
-            if 'in_person_weights' in purchased_courses:
-                weights_text += " ✅"
-            
-            keyboard = [
-                [InlineKeyboardButton(cardio_text, callback_data='in_person_cardio')],
-                [InlineKeyboardButton(weights_text, callback_data='in_person_weights')],
-                [InlineKeyboardButton("🔙 بازگشت به انتخاب دوره", callback_data='back_to_course_selection')]
-            ]
-            reply_markup = InlineKeyboardMarkup(keyboard)
-            await query.edit_message_text("انتخاب کنید:", reply_markup=reply_markup)
+        course_buttons = _COURSE_SUBMENU_BUTTONS.get(query.data)
+        if course_buttons:
+            # Show online / in-person courses directly
+            await self._show_course_submenu(query, user_id, course_buttons)
 
     async def handle_status_callbacks(self, update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
         """Handle status-related callback queries"""
@@ -4372,8 +4483,7 @@ class FootballCoachBot:
         user_id = update.effective_user.id
         
         # Set flag that user is buying additional course
-        if user_id not in context.user_data:
-            context.user_data[user_id] = {}
+        context.user_data.setdefault(user_id, {})
         context.user_data[user_id]['buying_additional_course'] = True
         
         # Show course selection for additional purchase
@@ -4388,7 +4498,8 @@ class FootballCoachBot:
         
         # Get user data and purchased courses
         user_data = await self.data_manager.get_user_data(user_id)
-        purchased_courses = await self.get_user_purchased_courses(user_id)
+        payment_summary = await self._load_user_payment_summary(user_id)
+        purchased_courses = payment_summary['purchased_courses']
         
         # Check if user has nutrition plan - they shouldn't access questionnaire
         if 'nutrition_plan' in purchased_courses:
@@ -4405,7 +4516,7 @@ class FootballCoachBot:
         
         # Check if user has training courses with approved payment
         training_courses = [course for course in purchased_courses if course != 'nutrition_plan']
-        user_status = await self.get_user_status(user_data)
+        user_status = await self.get_user_status(user_data, payment_summary)
         
         if not training_courses or user_status != 'payment_approved':
             await query.edit_message_text(
@@ -4425,8 +4536,7 @@ class FootballCoachBot:
         current_question = await self.questionnaire_manager.get_current_question(user_id)
         if current_question:
             # CRITICAL FIX: Set questionnaire_active flag when continuing questionnaire
-            if user_id not in context.user_data:
-                context.user_data[user_id] = {}
+            context.user_data.setdefault(user_id, {})
             context.user_data[user_id]['questionnaire_active'] = True
             
             question_text = f"""{current_question['progress_text']}
@@ -4434,14 +4544,8 @@ class FootballCoachBot:
 {current_question['text']}"""
             
             # Add choices as buttons if it's a choice question
-            keyboard = []
-            if current_question.get('type') in ['choice', 'multichoice']:
-                choices = current_question.get('choices', [])
-                for choice in choices:
-                    keyboard.append([InlineKeyboardButton(choice, callback_data=f'q_answer_{choice}')])
-            
-            # Add navigation buttons
-            keyboard.append([InlineKeyboardButton("🔙 بازگشت به منو", callback_data='back_to_user_menu')])
+            choices = current_question.get('choices', []) if current_question.get('type') in _CHOICE_QUESTION_TYPES else ()
+            keyboard = _build_choice_keyboard(choices, back_text="🔙 بازگشت به منو")
             
             reply_markup = InlineKeyboardMarkup(keyboard) if keyboard else None
             
@@ -4454,8 +4558,7 @@ class FootballCoachBot:
             progress = await self.questionnaire_manager.start_questionnaire(user_id)
             
             # CRITICAL FIX: Set questionnaire_active flag when starting new questionnaire from continue
-            if user_id not in context.user_data:
-                context.user_data[user_id] = {}
+            context.user_data.setdefault(user_id, {})
             context.user_data[user_id]['questionnaire_active'] = True
             
             first_question = await self.questionnaire_manager.get_current_question(user_id)
@@ -4468,14 +4571,8 @@ class FootballCoachBot:
 {first_question['text']}"""
                 
                 # Add choices as buttons if it's a choice question
-                keyboard = []
-                if first_question.get('type') in ['choice', 'multichoice']:
-                    choices = first_question.get('choices', [])
-                    for choice in choices:
-                        keyboard.append([InlineKeyboardButton(choice, callback_data=f'q_answer_{choice}')])
-                
-                # Add navigation buttons
-                keyboard.append([InlineKeyboardButton("🔙 بازگشت به منو", callback_data='back_to_user_menu')])
+                choices = first_question.get('choices', []) if first_question.get('type') in _CHOICE_QUESTION_TYPES else ()
+                keyboard = _build_choice_keyboard(choices, back_text="🔙 بازگشت به منو")
                 
                 reply_markup = InlineKeyboardMarkup(keyboard)
                 await query.edit_message_text(question_text, reply_markup=reply_markup)
@@ -4512,8 +4609,7 @@ class FootballCoachBot:
         remaining = max_photos - current_photos
         
         # Set questionnaire active flag so photos are properly routed
-        if user_id not in context.user_data:
-            context.user_data[user_id] = {}
+        context.user_data.setdefault(user_id, {})
         context.user_data[user_id]['questionnaire_active'] = True
         
         await query.edit_message_text(
@@ -4530,20 +4626,18 @@ class FootballCoachBot:
         user_name = user_data.get('name', 'کاربر')
         
         # Get current status
-        status = await self.get_user_status(user_data)
+        payment_summary = await self._load_user_payment_summary(user_id)
+        status = await self.get_user_status(user_data, payment_summary)
         
         # Get payment information from database
-        payments_data = await self.data_manager.load_data('payments')
-        user_payments = []
-        for payment_id, payment_data in payments_data.items():
-            if payment_data.get('user_id') == user_id:
-                user_payments.append(payment_data)
+        payments_data = await self.data_manager.get_user_payments(user_id)
+        user_payments = list(payments_data.values())
         
         # Sort payments by timestamp (newest first)
         user_payments.sort(key=lambda x: x.get('timestamp', ''), reverse=True)
         
         # Get purchased courses
-        purchased_courses = await self.get_user_purchased_courses(user_id)
+        purchased_courses = payment_summary['purchased_courses']
         
         # Build comprehensive status message
         status_text = f"""📊 *وضعیت کامل شما*
@@ -4631,14 +4725,10 @@ class FootballCoachBot:
         
         try:
             # Get payment data using the existing logic from get_user_status
-            payments_data = await self.data_manager.load_data('payments')
-            user_payment = None
+            payments_data = await self.data_manager.get_user_payments(user_id)
             
             # Find the most recent payment for this user
-            for payment_id, payment_data in payments_data.items():
-                if payment_data.get('user_id') == user_id:
-                    if user_payment is None or payment_data.get('timestamp', '') > user_payment.get('timestamp', ''):
-                        user_payment = payment_data
+            user_payment = max(payments_data.values(), key=lambda p: p.get('timestamp', ''), default=None)
             
             payment_status = None
             
@@ -5041,8 +5131,7 @@ class FootballCoachBot:
                 logger.debug(f"Main plans file not found: {main_plans_file}")
                 return None
             
-            with open(main_plans_file, 'r', encoding='utf-8') as f:
-                main_plans = json.load(f)
+            main_plans = await asyncio.to_thread(self._parse_json_file, main_plans_file)
             
             assignment_key = f"{user_id}_{course_code}"
             main_plan_id = main_plans.get(assignment_key)
@@ -5062,8 +5151,7 @@ class FootballCoachBot:
                 logger.debug(f"Course plans file not found: {plans_file}")
                 return None
             
-            with open(plans_file, 'r', encoding='utf-8') as f:
-                all_plans = json.load(f)
+            all_plans = await asyncio.to_thread(self._parse_json_file, plans_file)
             
             logger.debug(f"🔍 Searching for plan ID {main_plan_id} in {len(all_plans)} plans")
             
@@ -5177,24 +5265,10 @@ class FootballCoachBot:
 
     def get_course_name_farsi(self, course_code: str) -> str:
         """Convert course code to Persian course name"""
-        course_map = {
-            'in_person': 'دوره تمرین حضوری',
-            'online': 'دوره تمرین آنلاین',
-            'in_person_cardio': 'حضوری - تمرین هوازی سرعتی چابکی',
-            'in_person_weights': 'حضوری - تمرین وزنه',
-            'online_cardio': 'آنلاین - برنامه هوازی و کار با توپ',
-            'online_weights': 'آنلاین - برنامه وزنه',
-            'online_combo': 'آنلاین - برنامه ترکیبی (وزنه + هوازی)',
-            'nutrition_plan': 'برنامه غذایی',
-            'in_person_nutrition': 'حضوری - برنامه تغذیه',
-            'online_nutrition': 'آنلاین - برنامه تغذیه'
-        }
-        return course_map.get(course_code, course_code if course_code else 'انتخاب نشده')
+        return _COURSE_NAMES_FARSI.get(course_code, course_code if course_code else 'انتخاب نشده')
 
     async def error_handler(self, update: object, context: ContextTypes.DEFAULT_TYPE) -> None:
         """Handle errors"""
-        import traceback
-        
         # Log the full traceback
         logger.error(f"Exception while handling an update: {context.error}")
         logger.error(f"Full traceback: {traceback.format_exc()}")
@@ -5309,6 +5383,12 @@ def main():
     # Initialize commands on startup
     application.post_init = setup_commands
     
+    # Flush pending admin audit entries on stop
+    async def shutdown_bot(app):
+        await bot.shutdown()
+    
+    application.post_shutdown = shutdown_bot
+    
     # Start the bot
     logger.info("Starting Football Coach Bot...")
     logger.info("📱 Bot is ready to receive messages!")
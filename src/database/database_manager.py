@@ -13,6 +13,52 @@ from bot.config import Config
 
 logger = logging.getLogger(__name__)
 
+# Shared by the single-row and bulk (executemany) user/payment writes
+_UPSERT_USER_SQL = """
+    INSERT INTO users (
+        user_id, name, username, first_name, language_code, 
+        started_bot, registration_complete
+    ) VALUES ($1, $2, $3, $4, $5, $6, $7)
+    ON CONFLICT (user_id) 
+    DO UPDATE SET 
+        name = COALESCE(EXCLUDED.name, users.name),
+        username = COALESCE(EXCLUDED.username, users.username),
+        first_name = COALESCE(EXCLUDED.first_name, users.first_name),
+        language_code = COALESCE(EXCLUDED.language_code, users.language_code),
+        started_bot = COALESCE(EXCLUDED.started_bot, users.started_bot),
+        registration_complete = COALESCE(EXCLUDED.registration_complete, users.registration_complete),
+        updated_at = CURRENT_TIMESTAMP
+"""
+
+_INSERT_PAYMENT_SQL = """
+    INSERT INTO payments (
+        user_id, course_key, amount, status, payment_method, receipt_file_id
+    ) VALUES ($1, $2, $3, $4, $5, $6)
+"""
+
+def _user_row(user_id: int, user_data: Dict[str, Any]) -> tuple:
+    """Positional parameters for _UPSERT_USER_SQL"""
+    return (
+        user_id,
+        user_data.get('name'),
+        user_data.get('username'),
+        user_data.get('first_name'),
+        user_data.get('language_code'),
+        user_data.get('started_bot', False),
+        user_data.get('registration_complete', False)
+    )
+
+def _payment_row(user_id: int, payment_data: Dict[str, Any]) -> tuple:
+    """Positional parameters for _INSERT_PAYMENT_SQL"""
+    return (
+        user_id,
+        payment_data.get('course_type'),
+        payment_data.get('price', 0),
+        payment_data.get('status', 'pending'),
+        payment_data.get('payment_method', 'bank_transfer'),
+        payment_data.get('receipt_file_id')
+    )
+
 class DatabaseManager:
     def __init__(self):
         self.pool = None
@@ -161,6 +207,8 @@ class DatabaseManager:
             await conn.execute("CREATE INDEX IF NOT EXISTS idx_payments_user_id ON payments(user_id)")
             await conn.execute("CREATE INDEX IF NOT EXISTS idx_payments_status ON payments(status)")
             await conn.execute("CREATE INDEX IF NOT EXISTS idx_payments_created_at ON payments(created_at)")
+            # Covers the per-course purchase status lookup (get_payment_statuses) without touching the table
+            await conn.execute("CREATE INDEX IF NOT EXISTS idx_payments_user_course_status ON payments(user_id, course_key, status)")
             await conn.execute("CREATE INDEX IF NOT EXISTS idx_user_images_user_id ON user_images(user_id)")
             await conn.execute("CREATE INDEX IF NOT EXISTS idx_user_images_payment_id ON user_images(payment_id)")
             await conn.execute("CREATE INDEX IF NOT EXISTS idx_user_images_question_step ON user_images(question_step)")
@@ -232,29 +280,15 @@ class DatabaseManager:
     async def save_user_data(self, user_id: int, user_data: Dict[str, Any]):
         """Save or update user data"""
         async with self.pool.acquire() as conn:
-            await conn.execute("""
-                INSERT INTO users (
-                    user_id, name, username, first_name, language_code, 
-                    started_bot, registration_complete
-                ) VALUES ($1, $2, $3, $4, $5, $6, $7)
-                ON CONFLICT (user_id) 
-                DO UPDATE SET 
-                    name = COALESCE(EXCLUDED.name, users.name),
-                    username = COALESCE(EXCLUDED.username, users.username),
-                    first_name = COALESCE(EXCLUDED.first_name, users.first_name),
-                    language_code = COALESCE(EXCLUDED.language_code, users.language_code),
-                    started_bot = COALESCE(EXCLUDED.started_bot, users.started_bot),
-                    registration_complete = COALESCE(EXCLUDED.registration_complete, users.registration_complete),
-                    updated_at = CURRENT_TIMESTAMP
-            """, 
-            user_id,
-            user_data.get('name'),
-            user_data.get('username'),
-            user_data.get('first_name'),
-            user_data.get('language_code'),
-            user_data.get('started_bot', False),
-            user_data.get('registration_complete', False)
-            )
+            await conn.execute(_UPSERT_USER_SQL, *_user_row(user_id, user_data))
+    
+    async def save_users_bulk(self, users: List[tuple]):
+        """Save or update many (user_id, user_data) pairs in one transaction"""
+        async with self.pool.acquire() as conn:
+            async with conn.transaction():
+                await conn.executemany(
+                    _UPSERT_USER_SQL, [_user_row(user_id, user_data) for user_id, user_data in users]
+                )
     
     async def get_user_data(self, user_id: int) -> Dict[str, Any]:
         """Get user data"""
@@ -271,20 +305,28 @@ class DatabaseManager:
     async def save_payment_data(self, user_id: int, payment_data: Dict[str, Any]):
         """Save payment data"""
         async with self.pool.acquire() as conn:
-            return await conn.fetchval("""
-                INSERT INTO payments (
-                    user_id, course_key, amount, status, payment_method, receipt_file_id
-                ) VALUES ($1, $2, $3, $4, $5, $6)
-                RETURNING id
-            """,
-            user_id,
-            payment_data.get('course_type'),
-            payment_data.get('price', 0),
-            payment_data.get('status', 'pending'),
-            payment_data.get('payment_method', 'bank_transfer'),
-            payment_data.get('receipt_file_id')
+            return await conn.fetchval(
+                _INSERT_PAYMENT_SQL + " RETURNING id", *_payment_row(user_id, payment_data)
             )
     
+    async def save_payment_atomic(self, user_id: int, payment_data: Dict[str, Any], user_updates: Dict[str, Any]):
+        """Insert a payment and upsert the user's updates in one transaction"""
+        async with self.pool.acquire() as conn:
+            async with conn.transaction():
+                payment_id = await conn.fetchval(
+                    _INSERT_PAYMENT_SQL + " RETURNING id", *_payment_row(user_id, payment_data)
+                )
+                await conn.execute(_UPSERT_USER_SQL, *_user_row(user_id, user_updates))
+                return payment_id
+    
+    async def save_payments_bulk(self, payments: List[tuple]):
+        """Insert many (user_id, payment_data) pairs in one transaction"""
+        async with self.pool.acquire() as conn:
+            async with conn.transaction():
+                await conn.executemany(
+                    _INSERT_PAYMENT_SQL, [_payment_row(user_id, payment_data) for user_id, payment_data in payments]
+                )
+    
     async def update_payment_status(self, payment_id: int, status: str, approved_by: Optional[int] = None):
         """Update payment status"""
         async with self.pool.acquire() as conn:
@@ -301,6 +343,26 @@ class DatabaseManager:
                     WHERE id = $2
                 """, status, payment_id)
     
+    async def get_user_payments(self, user_id: int) -> Dict[str, Dict[str, Any]]:
+        """Get all payments of a user (served by idx_payments_user_id)"""
+        async with self.pool.acquire() as conn:
+            rows = await conn.fetch("""
+                SELECT p.*, p.course_key AS course_type, p.created_at::text AS timestamp
+                FROM payments p
+                WHERE p.user_id = $1
+                ORDER BY p.created_at DESC
+            """, user_id)
+            return {str(row['id']): dict(row) for row in rows}
+    
+    async def get_payment_statuses(self, user_id: int, course_type: str) -> frozenset:
+        """Statuses of the user's payments for a course"""
+        async with self.pool.acquire() as conn:
+            rows = await conn.fetch("""
+                SELECT DISTINCT status FROM payments
+                WHERE user_id = $1 AND course_key = $2
+            """, user_id, course_type)
+            return frozenset(row['status'] for row in rows)
+    
     async def get_pending_payments(self) -> List[Dict[str, Any]]:
         """Get all pending payments"""
         async with self.pool.acquire() as conn:
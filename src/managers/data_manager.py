@@ -1,12 +1,28 @@
-import json
+import asyncio
 import os
+import uuid
 from datetime import datetime
 from typing import Dict, Any
 import aiofiles
+import orjson
+
+# Data files keep the same layout as json.dumps(..., ensure_ascii=False, indent=2)
+_ORJSON_WRITE_OPTIONS = orjson.OPT_INDENT_2 | orjson.OPT_NON_STR_KEYS
 
 class DataManager:
     def __init__(self, data_file='bot_data.json'):
         self.data_file = data_file
+        # Read-only parse of the data file shared by lookups (see read_bot_data_snapshot)
+        self._snapshot_stamp = None  # (st_mtime_ns, st_size) the snapshot was read at
+        self._snapshot = {}
+        self._snapshot_lock = asyncio.Lock()
+        # Bumped by every write through _write_bot_data; a snapshot read that overlapped a write isn't kept
+        self._write_generation = 0
+        # user_id -> [payment_ids] index over the snapshot's payments, rebuilt when the snapshot changes
+        self._payments_index_source = None
+        self._payments_cache = {}
+        self._payments_by_user = {}
+        self._payment_statuses = {}  # (user_id, course_type) -> set of payment statuses, same lifetime as the index
         self.ensure_directories()
         self.ensure_data_file()
     
@@ -31,8 +47,8 @@ class DataManager:
         """Ensure all data files exist with proper structure"""
         # Main bot data file
         if not os.path.exists(self.data_file):
-            with open(self.data_file, 'w', encoding='utf-8') as f:
-                json.dump({
+            with open(self.data_file, 'wb') as f:
+                f.write(orjson.dumps({
                     'users': {},
                     'payments': {},
                     'statistics': {
@@ -40,60 +56,141 @@ class DataManager:
                         'total_payments': 0,
                         'course_stats': {}
                     }
-                }, f, ensure_ascii=False, indent=2)
+                }, option=_ORJSON_WRITE_OPTIONS))
         
         # Questionnaire data file  
         if not os.path.exists('questionnaire_data.json'):
-            with open('questionnaire_data.json', 'w', encoding='utf-8') as f:
-                json.dump({}, f, ensure_ascii=False, indent=2)
+            with open('questionnaire_data.json', 'wb') as f:
+                f.write(orjson.dumps({}, option=_ORJSON_WRITE_OPTIONS))
                 
         # Admins file
         if not os.path.exists('admins.json'):
-            with open('admins.json', 'w', encoding='utf-8') as f:
-                json.dump({
+            with open('admins.json', 'wb') as f:
+                f.write(orjson.dumps({
                     'admins': [],
                     'last_sync': datetime.now().isoformat()
-                }, f, ensure_ascii=False, indent=2)
+                }, option=_ORJSON_WRITE_OPTIONS))
         
         # Coupons file
         if not os.path.exists('coupons.json'):
-            with open('coupons.json', 'w', encoding='utf-8') as f:
-                json.dump({}, f, ensure_ascii=False, indent=2)
+            with open('coupons.json', 'wb') as f:
+                f.write(orjson.dumps({}, option=_ORJSON_WRITE_OPTIONS))
+    
+    async def _read_bot_data(self) -> Dict[str, Any]:
+        """Read and parse the main data file (raw bytes straight into orjson)"""
+        async with aiofiles.open(self.data_file, 'rb') as f:
+            content = await f.read()
+        return orjson.loads(content) if content else {}
+    
+    @staticmethod
+    def _load_snapshot(data_file: str, stamp):
+        """
+        Stat the data file and parse it if its stamp differs from the given one; returns
+        (stamp, data) with data None when unchanged (blocking - run via asyncio.to_thread)
+        """
+        stat = os.stat(data_file)
+        new_stamp = (stat.st_mtime_ns, stat.st_size)
+        if new_stamp == stamp:
+            return new_stamp, None
+        with open(data_file, 'rb') as f:
+            content = f.read()
+        return new_stamp, orjson.loads(content) if content else {}
+    
+    async def read_bot_data_snapshot(self) -> Dict[str, Any]:
+        """
+        Parsed data file for read-only lookups, shared by all callers and re-read (off the event
+        loop) only after a write through this manager or a change of the file's mtime/size.
+        Callers must not modify it - writes go through the save_* methods.
+        """
+        async with self._snapshot_lock:
+            generation = self._write_generation
+            stamp, data = await asyncio.to_thread(self._load_snapshot, self.data_file, self._snapshot_stamp)
+            if data is not None:
+                self._snapshot = data
+            # A write that landed during the read may share the old stamp - re-read next time
+            self._snapshot_stamp = stamp if generation == self._write_generation else None
+            return self._snapshot
+    
+    async def _write_bot_data(self, bot_data: Dict[str, Any]):
+        """Serialize the main data file to a temp file and atomically swap it in"""
+        # Unique temp name so overlapping writers never share (and interleave into) one temp file
+        temp_file = f"{self.data_file}.{uuid.uuid4().hex}.tmp"
+        try:
+            async with aiofiles.open(temp_file, 'wb') as f:
+                await f.write(orjson.dumps(bot_data, option=_ORJSON_WRITE_OPTIONS))
+            os.replace(temp_file, self.data_file)
+            # The stamp alone can miss a same-size rewrite within the filesystem's mtime granularity
+            self._write_generation += 1
+            self._snapshot_stamp = None
+        except Exception:
+            if os.path.exists(temp_file):
+                os.remove(temp_file)
+            raise
+    
+    @staticmethod
+    def _merge_user(users_table: Dict[str, Any], user_id: int, data: Dict[str, Any], now_iso: str):
+        """Merge data into the stored user record, stamping last_updated and user_id"""
+        users_table[str(user_id)] = {
+            **users_table.get(str(user_id), {}),
+            **data,
+            'last_updated': now_iso,
+            'user_id': user_id
+        }
+    
+    @staticmethod
+    def _payment_record(user_id: int, payment_id: str, payment_data: Dict[str, Any], now_iso: str) -> Dict[str, Any]:
+        """Build a stored payment record; a batch passes one now_iso so its rows share a timestamp"""
+        return {
+            **payment_data,
+            'timestamp': now_iso,
+            'user_id': user_id,
+            'payment_id': payment_id
+        }
     
     async def save_user_data(self, user_id: int, data: Dict[str, Any]):
         """Save user data to file"""
         try:
-            async with aiofiles.open(self.data_file, 'r', encoding='utf-8') as f:
-                content = await f.read()
-                bot_data = json.loads(content) if content else {}
+            bot_data = await self._read_bot_data()
             
             if 'users' not in bot_data:
                 bot_data['users'] = {}
             
-            # Get existing user data and merge with new data
-            existing_data = bot_data['users'].get(str(user_id), {})
-            
-            bot_data['users'][str(user_id)] = {
-                **existing_data,  # Keep existing data
-                **data,          # Add/update with new data
-                'last_updated': datetime.now().isoformat(),
-                'user_id': user_id
-            }
+            self._merge_user(bot_data['users'], user_id, data, datetime.now().isoformat())
             
-            async with aiofiles.open(self.data_file, 'w', encoding='utf-8') as f:
-                await f.write(json.dumps(bot_data, ensure_ascii=False, indent=2))
+            await self._write_bot_data(bot_data)
             
             return True
         except Exception as e:
             print(f"Error saving user data: {e}")
             return False
     
+    async def save_users_bulk(self, users: list):
+        """Save many (user_id, data) pairs with a single read and write of the data file"""
+        try:
+            bot_data = await self._read_bot_data()
+            
+            if 'users' not in bot_data:
+                bot_data['users'] = {}
+            
+            users_table = bot_data['users']
+            now_iso = datetime.now().isoformat()
+            for user_id, data in users:
+                self._merge_user(users_table, user_id, data, now_iso)
+            
+            await self._write_bot_data(bot_data)
+            
+            return True
+        except Exception as e:
+            print(f"Error saving user data in bulk: {e}")
+            return False
+    
     async def get_user_data(self, user_id: int) -> Dict[str, Any]:
-        """Get user data from file"""
+        """
+        Get user data from file (re-parsed only when the file changed). The record is shared
+        with the cache - copy anything you modify and persist changes via save_user_data.
+        """
         try:
-            async with aiofiles.open(self.data_file, 'r', encoding='utf-8') as f:
-                content = await f.read()
-                bot_data = json.loads(content) if content else {}
+            bot_data = await self.read_bot_data_snapshot()
             
             return bot_data.get('users', {}).get(str(user_id), {})
         except Exception as e:
@@ -103,35 +200,116 @@ class DataManager:
     async def save_payment_data(self, user_id: int, payment_data: Dict[str, Any]):
         """Save payment data"""
         try:
-            async with aiofiles.open(self.data_file, 'r', encoding='utf-8') as f:
-                content = await f.read()
-                bot_data = json.loads(content) if content else {}
+            bot_data = await self._read_bot_data()
             
             if 'payments' not in bot_data:
                 bot_data['payments'] = {}
             
             payment_id = f"{user_id}_{datetime.now().strftime('%Y%m%d_%H%M%S')}"
-            bot_data['payments'][payment_id] = {
-                **payment_data,
-                'timestamp': datetime.now().isoformat(),
-                'user_id': user_id,
-                'payment_id': payment_id
-            }
+            bot_data['payments'][payment_id] = self._payment_record(
+                user_id, payment_id, payment_data, datetime.now().isoformat()
+            )
             
-            async with aiofiles.open(self.data_file, 'w', encoding='utf-8') as f:
-                await f.write(json.dumps(bot_data, ensure_ascii=False, indent=2))
+            await self._write_bot_data(bot_data)
             
             return payment_id
         except Exception as e:
             print(f"Error saving payment data: {e}")
             return None
     
+    async def save_payment_atomic(self, user_id: int, payment_data: Dict[str, Any], user_updates: Dict[str, Any]):
+        """Save a payment and merge user updates with a single read and write of the data file"""
+        try:
+            bot_data = await self._read_bot_data()
+            
+            payments_table = bot_data.setdefault('payments', {})
+            users_table = bot_data.setdefault('users', {})
+            now = datetime.now()
+            now_iso = now.isoformat()
+            
+            payment_id = f"{user_id}_{now.strftime('%Y%m%d_%H%M%S')}"
+            payments_table[payment_id] = self._payment_record(user_id, payment_id, payment_data, now_iso)
+            self._merge_user(users_table, user_id, user_updates, now_iso)
+            
+            await self._write_bot_data(bot_data)
+            
+            return payment_id
+        except Exception as e:
+            print(f"Error saving payment and user data: {e}")
+            return None
+    
+    async def save_payments_bulk(self, payments: list):
+        """Save many (user_id, payment_data) pairs with a single read and write of the data file"""
+        try:
+            bot_data = await self._read_bot_data()
+            
+            if 'payments' not in bot_data:
+                bot_data['payments'] = {}
+            
+            payments_table = bot_data['payments']
+            now = datetime.now()
+            now_iso = now.isoformat()
+            id_suffix = now.strftime('%Y%m%d_%H%M%S')
+            for user_id, payment_data in payments:
+                payment_id = f"{user_id}_{id_suffix}"
+                # Several rows for one user share the same second - keep their ids distinct
+                if payment_id in payments_table:
+                    n = 2
+                    while f"{payment_id}_{n}" in payments_table:
+                        n += 1
+                    payment_id = f"{payment_id}_{n}"
+                payments_table[payment_id] = self._payment_record(user_id, payment_id, payment_data, now_iso)
+            
+            await self._write_bot_data(bot_data)
+            
+            return True
+        except Exception as e:
+            print(f"Error saving payment data in bulk: {e}")
+            return False
+    
+    async def _refresh_payments_index(self):
+        """Rebuild the user_id and (user_id, course_type) payment indexes if the data file changed"""
+        bot_data = await self.read_bot_data_snapshot()
+        if bot_data is not self._payments_index_source:
+            payments = bot_data.get('payments', {})
+            payments_by_user = {}
+            payment_statuses = {}
+            for payment_id, payment_data in payments.items():
+                payments_by_user.setdefault(payment_data.get('user_id'), []).append(payment_id)
+                payment_statuses.setdefault(
+                    (payment_data.get('user_id'), payment_data.get('course_type')), set()
+                ).add(payment_data.get('status'))
+            self._payments_cache = payments
+            self._payments_by_user = payments_by_user
+            self._payment_statuses = payment_statuses
+            self._payments_index_source = bot_data
+    
+    async def get_payment_statuses(self, user_id: int, course_type: str) -> frozenset:
+        """Statuses of the user's payments for a course (indexed lookup)"""
+        try:
+            await self._refresh_payments_index()
+            return frozenset(self._payment_statuses.get((user_id, course_type), ()))
+        except Exception as e:
+            print(f"Error loading payment statuses: {e}")
+            return frozenset()
+    
+    async def get_user_payments(self, user_id: int) -> Dict[str, Dict[str, Any]]:
+        """Get all payments of a user via the user_id index instead of scanning every payment"""
+        try:
+            await self._refresh_payments_index()
+            
+            return {
+                payment_id: dict(self._payments_cache[payment_id])
+                for payment_id in self._payments_by_user.get(user_id, [])
+            }
+        except Exception as e:
+            print(f"Error loading user payments: {e}")
+            return {}
+    
     async def update_statistics(self, stat_type: str, value: Any = 1):
         """Update bot statistics"""
         try:
-            async with aiofiles.open(self.data_file, 'r', encoding='utf-8') as f:
-                content = await f.read()
-                bot_data = json.loads(content) if content else {}
+            bot_data = await self._read_bot_data()
             
             if 'statistics' not in bot_data:
                 bot_data['statistics'] = {}
@@ -144,8 +322,7 @@ class DataManager:
             else:
                 bot_data['statistics'][stat_type] = value
             
-            async with aiofiles.open(self.data_file, 'w', encoding='utf-8') as f:
-                await f.write(json.dumps(bot_data, ensure_ascii=False, indent=2))
+            await self._write_bot_data(bot_data)
             
             return True
         except Exception as e:
@@ -161,22 +338,21 @@ class DataManager:
             admin_ids = Config.get_admin_ids()
             
             # Read current data
-            async with aiofiles.open(self.data_file, 'r', encoding='utf-8') as f:
-                content = await f.read()
-                bot_data = json.loads(content) if content else {}
+            bot_data = await self._read_bot_data()
             
             if 'admins' not in bot_data:
                 bot_data['admins'] = {}
             
             # Add each admin from config
             synced_count = 0
+            now_iso = datetime.now().isoformat()
             for admin_id in admin_ids:
                 admin_id_str = str(admin_id)
                 if admin_id_str not in bot_data['admins']:
                     bot_data['admins'][admin_id_str] = {
                         'user_id': admin_id,
                         'permissions': 'full',
-                        'added_at': datetime.now().isoformat(),
+                        'added_at': now_iso,
                         'synced_from_config': True
                     }
                     synced_count += 1
@@ -184,27 +360,25 @@ class DataManager:
                 else:
                     print(f"Admin with ID {admin_id} already exists.")
             
-            # CLEANUP: Remove admins that are no longer in config but were added by config sync
-            removed_count = 0
+            # CLEANUP: Remove admins that are no longer in config but were added by config sync.
+            # Build the kept admins in one pass instead of snapshotting and deleting
             current_admin_ids = set(str(admin_id) for admin_id in admin_ids)
-            admins_to_remove = []
+            kept_admins = {}
+            removed_count = 0
             
-            for admin_id_str, admin_data in list(bot_data['admins'].items()):
+            for admin_id_str, admin_data in bot_data['admins'].items():
                 # Only remove admins that were originally synced from config
                 if (admin_id_str not in current_admin_ids and 
                     admin_data.get('synced_from_config', False)):
-                    
-                    admins_to_remove.append(admin_id_str)
                     removed_count += 1
                     print(f"Admin with ID {admin_id_str} removed (no longer in config).")
+                else:
+                    kept_admins[admin_id_str] = admin_data
             
-            # Remove the identified admins
-            for admin_id_str in admins_to_remove:
-                del bot_data['admins'][admin_id_str]
+            bot_data['admins'] = kept_admins
             
             # Save updated data
-            async with aiofiles.open(self.data_file, 'w', encoding='utf-8') as f:
-                await f.write(json.dumps(bot_data, ensure_ascii=False, indent=2))
+            await self._write_bot_data(bot_data)
             
             total_changes = synced_count + removed_count
             if total_changes > 0:
@@ -220,9 +394,7 @@ class DataManager:
     async def is_admin(self, user_id: int) -> bool:
         """Check if user is admin"""
         try:
-            async with aiofiles.open(self.data_file, 'r', encoding='utf-8') as f:
-                content = await f.read()
-                bot_data = json.loads(content) if content else {}
+            bot_data = await self._read_bot_data()
             
             admins = bot_data.get('admins', {})
             return str(user_id) in admins
@@ -234,9 +406,7 @@ class DataManager:
     async def load_data(self, data_type: str = None) -> Dict[str, Any]:
         """Load data from file"""
         try:
-            async with aiofiles.open(self.data_file, 'r', encoding='utf-8') as f:
-                content = await f.read()
-                bot_data = json.loads(content) if content else {}
+            bot_data = await self._read_bot_data()
             
             if data_type:
                 return bot_data.get(data_type, {})
@@ -249,14 +419,11 @@ class DataManager:
     async def save_data(self, data_type: str, data: Dict[str, Any]):
         """Save specific data type to file"""
         try:
-            async with aiofiles.open(self.data_file, 'r', encoding='utf-8') as f:
-                content = await f.read()
-                bot_data = json.loads(content) if content else {}
+            bot_data = await self._read_bot_data()
             
             bot_data[data_type] = data
             
-            async with aiofiles.open(self.data_file, 'w', encoding='utf-8') as f:
-                await f.write(json.dumps(bot_data, ensure_ascii=False, indent=2))
+            await self._write_bot_data(bot_data)
             
             return True
             
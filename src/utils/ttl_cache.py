@@ -0,0 +1,63 @@
+"""
+Bounded in-memory state containers
+Keeps long-running per-user dictionaries from growing without limit
+"""
+
+import time
+from collections import OrderedDict
+from collections.abc import MutableMapping
+from typing import Any, Hashable, Iterator
+
+
+class TTLDict(MutableMapping):
+    """Dict whose entries expire after `ttl` seconds and which never holds more than `maxsize` keys.
+
+    Entries are kept in insertion order (re-setting a key moves it to the end),
+    so the oldest entries are always at the front and expiry/eviction is a
+    cheap pop from the left.
+    """
+
+    def __init__(self, maxsize: int = 50000, ttl: float = 3600):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data: "OrderedDict[Hashable, tuple]" = OrderedDict()
+
+    def __setitem__(self, key: Hashable, value: Any) -> None:
+        now = time.monotonic()
+        self._data[key] = (now, value)
+        self._data.move_to_end(key)
+        self.prune(now)
+        while len(self._data) > self.maxsize:
+            self._data.popitem(last=False)
+
+    def __getitem__(self, key: Hashable) -> Any:
+        stored_at, value = self._data[key]
+        if time.monotonic() - stored_at > self.ttl:
+            del self._data[key]
+            raise KeyError(key)
+        return value
+
+    def __delitem__(self, key: Hashable) -> None:
+        del self._data[key]
+
+    def __iter__(self) -> Iterator[Hashable]:
+        self.prune()
+        return iter(list(self._data))
+
+    def __len__(self) -> int:
+        self.prune()
+        return len(self._data)
+
+    def prune(self, now: float = None) -> int:
+        """Drop expired entries from the front of the dict. Returns number removed."""
+        if now is None:
+            now = time.monotonic()
+        cutoff = now - self.ttl
+        removed = 0
+        while self._data:
+            stored_at, _ = next(iter(self._data.values()))
+            if stored_at >= cutoff:
+                break
+            self._data.popitem(last=False)
+            removed += 1
+        return removed